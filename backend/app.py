@@ -1,13 +1,49 @@
 from flask import Flask, send_from_directory, request, jsonify
 from flask_cors import CORS
+import logging
 import os
+import sqlite3
+import weakref
 
 # Import the admin auth decorator
 from backend.utils.admin_auth import admin_required
+from backend.utils.static_cache import StaticPageCache
+from backend.utils.pubsub import init_pubsub, STREAM_TOKEN_SCOPE
+from backend.utils.rate_limit import init_rate_limiter
+from backend.utils.code_filter import init_code_index
+from backend.utils.proof_images import ProofImagePipeline
+from backend.utils.instrumentation import init_instrumentation
+from backend.utils.profiling import init_profiling
+from backend.utils.json_provider import init_json_provider
+from backend.cli import init_cli, init_db
 
 # Import extensions
 from backend.extensions import db, bcrypt, jwt
 
+# RETURNING arrived in SQLite 3.35
+MIN_SQLITE_VERSION = (3, 35, 0)
+
+# Apps whose pooled connections a forked child must not reuse
+_apps = weakref.WeakSet()
+
+
+def dispose_engines(app):
+    """Forget pooled connections inherited from the parent process, leaving them open for the parent"""
+    with app.app_context():
+        for engine in db.engines.values():
+            engine.dispose(close=False)
+
+
+def _dispose_engines_after_fork():
+    for app in list(_apps):
+        dispose_engines(app)
+
+
+# Covers gunicorn --preload and any other fork of a process that already used the database
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_engines_after_fork)
+
+
 def create_app():
     # Get the absolute path to the project root directory
     project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -33,6 +69,13 @@ def create_app():
         # Render provides a PORT environment variable
         pass  # Database URL should come from environment
     
+    # Guarded status changes (bulk withdrawal reviews, reward code claims) use UPDATE ... RETURNING
+    if database_url.startswith('sqlite') and sqlite3.sqlite_version_info < MIN_SQLITE_VERSION:
+        raise RuntimeError(
+            f'SQLite {sqlite3.sqlite_version} is too old: UPDATE ... RETURNING needs '
+            f'{".".join(map(str, MIN_SQLITE_VERSION))} or newer'
+        )
+    
     app = Flask(__name__, static_folder=static_folder)
     
     # Configuration
@@ -42,6 +85,56 @@ def create_app():
     app.config['JWT_SECRET_KEY'] = os.environ.get('JWT_SECRET_KEY') or 'jwt-secret-string-change-in-production'
     from datetime import timedelta
     app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(hours=24)
+    # Reload cached HTML pages when they change on disk (development only)
+    app.config['STATIC_CACHE_WATCH'] = os.environ.get('STATIC_CACHE_WATCH') == '1' or os.environ.get('FLASK_ENV') == 'development'
+    # Real-time events: 'memory' for a single process, 'sqlite' to share them between workers
+    app.config['PUBSUB_BACKEND'] = os.environ.get('PUBSUB_BACKEND', 'memory')
+    app.config['PUBSUB_SQLITE_PATH'] = os.environ.get('PUBSUB_SQLITE_PATH')
+    app.config['SSE_HEARTBEAT_SECONDS'] = int(os.environ.get('SSE_HEARTBEAT_SECONDS', 15))
+    app.config['SSE_MAX_STREAM_SECONDS'] = int(os.environ.get('SSE_MAX_STREAM_SECONDS', 300))
+    app.config['SSE_TOKEN_SECONDS'] = int(os.environ.get('SSE_TOKEN_SECONDS', 60))  # Lifetime of ?jwt= stream tokens
+    # Task proof image uploads: size cap and background processing
+    app.config['PROOF_IMAGE_MAX_BYTES'] = int(os.environ.get('PROOF_IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    app.config['PROOF_IMAGE_ASYNC'] = os.environ.get('PROOF_IMAGE_ASYNC', '1') == '1'
+    # Idempotency-Key replay window, and how long an unfinished request holds its key
+    app.config['IDEMPOTENCY_KEY_TTL_HOURS'] = int(os.environ.get('IDEMPOTENCY_KEY_TTL_HOURS', 24))
+    app.config['IDEMPOTENCY_LOCK_SECONDS'] = int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60))
+    # Largest multipart body read to fingerprint a keyed request (defaults to the proof upload cap)
+    app.config['IDEMPOTENCY_MAX_MULTIPART_BYTES'] = int(os.environ.get(
+        'IDEMPOTENCY_MAX_MULTIPART_BYTES', app.config['PROOF_IMAGE_MAX_BYTES'] + 1024 * 1024))
+    # Per-route request limits: 'memory' for a single process, 'sqlite' to share buckets between workers
+    app.config['RATE_LIMIT_ENABLED'] = os.environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    app.config['RATE_LIMIT_BACKEND'] = os.environ.get('RATE_LIMIT_BACKEND', 'memory')
+    app.config['RATE_LIMIT_SQLITE_PATH'] = os.environ.get('RATE_LIMIT_SQLITE_PATH')
+    app.config['RATE_LIMIT_TRUST_PROXY'] = os.environ.get('RATE_LIMIT_TRUST_PROXY', '1' if os.environ.get('RENDER') == 'true' else '0') == '1'
+    # In-memory reward code existence filter (rejects unknown codes without a query)
+    app.config['REWARD_CODE_FILTER_ENABLED'] = os.environ.get('REWARD_CODE_FILTER_ENABLED', '1') == '1'
+    app.config['REWARD_CODE_FILTER_ERROR_RATE'] = float(os.environ.get('REWARD_CODE_FILTER_ERROR_RATE', 0.01))
+    app.config['REWARD_CODE_FILTER_REFRESH_SECONDS'] = float(os.environ.get('REWARD_CODE_FILTER_REFRESH_SECONDS', 1.0))
+    # Partner commission tiers: JSON list of {name, min_referrals, referral_bonus, monthly_payout}
+    app.config['PARTNER_TIERS'] = os.environ.get('PARTNER_TIERS')
+    if app.config['PARTNER_TIERS']:
+        from backend.utils.partner_metrics import parse_tiers
+        parse_tiers(app.config['PARTNER_TIERS'])  # Fail at startup on a malformed table
+    # Logging, request/SQL metrics (/metrics), Server-Timing header and the slow-query log
+    app.config['LOG_LEVEL'] = os.environ.get('LOG_LEVEL', 'INFO').upper()
+    app.config['METRICS_ENABLED'] = os.environ.get('METRICS_ENABLED', '1') == '1'
+    app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')  # /metrics is only served when set
+    app.config['METRICS_MULTIPROC_DIR'] = os.environ.get('METRICS_MULTIPROC_DIR')  # Sum /metrics over workers
+    app.config['SERVER_TIMING_ENABLED'] = os.environ.get('SERVER_TIMING_ENABLED', '0') == '1'
+    app.config['SLOW_QUERY_MS'] = float(os.environ.get('SLOW_QUERY_MS', 200))
+    # Admin-only profiling: ?__profile=1 on any request and the worker stack sampler
+    app.config['PROFILING_ENABLED'] = os.environ.get('PROFILING_ENABLED', '0') == '1'
+    app.config['PROFILE_MAX_SECONDS'] = float(os.environ.get('PROFILE_MAX_SECONDS', 30))
+    # JSON encoding for jsonify and request bodies: 'orjson' (when installed) or Flask's 'default'
+    app.config['JSON_PROVIDER'] = os.environ.get('JSON_PROVIDER', 'orjson')
+    # Create tables and the admin account at startup; otherwise run 'flask --app app init-db --seed' once
+    # (on by default only for Vercel's throwaway /tmp database)
+    vercel_tmp_db = os.environ.get('VERCEL') == '1' and not os.environ.get('DATABASE_URL')
+    app.config['INIT_DB_ON_STARTUP'] = os.environ.get('INIT_DB_ON_STARTUP', '1' if vercel_tmp_db else '0') == '1'
+    
+    # No-op when the host (e.g. gunicorn's --log-config) already configured logging
+    logging.basicConfig(level=app.config['LOG_LEVEL'], format='%(asctime)s %(levelname)s [%(name)s] %(message)s')
     
     # Handle Render deployment
     if os.environ.get('RENDER') == 'true':
@@ -49,12 +142,18 @@ def create_app():
         app.config['PREFERRED_URL_SCHEME'] = 'https'
         # Don't set SERVER_NAME as it can cause issues with dynamic hosts
     
+    init_json_provider(app)
+    
     # Initialize extensions with app
     db.init_app(app)
     bcrypt.init_app(app)
     jwt.init_app(app)
     CORS(app)
     
+    # Per-request timing and SQL counts; registered first so the other hooks are timed too
+    init_instrumentation(app, db)
+    init_profiling(app)
+    
     # JWT error handlers
     @jwt.expired_token_loader
     def expired_token_callback(jwt_header, jwt_payload):
@@ -72,11 +171,49 @@ def create_app():
     def revoked_token_callback(jwt_header, jwt_payload):
         return jsonify({'message': 'Token has been revoked', 'error': 'token_revoked'}), 401
     
+    # Stream tokens end up in URLs and access logs, so they open the event stream and nothing else
+    @jwt.token_verification_loader
+    def token_scope_callback(jwt_header, jwt_payload):
+        return jwt_payload.get('scope') != STREAM_TOKEN_SCOPE or request.endpoint == 'stream.stream_events'
+    
+    @jwt.token_verification_failed_loader
+    def token_scope_failed_callback(jwt_header, jwt_payload):
+        return jsonify({'message': 'Invalid token', 'error': 'invalid_token'}), 401
+    
+    # Keep the frontend and admin HTML documents in memory
+    page_cache = StaticPageCache(project_root, watch=app.config['STATIC_CACHE_WATCH'])
+    app.extensions['page_cache'] = page_cache
+    
+    # Pub/sub feeding the /api/stream event stream
+    init_pubsub(app, instance_path)
+    
+    # Token buckets behind the @rate_limit route decorator
+    init_rate_limiter(app, instance_path)
+    
+    # Reward code existence filter, built in the background on first lookup
+    init_code_index(app)
+    
+    # Proof images are resized and stripped of metadata off the request thread
+    app.extensions['proof_images'] = ProofImagePipeline(
+        app,
+        os.path.join(project_root, 'uploads', 'task_proofs'),
+        app.config['PROOF_IMAGE_MAX_BYTES'],
+        run_async=app.config['PROOF_IMAGE_ASYNC']
+    )
+    
+    def serve_page(relpath):
+        # Serve a cached HTML document, falling back to the disk if it isn't cached
+        response = page_cache.serve(relpath)
+        if response is None:
+            directory, filename = relpath.split('/', 1)
+            return send_from_directory(os.path.join(project_root, directory), filename)
+        return response
+    
     # Serve static files
     @app.route('/')
     def index():
         # Serve the main index.html from the frontend directory
-        return send_from_directory(frontend_folder, 'index.html')
+        return serve_page('frontend/index.html')
     
     # Health check endpoint for Render
     @app.route('/healthz')
@@ -91,74 +228,79 @@ def create_app():
     @app.route('/admin/')
     def admin_index():
         # Serve the admin login page by default
-        return send_from_directory(project_root, 'admin/login.html')
+        return serve_page('admin/login.html')
     
     @app.route('/admin/dashboard')
     def admin_dashboard():
         # Serve the actual admin dashboard
-        return send_from_directory(project_root, 'admin/index.html')
+        return serve_page('admin/index.html')
     
     @app.route('/admin/tasks')
     def admin_tasks():
         # Serve the admin tasks page
-        return send_from_directory(project_root, 'admin/tasks.html')
+        return serve_page('admin/tasks.html')
     
     @app.route('/admin/referrals')
     def admin_referrals():
         # Serve the admin referrals page
-        return send_from_directory(project_root, 'admin/referrals.html')
+        return serve_page('admin/referrals.html')
     
     @app.route('/admin/withdrawals')
     def admin_withdrawals():
         # Serve the admin withdrawals page
-        return send_from_directory(project_root, 'admin/withdrawals.html')
+        return serve_page('admin/withdrawals.html')
     
     @app.route('/admin/activities')
     def admin_activities():
         # Serve the admin activities page
-        return send_from_directory(project_root, 'admin/activities.html')
+        return serve_page('admin/activities.html')
     
     @app.route('/admin/codes')
     def admin_codes():
         # Serve the admin codes page
-        return send_from_directory(project_root, 'admin/codes.html')
+        return serve_page('admin/codes.html')
     
     @app.route('/admin/support')
     def admin_support():
         # Serve the admin support page
-        return send_from_directory(project_root, 'admin/support.html')
+        return serve_page('admin/support.html')
     
     @app.route('/admin/profiles')
     def admin_profiles():
         # Serve the admin profiles page
-        return send_from_directory(project_root, 'admin/profiles.html')
+        return serve_page('admin/profiles.html')
     
     @app.route('/admin/users')
     def admin_users():
         # Serve the admin users page
-        return send_from_directory(project_root, 'admin/users.html')
+        return serve_page('admin/users.html')
     
     @app.route('/admin/partners')
     def admin_partners():
         # Serve the admin partners page
-        return send_from_directory(project_root, 'admin/partners.html')
+        return serve_page('admin/partners.html')
     
     # Serve frontend files
     @app.route('/frontend/')
     def frontend_index():
-        return send_from_directory(project_root, 'frontend/index.html')
+        return serve_page('frontend/index.html')
     
     @app.route('/frontend/<path:filename>')
     def serve_frontend_files(filename):
+        # HTML documents come straight from the in-memory cache
+        if page_cache.get(f'frontend/{filename}'):
+            return serve_page(f'frontend/{filename}')
         frontend_path = os.path.join(project_root, 'frontend', filename)
         # If the file exists in the frontend directory, serve it
         if os.path.exists(frontend_path) and os.path.isfile(frontend_path):
             return send_from_directory(os.path.join(project_root, 'frontend'), filename)
         # If not found, serve the frontend index.html (for SPA-like behavior)
-        return send_from_directory(project_root, 'frontend/index.html')
+        return serve_page('frontend/index.html')
     
     @app.route('/<path:filename>')
     def serve_static(filename):
+        if filename.endswith('.html') and page_cache.get(f'frontend/{filename}'):
+            return serve_page(f'frontend/{filename}')
         # Handle Vercel deployment differently for static files
         if os.environ.get('VERCEL') == '1':
             if filename.endswith('.html') or filename.endswith('.css') or filename.endswith('.js'):
@@ -180,10 +322,14 @@ def create_app():
         return send_from_directory(frontend_folder, 'service-worker.js', mimetype='application/javascript')
     
     # Serve uploaded files
-    @app.route('/uploads/task_proofs/<filename>')
+    @app.route('/uploads/task_proofs/<path:filename>')
     def serve_uploaded_task_proof(filename):
+        # Unprocessed uploads are never served
+        if filename.startswith('incoming/'):
+            return jsonify({'message': 'File not found'}), 404
         upload_dir = os.path.join(project_root, 'uploads', 'task_proofs')
-        return send_from_directory(upload_dir, filename)
+        # Processed files are named by content hash, so they never change
+        return send_from_directory(upload_dir, filename, max_age=31536000)
     
     # Serve the main index.html for all non-API routes (for SPA)
     @app.errorhandler(404)
@@ -192,7 +338,10 @@ def create_app():
         if request.path.startswith('/api/'):
             return jsonify({'message': 'Endpoint not found'}), 404
         # Otherwise, serve the main index.html (for SPA routing)
-        return send_from_directory(frontend_folder, 'index.html')
+        return serve_page('frontend/index.html')
+    
+    # Track per-user ledger versions for conditional requests
+    import backend.utils.ledger_version
     
     # Register blueprints
     from backend.routes.auth import auth_bp
@@ -207,6 +356,8 @@ def create_app():
     from backend.routes.support import support_bp
     from backend.routes.partners import partners_bp
     from backend.routes.tasks import tasks_bp
+    from backend.routes.dashboard import dashboard_bp
+    from backend.routes.stream import stream_bp
     
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(users_bp, url_prefix='/api/users')
@@ -220,6 +371,8 @@ def create_app():
     app.register_blueprint(support_bp, url_prefix='/api/support')
     app.register_blueprint(partners_bp, url_prefix='/api/partners')
     app.register_blueprint(tasks_bp, url_prefix='/api/tasks')
+    app.register_blueprint(dashboard_bp, url_prefix='/api/dashboard')
+    app.register_blueprint(stream_bp, url_prefix='/api/stream')
     
     # Main API endpoint
     @app.route('/api')
@@ -239,7 +392,9 @@ def create_app():
                 '/api/notifications': 'Notification endpoints',
                 '/api/support': 'Support system endpoints',
                 '/api/partners': 'Partner management endpoints',
-                '/api/tasks': 'Task management endpoints'
+                '/api/tasks': 'Task management endpoints',
+                '/api/dashboard': 'Aggregated dashboard endpoints',
+                '/api/stream': 'Server-sent events for balance and notification changes'
             },
             'documentation': '/api/docs'  # Placeholder for future documentation
         }), 200
@@ -308,13 +463,33 @@ def create_app():
                         'endpoint': '/api/tasks',
                         'methods': ['GET', 'POST', 'PUT'],
                         'description': 'Task management for users to earn points'
+                    },
+                    {
+                        'endpoint': '/api/dashboard',
+                        'methods': ['GET'],
+                        'description': 'Everything the user dashboard needs in a single response'
+                    },
+                    {
+                        'endpoint': '/api/stream',
+                        'methods': ['GET'],
+                        'description': 'Server-sent event stream pushing new notifications, unread counts and balance changes'
+                    },
+                    {
+                        'endpoint': '/api/stream/token',
+                        'methods': ['POST'],
+                        'description': 'Short-lived token for opening the event stream with ?jwt='
                     }
                 ]
             }
         }), 200
     
-    # Create tables
-    with app.app_context():
-        db.create_all()
+    # flask init-db / flask seed
+    init_cli(app)
+    
+    if app.config['INIT_DB_ON_STARTUP']:
+        from backend.seed import seed_database
+        init_db(app)
+        seed_database(app)
     
+    _apps.add(app)
     return app
\ No newline at end of file
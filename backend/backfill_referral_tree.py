@@ -0,0 +1,70 @@
+import argparse
+import json
+import sys
+from backend.app import create_app
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+
+DEFAULT_CHUNK_SIZE = 5000
+MAX_CHAIN = 1000  # Guards against referral cycles in bad data
+
+closure_table = ReferralClosure.__table__
+
+
+def backfill(chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Rebuild referral_closure from users.referred_by.
+
+    Reads users once, streaming (id, referred_by) pairs in keyset chunks
+    into an int -> int parent map, then writes each user's chain in
+    multi-row INSERTs of chunk_size rows. Only the parent map is held in
+    memory; the closure rows themselves are never accumulated.
+    """
+    parents = {}
+    last_id = 0
+    while True:
+        rows = db.session.query(User.id, User.referred_by).filter(
+            User.id > last_id
+        ).order_by(User.id).limit(chunk_size).all()
+        if not rows:
+            break
+        for user_id, referred_by in rows:
+            parents[user_id] = referred_by
+        last_id = rows[-1][0]
+
+    summary = {'users': len(parents), 'rows': 0, 'cycles': 0}
+    db.session.execute(closure_table.delete())
+
+    pending = []
+    for user_id in parents:
+        pending.append({'ancestor_id': user_id, 'descendant_id': user_id, 'depth': 0})
+        ancestor, depth, seen = parents[user_id], 1, {user_id}
+        while ancestor is not None and ancestor in parents:
+            if ancestor in seen or depth > MAX_CHAIN:
+                summary['cycles'] += 1
+                break
+            seen.add(ancestor)
+            pending.append({'ancestor_id': ancestor, 'descendant_id': user_id, 'depth': depth})
+            ancestor, depth = parents[ancestor], depth + 1
+
+        if len(pending) >= chunk_size:
+            db.session.execute(closure_table.insert(), pending)
+            summary['rows'] += len(pending)
+            pending = []
+
+    if pending:
+        db.session.execute(closure_table.insert(), pending)
+        summary['rows'] += len(pending)
+    db.session.commit()
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Rebuild the referral closure table from users.referred_by')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='users per read, rows per insert')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        print(json.dumps(backfill(chunk_size=args.chunk_size)), file=sys.stderr)
@@ -0,0 +1,28 @@
+import click
+from backend.extensions import db
+
+
+def init_db(app):
+    """Create any missing tables (existing tables are left alone; migrate_db.py adds new columns)"""
+    with app.app_context():
+        db.create_all()
+
+
+def init_cli(app):
+    """Schema and seed commands: flask --app app init-db / flask --app app seed"""
+
+    @app.cli.command('init-db')
+    @click.option('--seed/--no-seed', default=False, help='Also create the admin account if it is missing')
+    def init_db_command(seed):
+        """Create the database tables."""
+        init_db(app)
+        click.echo('Database tables created')
+        if seed:
+            from backend.seed import seed_database
+            seed_database(app)
+
+    @app.cli.command('seed')
+    def seed_command():
+        """Create the admin account if it is missing."""
+        from backend.seed import seed_database
+        seed_database(app)
@@ -0,0 +1,43 @@
+from backend.extensions import db
+from datetime import datetime
+import json
+
+class ActivityEvent(db.Model):
+    """
+    One entry in the admin activity feed.
+
+    Appended by each subsystem in the same transaction as the change it
+    describes, with the display fields (user name, points, title...) copied
+    into a small JSON payload so the feed never joins back to the source
+    tables. The id is the feed order and the pagination cursor.
+    """
+    __tablename__ = 'activity_events'
+    __table_args__ = (
+        db.Index('ix_activity_events_type_id', 'type', 'id'),
+        db.Index('ix_activity_events_user_id_id', 'user_id', 'id'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    type = db.Column(db.String(40), nullable=False)  # e.g. user_registration, task_review
+    user_id = db.Column(db.Integer)  # User the event is about; kept if the user is deleted
+    user_name = db.Column(db.String(100))
+    actor_id = db.Column(db.Integer)  # Admin who acted, when it isn't the user
+    subject_id = db.Column(db.Integer)  # Transaction, user task, support message... by type
+    payload = db.Column(db.Text)  # Compact JSON
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+
+    def __repr__(self):
+        return f'<ActivityEvent {self.id} {self.type}>'
+
+    def to_dict(self):
+        data = json.loads(self.payload) if self.payload else {}
+        data.update({
+            'id': self.id,
+            'type': self.type,
+            'user_id': self.user_id,
+            'user_name': self.user_name,
+            'actor_id': self.actor_id,
+            'subject_id': self.subject_id,
+            'timestamp': self.created_at.isoformat() if self.created_at else None
+        })
+        return data
@@ -8,12 +8,35 @@ class Batch(db.Model):
     name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.Text)
     point_value = db.Column(db.Float, nullable=False, default=1.0)
-    count = db.Column(db.Integer, nullable=False, default=0)
+    count = db.Column(db.Integer, nullable=False, default=0)  # Codes in the batch
+    used_count = db.Column(db.Integer, nullable=False, default=0)  # Of which redeemed
+    deleted_at = db.Column(db.DateTime)  # Retired; its codes are invalid and purged in the background
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
-    codes = db.relationship('RewardCode', back_populates='batch', cascade="all, delete-orphan")
+    # Codes are deleted set-based (see utils.batch_purge), never loaded to cascade
+    codes = db.relationship('RewardCode', back_populates='batch', cascade="all, delete-orphan", passive_deletes=True)
+    
+    @classmethod
+    def get_live(cls, batch_id):
+        """The batch, unless it doesn't exist or has been retired"""
+        return cls.query.filter_by(id=batch_id, deleted_at=None).first()
+    
+    @classmethod
+    def adjust_counts(cls, batch_id, codes=0, used=0):
+        """Move the code counters with one atomic UPDATE (callers commit)"""
+        table = cls.__table__
+        values = {}
+        if codes:
+            values['count'] = table.c.count + codes
+        if used:
+            values['used_count'] = table.c.used_count + used
+        if values:
+            db.session.execute(table.update().where(table.c.id == batch_id).values(**values))
+            batch = db.session.identity_map.get(db.session.identity_key(cls, ident=batch_id))
+            if batch is not None:
+                db.session.expire(batch, list(values.keys()))
     
     def __repr__(self):
         return f'<Batch {self.name}>'
@@ -27,5 +50,7 @@ class Batch(db.Model):
             'count': self.count,
             'created_at': self.created_at.isoformat() if self.created_at else None,
             'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'codes_count': len(self.codes) if self.codes else 0
+            'codes_count': self.count,
+            'used_count': self.used_count,
+            'unused_count': self.count - self.used_count
         }
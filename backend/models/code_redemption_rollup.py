@@ -0,0 +1,31 @@
+from backend.extensions import db
+
+class CodeRedemptionRollup(db.Model):
+    """
+    Reward code redemptions per batch per hour.
+
+    Incremented in the same transaction as each redemption, so analytics
+    read these small rows instead of scanning reward_codes.
+    """
+    __tablename__ = 'code_redemption_rollups'
+    __table_args__ = (
+        db.UniqueConstraint('batch_id', 'bucket', name='uq_code_redemption_rollups_batch_bucket'),
+        db.Index('ix_code_redemption_rollups_bucket', 'bucket'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    bucket = db.Column(db.DateTime, nullable=False)  # Start of the UTC hour
+    redemptions = db.Column(db.Integer, nullable=False, default=0)
+    points = db.Column(db.Float, nullable=False, default=0.0)  # Points awarded
+
+    def __repr__(self):
+        return f'<CodeRedemptionRollup batch:{self.batch_id} {self.bucket} {self.redemptions}>'
+
+    def to_dict(self):
+        return {
+            'batch_id': self.batch_id,
+            'bucket': self.bucket.isoformat() if self.bucket else None,
+            'redemptions': self.redemptions,
+            'points': self.points
+        }
@@ -0,0 +1,29 @@
+from backend.extensions import db
+from datetime import datetime
+
+class IdempotencyKey(db.Model):
+    """
+    The stored outcome of a request sent with an Idempotency-Key header.
+
+    A row is claimed ('processing') before the endpoint runs and completed
+    with the response afterwards; repeats of the key within the TTL replay
+    the stored response instead of running the endpoint again.
+    """
+    __tablename__ = 'idempotency_keys'
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'key', name='uq_idempotency_keys_user_key'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    key = db.Column(db.String(255), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # sha256 of method, path and body
+    status = db.Column(db.String(20), nullable=False, default='processing')  # processing or completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.user_id}:{self.key} {self.status}>'
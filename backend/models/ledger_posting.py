@@ -0,0 +1,35 @@
+from backend.extensions import db
+from datetime import datetime
+from backend.utils.serializers import row_serializer
+
+class LedgerPosting(db.Model):
+    """
+    One line of a double-entry journal.
+
+    Every Transaction writes balanced lines: for each commodity the amounts
+    of its postings sum to zero. Amounts are integer minor units (hundredths
+    of a point for PTS, cents for USD). Rows are append-only; a reversal
+    writes new, negated lines instead of editing old ones.
+    """
+    __tablename__ = 'ledger_postings'
+
+    id = db.Column(db.Integer, primary_key=True)
+    transaction_id = db.Column(db.Integer, db.ForeignKey('transactions.id'), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)  # Set for user accounts only
+    account = db.Column(db.String(50), nullable=False)  # e.g. user:points, platform:code_redemption
+    commodity = db.Column(db.String(3), nullable=False)  # PTS or USD
+    amount_minor = db.Column(db.BigInteger, nullable=False)
+    is_reversal = db.Column(db.Boolean, default=False, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LedgerPosting {self.account} {self.amount_minor} {self.commodity}>'
+
+    def to_dict(self):
+        return serialize_ledger_posting(self)
+
+
+serialize_ledger_posting = row_serializer(LedgerPosting, (
+    'id', 'transaction_id', 'user_id', 'account', 'commodity', 'amount_minor', 'is_reversal',
+    'created_at',
+))
@@ -1,6 +1,7 @@
 from backend.extensions import db
 from datetime import datetime
 from enum import Enum
+from backend.utils.serializers import row_serializer
 
 class NotificationType(Enum):
     INFO = "info"
@@ -27,13 +28,9 @@ class Notification(db.Model):
         return f'<Notification {self.title}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'title': self.title,
-            'message': self.message,
-            'type': self.type.value,
-            'is_read': self.is_read,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return serialize_notification(self)
+
+
+serialize_notification = row_serializer(Notification, (
+    'id', 'user_id', 'title', 'message', 'type', 'is_read', 'created_at', 'updated_at',
+))
@@ -0,0 +1,21 @@
+from backend.extensions import db
+
+class ReferralClosure(db.Model):
+    """
+    Transitive closure of User.referred_by.
+
+    One row per (ancestor, descendant) pair on a referral chain, including
+    each user's row to itself at depth 0, so a whole downline is a single
+    indexed range read instead of a recursive query.
+    """
+    __tablename__ = 'referral_closure'
+    __table_args__ = (
+        db.Index('ix_referral_closure_descendant', 'descendant_id'),
+    )
+
+    ancestor_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    descendant_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    depth = db.Column(db.Integer, nullable=False)  # 1 = referred directly by the ancestor
+
+    def __repr__(self):
+        return f'<ReferralClosure {self.ancestor_id}->{self.descendant_id} depth:{self.depth}>'
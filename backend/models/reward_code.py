@@ -1,35 +1,72 @@
 from backend.extensions import db
 from datetime import datetime
+from sqlalchemy.orm import validates
+from backend.utils.helpers import encode_reward_code
+from backend.utils.serializers import row_serializer
 
 class RewardCode(db.Model):
     __tablename__ = 'reward_codes'
+    # Ids are never reused, even after the newest codes are deleted: the
+    # reward code index in each worker catches up on ids above the last it saw
+    __table_args__ = {'sqlite_autoincrement': True}
     
     id = db.Column(db.Integer, primary_key=True)
     code = db.Column(db.String(8), unique=True, nullable=False)  # 5 letters + 3 numbers
+    code_key = db.Column(db.BigInteger, unique=True)  # encode_reward_code(code); what lookups use
     point_value = db.Column(db.Float, nullable=False)  # Points awarded per code
     is_used = db.Column(db.Boolean, default=False)
     used_by = db.Column(db.Integer, db.ForeignKey('users.id'))  # User who redeemed the code
     used_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
-    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False)
+    batch_id = db.Column(db.Integer, db.ForeignKey('batches.id'), nullable=False, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
     user = db.relationship('User', back_populates='codes')
     batch = db.relationship('Batch', back_populates='codes')
     
+    @validates('code')
+    def _set_code_key(self, key, code):
+        # Keep the packed key in step with the string form
+        self.code_key = encode_reward_code(code)
+        return code
+    
+    @classmethod
+    def live(cls):
+        """Query over codes whose batch hasn't been retired"""
+        from backend.models.batch import Batch
+        return cls.query.join(Batch, Batch.id == cls.batch_id).filter(Batch.deleted_at.is_(None))
+    
+    @classmethod
+    def claim(cls, code_ids, user_id):
+        """
+        Mark unused codes as redeemed by user_id with one guarded UPDATE (callers commit).
+
+        Returns the set of ids this call claimed. A code someone else
+        redeemed concurrently is left out, so it is only ever credited once.
+        """
+        if not code_ids:
+            return set()
+        table = cls.__table__
+        now = datetime.utcnow()
+        claimed = {row.id for row in db.session.execute(table.update().where(
+            table.c.id.in_(code_ids),
+            table.c.is_used.isnot(True)
+        ).values(is_used=True, used_by=user_id, used_at=now, updated_at=now).returning(table.c.id))}
+        for code_id in claimed:
+            code = db.session.identity_map.get(db.session.identity_key(cls, ident=code_id))
+            if code is not None:
+                db.session.expire(code, ['is_used', 'used_by', 'used_at', 'updated_at'])
+        return claimed
+    
     def __repr__(self):
         return f'<RewardCode {self.code}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'code': self.code,
-            'point_value': self.point_value,
-            'is_used': self.is_used,
-            'used_by': self.used_by,
-            'used_at': self.used_at.isoformat() if self.used_at else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
-            'batch_id': self.batch_id
-        }
\ No newline at end of file
+        return serialize_reward_code(self)
+
+
+serialize_reward_code = row_serializer(RewardCode, (
+    'id', 'code', 'point_value', 'is_used', 'used_by', 'used_at', 'created_at', 'updated_at',
+    'batch_id',
+))
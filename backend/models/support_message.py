@@ -1,6 +1,7 @@
 from backend.extensions import db
 from datetime import datetime
 from enum import Enum
+from backend.utils.serializers import row_serializer
 
 class MessageType(Enum):
     USER_TO_SUPPORT = "user_to_support"
@@ -32,14 +33,10 @@ class SupportMessage(db.Model):
         return f'<SupportMessage {self.subject}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'subject': self.subject,
-            'message': self.message,
-            'response': self.response,
-            'message_type': self.message_type.value,
-            'status': self.status.value,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return serialize_support_message(self)
+
+
+serialize_support_message = row_serializer(SupportMessage, (
+    'id', 'user_id', 'subject', 'message', 'response', 'message_type', 'status', 'created_at',
+    'updated_at',
+))
@@ -1,5 +1,6 @@
 from backend.extensions import db
 from datetime import datetime
+from backend.utils.serializers import row_serializer
 
 class Task(db.Model):
     __tablename__ = 'tasks'
@@ -39,10 +40,12 @@ class UserTask(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False)
+    task_id = db.Column(db.Integer, db.ForeignKey('tasks.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='available')  # available, in_progress, completed, pending_review, rejected
     proof_text = db.Column(db.Text)  # Text submitted by user as proof
-    proof_image = db.Column(db.String(255))  # URL to image submitted by user
+    proof_image = db.Column(db.String(255))  # URL to the review-size rendition of the submitted image
+    proof_image_thumb = db.Column(db.String(255))  # URL to the thumbnail of the submitted image
+    proof_image_status = db.Column(db.String(20))  # processing, ready, failed (None when no image)
     completed_at = db.Column(db.DateTime)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
@@ -55,14 +58,10 @@ class UserTask(db.Model):
         return f'<UserTask User:{self.user_id} Task:{self.task_id} Status:{self.status}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'task_id': self.task_id,
-            'status': self.status,
-            'proof_text': self.proof_text,
-            'proof_image': self.proof_image,
-            'completed_at': self.completed_at.isoformat() if self.completed_at else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return serialize_user_task(self)
+
+
+serialize_user_task = row_serializer(UserTask, (
+    'id', 'user_id', 'task_id', 'status', 'proof_text', 'proof_image', 'proof_image_thumb',
+    'proof_image_status', 'completed_at', 'created_at', 'updated_at',
+))
@@ -1,6 +1,7 @@
 from backend.extensions import db
 from datetime import datetime
 from enum import Enum
+from backend.utils.serializers import row_serializer
 
 class TransactionType(Enum):
     EARNING = "earning"
@@ -19,7 +20,7 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     type = db.Column(db.Enum(TransactionType), nullable=False)
     status = db.Column(db.Enum(TransactionStatus), default=TransactionStatus.COMPLETED)
     description = db.Column(db.String(255))
@@ -37,16 +38,10 @@ class Transaction(db.Model):
         return f'<Transaction {self.type.value} ${self.amount}>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'user_id': self.user_id,
-            'type': self.type.value,
-            'status': self.status.value,
-            'description': self.description,
-            'amount': self.amount,
-            'points_amount': self.points_amount,
-            'currency': self.currency,
-            'reference_id': self.reference_id,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return serialize_transaction(self)
+
+
+serialize_transaction = row_serializer(Transaction, (
+    'id', 'user_id', 'type', 'status', 'description', 'amount', 'points_amount', 'currency',
+    'reference_id', 'created_at', 'updated_at',
+))
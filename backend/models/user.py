@@ -1,6 +1,7 @@
 from backend.extensions import db
 from datetime import datetime
 from enum import Enum
+from backend.utils.serializers import row_serializer
 
 class UserRole(Enum):
     USER = "user"
@@ -20,7 +21,10 @@ class User(db.Model):
     account_name = db.Column(db.String(100))
     account_number = db.Column(db.String(50))
     referral_code = db.Column(db.String(20), unique=True)
-    referred_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+    referred_by = db.Column(db.Integer, db.ForeignKey('users.id'), index=True)
+    referral_count = db.Column(db.Integer, default=0, nullable=False, index=True)  # Users referred (direct)
+    referral_earnings = db.Column(db.Float, default=0.0, nullable=False)  # Completed referral bonuses, USD
+    referral_points_earned = db.Column(db.Float, default=0.0, nullable=False)  # Completed referral bonuses, points
     points_balance = db.Column(db.Float, default=0.0)
     total_points_earned = db.Column(db.Float, default=0.0)
     total_points_withdrawn = db.Column(db.Float, default=0.0)
@@ -38,7 +42,8 @@ class User(db.Model):
     swift_code = db.Column(db.String(50))
     account_type = db.Column(db.String(50), default="savings")
     bank_address = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    ledger_version = db.Column(db.Integer, default=0, nullable=False)  # Bumped on any balance/transaction/notification write
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
     # Relationships
@@ -50,34 +55,14 @@ class User(db.Model):
         return f'<User {self.full_name} ({self.email})>'
     
     def to_dict(self):
-        return {
-            'id': self.id,
-            'full_name': self.full_name,
-            'email': self.email,
-            'role': self.role.value if hasattr(self.role, 'value') else self.role,
-            'phone': self.phone,
-            'bank_name': self.bank_name,
-            'account_name': self.account_name,
-            'account_number': self.account_number,
-            'referral_code': self.referral_code,
-            'referred_by': self.referred_by,
-            'points_balance': self.points_balance,
-            'total_points_earned': self.total_points_earned,
-            'total_points_withdrawn': self.total_points_withdrawn,
-            'total_earnings': self.total_earnings,
-            'total_withdrawn': self.total_withdrawn,
-            'daily_code_requirement': self.daily_code_requirement,
-            'is_approved': self.is_approved,
-            'is_suspended': self.is_suspended,
-            'is_verified': self.is_verified,
-            'verification_pending': self.verification_pending,
-            'avatar_url': self.avatar_url,
-            'country': self.country,
-            'province': self.province,
-            'routing_number': self.routing_number,
-            'swift_code': self.swift_code,
-            'account_type': self.account_type,
-            'bank_address': self.bank_address,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+        return serialize_user(self)
+
+
+serialize_user = row_serializer(User, (
+    'id', 'full_name', 'email', 'role', 'phone', 'bank_name', 'account_name', 'account_number',
+    'referral_code', 'referred_by', 'referral_count', 'points_balance', 'total_points_earned',
+    'total_points_withdrawn', 'total_earnings', 'total_withdrawn', 'daily_code_requirement',
+    'is_approved', 'is_suspended', 'is_verified', 'verification_pending', 'avatar_url', 'country',
+    'province', 'routing_number', 'swift_code', 'account_type', 'bank_address', 'created_at',
+    'updated_at',
+))
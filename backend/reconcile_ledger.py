@@ -0,0 +1,174 @@
+import argparse
+import json
+import sys
+from backend.app import create_app
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+from backend.models.ledger_posting import LedgerPosting
+from backend.utils.ledger import BALANCE_COLUMNS, USER_POINTS_ACCOUNT, USER_EARNINGS_ACCOUNT
+
+# Differences below half a cent / half a hundredth of a point are float noise
+TOLERANCE = 0.005
+DEFAULT_CHUNK_SIZE = 5000
+
+users_table = User.__table__
+
+
+def expected_totals(lo, hi):
+    """
+    Aggregate the transactions of users lo..hi into the balance columns.
+
+    One grouped query per chunk; the database does the per-user sums, so
+    memory stays proportional to the chunk size whatever the table size.
+    Failed withdrawals were refunded and count for nothing.
+    """
+    points = db.func.coalesce(Transaction.points_amount, 0)
+    amount = db.func.coalesce(Transaction.amount, 0)
+    is_withdrawal = Transaction.type == TransactionType.POINT_WITHDRAWAL
+
+    rows = db.session.query(
+        Transaction.user_id,
+        db.func.sum(points),
+        db.func.sum(db.case((db.and_(points > 0, db.not_(is_withdrawal)), points), else_=0)),
+        db.func.sum(db.case((points < 0, -points), else_=0)),
+        db.func.sum(amount),
+        db.func.sum(db.case((is_withdrawal, -amount), else_=0))
+    ).filter(
+        Transaction.user_id.between(lo, hi),
+        Transaction.status != TransactionStatus.FAILED
+    ).group_by(Transaction.user_id).all()
+
+    return {row[0]: dict(zip(BALANCE_COLUMNS, row[1:])) for row in rows}
+
+
+def ledger_totals(lo, hi):
+    """Sum the users' ledger postings (reversals included) per account"""
+    rows = db.session.query(
+        LedgerPosting.user_id,
+        LedgerPosting.account,
+        db.func.sum(LedgerPosting.amount_minor)
+    ).filter(
+        LedgerPosting.user_id.between(lo, hi),
+        LedgerPosting.account.in_([USER_POINTS_ACCOUNT, USER_EARNINGS_ACCOUNT])
+    ).group_by(LedgerPosting.user_id, LedgerPosting.account).all()
+
+    totals = {}
+    for user_id, account, amount_minor in rows:
+        key = 'points_balance' if account == USER_POINTS_ACCOUNT else 'total_earnings'
+        totals.setdefault(user_id, {})[key] = (amount_minor or 0) / 100
+    return totals
+
+
+def unbalanced_journals():
+    """Transactions whose postings don't sum to zero per commodity (should never happen)"""
+    return db.session.query(
+        LedgerPosting.transaction_id,
+        LedgerPosting.commodity,
+        db.func.sum(LedgerPosting.amount_minor)
+    ).group_by(
+        LedgerPosting.transaction_id, LedgerPosting.commodity
+    ).having(db.func.sum(LedgerPosting.amount_minor) != 0).limit(1000).all()
+
+
+def repair_user(user_id, stored, expected):
+    """
+    Reset drifted columns to the transaction-derived values.
+
+    Compare-and-set on the stored values, so a balance that changed while
+    the job ran is left alone and reported instead of overwritten.
+    """
+    values = {column: round(expected[column], 2) for column in expected}
+    values['ledger_version'] = users_table.c.ledger_version + 1
+
+    stmt = users_table.update().where(users_table.c.id == user_id)
+    for column in expected:
+        stmt = stmt.where(users_table.c[column] == stored[column]) if stored[column] is not None \
+            else stmt.where(users_table.c[column].is_(None))
+    return db.session.execute(stmt.values(**values)).rowcount == 1
+
+
+def reconcile(chunk_size=DEFAULT_CHUNK_SIZE, repair=False, output=sys.stdout):
+    """
+    Compare every user's stored balances with their transactions and ledger.
+
+    Writes one JSON line per drifted user to output and returns a summary.
+    """
+    summary = {'users_scanned': 0, 'users_drifted': 0, 'users_repaired': 0,
+               'repair_skipped': 0, 'ledger_mismatches': 0, 'unbalanced_journals': 0}
+    last_id = 0
+
+    while True:
+        # Keyset pagination over users; only this chunk is ever in memory
+        users = db.session.query(User.id, *[users_table.c[column] for column in BALANCE_COLUMNS]).filter(
+            User.id > last_id
+        ).order_by(User.id).limit(chunk_size).all()
+        if not users:
+            break
+
+        lo, hi = users[0][0], users[-1][0]
+        expected_by_user = expected_totals(lo, hi)
+        ledger_by_user = ledger_totals(lo, hi)
+
+        for row in users:
+            user_id = row[0]
+            stored = dict(zip(BALANCE_COLUMNS, row[1:]))
+            expected = expected_by_user.get(user_id, dict.fromkeys(BALANCE_COLUMNS, 0.0))
+            ledger = ledger_by_user.get(user_id, {})
+
+            drift = {}
+            for column in BALANCE_COLUMNS:
+                diff = (stored[column] or 0) - (expected[column] or 0)
+                if abs(diff) > TOLERANCE:
+                    drift[column] = {'stored': stored[column], 'expected': round(expected[column] or 0, 2),
+                                     'diff': round(diff, 2)}
+
+            ledger_drift = {}
+            for column in ('points_balance', 'total_earnings'):
+                if abs((expected[column] or 0) - ledger.get(column, 0)) > TOLERANCE:
+                    ledger_drift[column] = {'transactions': round(expected[column] or 0, 2),
+                                            'postings': ledger.get(column, 0)}
+
+            if ledger_drift:
+                summary['ledger_mismatches'] += 1
+
+            if drift or ledger_drift:
+                record = {'user_id': user_id, 'drift': drift, 'ledger_drift': ledger_drift}
+                if drift:
+                    summary['users_drifted'] += 1
+                    if repair:
+                        repaired = repair_user(user_id, stored, {column: expected[column] or 0 for column in drift})
+                        record['repaired'] = repaired
+                        summary['users_repaired' if repaired else 'repair_skipped'] += 1
+                output.write(json.dumps(record) + '\n')
+
+        if repair:
+            db.session.commit()
+        else:
+            db.session.rollback()
+        # Nothing from this chunk stays in the session
+        db.session.expunge_all()
+
+        summary['users_scanned'] += len(users)
+        last_id = hi
+
+    summary['unbalanced_journals'] = len(unbalanced_journals())
+    return summary
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Reconcile user balances against transactions and ledger postings')
+    parser.add_argument('--repair', action='store_true', help='reset drifted balance columns to the transaction totals')
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE, help='users per chunk')
+    parser.add_argument('--output', help='write the JSON-lines drift report here instead of stdout')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        report = open(args.output, 'w') if args.output else sys.stdout
+        try:
+            result = reconcile(chunk_size=args.chunk_size, repair=args.repair, output=report)
+        finally:
+            if args.output:
+                report.close()
+        print(json.dumps(result), file=sys.stderr)
@@ -1,20 +1,36 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app, Response
 from backend.extensions import db
-from backend.models.user import User, UserRole
+from backend.models.user import User, UserRole, serialize_user
 from backend.models.reward_code import RewardCode
 from backend.models.batch import Batch
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
 from backend.models.support_message import SupportMessage, MessageStatus, MessageType
 from backend.models.task import Task, UserTask
-from backend.utils.helpers import generate_reward_code, generate_batch_id, points_to_usd
-from backend.utils.emailer import Emailer
+from backend.utils.helpers import generate_batch_id, points_to_usd, encode_reward_code
 from backend.utils.admin_auth import admin_required
+from backend.utils import ledger
+from backend.utils.ledger_version import bump_ledger_version
+from backend.utils.withdrawal_stats import get_withdrawal_stats, invalidate_withdrawal_stats
+from backend.utils.mail_queue import queue_email
+from backend.utils.code_filter import code_might_exist
+from backend.utils.code_generation import create_reward_codes
+from backend.utils.pubsub import queue_user_event
+from backend.utils.activity import record_activity, record_activities, list_activities, ACTIVITY_TYPES
+from backend.utils.profiling import sample_stacks, render_collapsed
+from backend.models.notification import Notification, NotificationType
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import csv
 import io
+import os
+import time
+
+logger = logging.getLogger(__name__)
 
 admin_bp = Blueprint('admin', __name__)
 
+BULK_WITHDRAWAL_LIMIT = 500
+
 @admin_bp.route('/codes/generate', methods=['POST'])
 @admin_required
 def generate_codes():
@@ -26,34 +42,20 @@ def generate_codes():
         if not batch_id:
             return jsonify({'message': 'Batch ID is required'}), 400
             
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
         
         if count <= 0 or count > 10000:
             return jsonify({'message': 'Count must be between 1 and 10,000'}), 400
         
-        # Point value is now taken from the batch
-        point_value = batch.point_value
-        
-        # Generate codes
-        codes = []
-        for _ in range(count):
-            code = generate_reward_code()
-            reward_code = RewardCode(
-                code=code,
-                point_value=point_value,
-                batch_id=batch.id
-            )
-            db.session.add(reward_code)
-            codes.append(code)
-        
-        batch.count += count
-        db.session.commit()
+        # Generate codes (committed by create_reward_codes)
+        batch_id, batch_name = batch.id, batch.name
+        codes = create_reward_codes(batch, count)
         
         return jsonify({
-            'message': f'Successfully generated {count} codes for batch {batch.name}',
-            'batch_id': batch.id,
+            'message': f'Successfully generated {count} codes for batch {batch_name}',
+            'batch_id': batch_id,
             'codes': codes[:10],
             'total_generated': count
         }), 201
@@ -330,6 +332,7 @@ def delete_single_code(code_id):
         if not code:
             return jsonify({'message': 'Code not found'}), 404
             
+        Batch.adjust_counts(code.batch_id, codes=-1, used=-1 if code.is_used else 0)
         db.session.delete(code)
         db.session.commit()
         
@@ -347,7 +350,10 @@ def get_code_details(code):
         admin_user = User.query.get(current_user_id)
         
         # Find the reward code by its code value
-        reward_code = RewardCode.query.filter_by(code=code.upper()).first()
+        code_key = encode_reward_code(code)
+        reward_code = None
+        if code_key is not None and code_might_exist(code.upper()):
+            reward_code = RewardCode.query.filter_by(code_key=code_key).first()
         
         if not reward_code:
             return jsonify({'message': 'Code not found'}), 404
@@ -431,6 +437,13 @@ def respond_to_support_message(message_id):
         message.response = response_text
         message.status = MessageStatus.REPLIED
         message.updated_at = db.func.current_timestamp()
+        record_activity(
+            'support_reply',
+            user_id=message.user_id,
+            actor_id=current_user_id,
+            subject_id=message.id,
+            task_title=message.subject
+        )
         
         db.session.commit()
         
@@ -446,62 +459,52 @@ def respond_to_support_message(message_id):
 @admin_required
 def get_recent_activities():
     try:
-        current_user_id = int(get_jwt_identity())
-        admin_user = User.query.get(current_user_id)
-            
         limit = request.args.get('limit', 20, type=int)
+        cursor = request.args.get('cursor', type=int)
+        user_id = request.args.get('user_id', type=int)
+        types = [t for t in request.args.get('type', '').split(',') if t]
         
-        # Combine different types of activities
-        activities = []
-        
-        # 1. New user registrations
-        new_users = User.query.order_by(User.created_at.desc()).limit(limit).all()
-        for user in new_users:
-            activities.append({
-                'type': 'user_registration',
-                'user_name': user.full_name,
-                'user_id': user.id,
-                'timestamp': user.created_at.isoformat(),
-                'referral_code': user.referral_code,
-                'points': 0,
-                'cash_value': 0
-            })
-            
-        # 2. Recent transactions (Task completions, withdrawals, redemptions)
-        transactions = Transaction.query.order_by(Transaction.created_at.desc()).limit(limit).all()
-        for tx in transactions:
-            user = tx.user
-            act_type = 'unknown'
-            if tx.type == TransactionType.EARNING:
-                act_type = 'task_completion'
-            elif tx.type == TransactionType.CODE_REDEMPTION:
-                act_type = 'code_redemption'
-            elif tx.type == TransactionType.POINT_WITHDRAWAL:
-                act_type = 'withdrawal_request'
-            elif tx.type == TransactionType.REFERRAL_BONUS:
-                act_type = 'referral_bonus'
-                
-            activities.append({
-                'type': act_type,
-                'user_name': user.full_name if user else 'Unknown',
-                'user_id': tx.user_id,
-                'timestamp': tx.created_at.isoformat(),
-                'points': abs(tx.points_amount or 0),
-                'cash_value': abs(tx.amount or 0),
-                'task_title': tx.description,
-                'code': tx.reference_id if tx.type == TransactionType.CODE_REDEMPTION else None
-            })
-            
-        # Sort combined activities by timestamp
-        activities.sort(key=lambda x: x['timestamp'], reverse=True)
+        unknown = [t for t in types if t not in ACTIVITY_TYPES]
+        if unknown:
+            return jsonify({'message': f'Unknown activity type: {", ".join(unknown)}', 'types': list(ACTIVITY_TYPES)}), 400
+        
+        # One range scan over activity_events, newest first
+        events, next_cursor = list_activities(cursor=cursor, limit=limit, types=types, user_id=user_id)
         
         return jsonify({
-            'activities': activities[:limit]
+            'activities': [event.to_dict() for event in events],
+            'next_cursor': next_cursor,
+            'has_more': next_cursor is not None
         }), 200
         
     except Exception as e:
         return jsonify({'message': 'Failed to fetch recent activities', 'error': str(e)}), 500
 
+@admin_bp.route('/profile/sample', methods=['GET'])
+@admin_required
+def sample_worker_stacks():
+    try:
+        if not current_app.config.get('PROFILING_ENABLED'):
+            return jsonify({'message': 'Profiling is disabled'}), 404
+        
+        seconds = request.args.get('seconds', 5, type=float)
+        max_seconds = current_app.config.get('PROFILE_MAX_SECONDS', 30)
+        if not 0 < seconds <= max_seconds:
+            return jsonify({'message': f'seconds must be between 0 and {max_seconds:g}'}), 400
+        interval = min(max(request.args.get('interval_ms', 5, type=float), 1), 1000) / 1000
+        
+        # Samples the other threads of the worker that serves this request
+        stacks = sample_stacks(seconds, interval)
+        filename = f'stacks-{os.getpid()}-{int(time.time())}.collapsed'
+        
+        return Response(render_collapsed(stacks), mimetype='text/plain', headers={
+            'Content-Disposition': f'attachment; filename="{filename}"',
+            'X-Profile-Samples': str(sum(stacks.values()))
+        })
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to sample worker', 'error': str(e)}), 500
+
 @admin_bp.route('/users/points/update', methods=['POST'])
 @admin_required
 def update_user_points():
@@ -521,47 +524,34 @@ def update_user_points():
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Update points and earnings based on operation
+        # Update points and earnings (kept in sync) based on operation
         if operation == 'add':
             raw_points = int(points)
             points_to_add = max(1, raw_points)
-            user.points_balance += points_to_add
-            user.total_points_earned += points_to_add
-            # Sync earnings
-            user.total_earnings += points_to_usd(points_to_add)
-            
-            # Create transaction record for admin adjustment
-            transaction = Transaction(
-                user_id=user_id,
-                type=TransactionType.ADMIN_ADJUSTMENT,
-                status=TransactionStatus.COMPLETED,
-                description=f'Admin added {points_to_add} points',
+            ledger.post(
+                user.id,
+                TransactionType.ADMIN_ADJUSTMENT,
+                points=points_to_add,
                 amount=points_to_usd(points_to_add),
-                points_amount=points_to_add
+                description=f'Admin added {points_to_add} points'
             )
         elif operation == 'subtract':
             points_to_subtract = max(1, int(points))
-            if user.points_balance < points_to_subtract:
+            try:
+                ledger.post(
+                    user.id,
+                    TransactionType.ADMIN_ADJUSTMENT,
+                    points=-points_to_subtract,
+                    amount=-points_to_usd(points_to_subtract),
+                    description=f'Admin subtracted {points_to_subtract} points',
+                    require_funds=True
+                )
+            except ledger.InsufficientFundsError:
+                db.session.rollback()
                 return jsonify({'message': 'Insufficient points balance'}), 400
-            user.points_balance -= points_to_subtract
-            user.total_points_withdrawn += points_to_subtract
-            # Sync earnings (subtract proportional amount from total earnings)
-            user.total_earnings -= points_to_usd(points_to_subtract)
-            
-            # Create transaction record for admin adjustment
-            transaction = Transaction(
-                user_id=user_id,
-                type=TransactionType.ADMIN_ADJUSTMENT,
-                status=TransactionStatus.COMPLETED,
-                description=f'Admin subtracted {points_to_subtract} points',
-                amount=-points_to_usd(points_to_subtract),
-                points_amount=-points_to_subtract
-            )
         else:
             return jsonify({'message': 'Invalid operation. Use "add" or "subtract"'}), 400
         
-        # Add the transaction to the session
-        db.session.add(transaction)
         db.session.commit()
         
         return jsonify({
@@ -586,7 +576,7 @@ def get_all_users():
         role_filter = request.args.get('role', '')
         status_filter = request.args.get('status', '')
         
-        query = User.query
+        query = db.session.query(*serialize_user.columns)
         
         if search:
             query = query.filter(
@@ -612,7 +602,7 @@ def get_all_users():
         )
         
         return jsonify({
-            'users': [user.to_dict() for user in users.items],
+            'users': serialize_user.many(users.items),
             'total': users.total,
             'pages': users.pages,
             'current_page': page
@@ -719,16 +709,28 @@ def update_user(user_id):
         user.account_number = data.get('account_number', user.account_number)
         user.routing_number = data.get('routing_number', user.routing_number)
         
-        # Handle points and earnings synchronization
+        # Handle points and earnings synchronization; changes are posted as adjustments
         new_points = float(data.get('points_balance', user.points_balance))
         if new_points != user.points_balance:
             # If points changed, automatically recalculate earnings
-            user.total_earnings = points_to_usd(new_points)
+            ledger.post(
+                user.id,
+                TransactionType.ADMIN_ADJUSTMENT,
+                points=new_points - user.points_balance,
+                amount=points_to_usd(new_points) - (user.total_earnings or 0),
+                description=f'Admin set points balance to {new_points:g}'
+            )
         else:
             # If points didn't change, allow manual adjustment of earnings if provided
-            user.total_earnings = float(data.get('total_earnings', user.total_earnings))
+            new_earnings = float(data.get('total_earnings', user.total_earnings))
+            if new_earnings != user.total_earnings:
+                ledger.post(
+                    user.id,
+                    TransactionType.ADMIN_ADJUSTMENT,
+                    amount=new_earnings - (user.total_earnings or 0),
+                    description=f'Admin set total earnings to ${new_earnings:.2f}'
+                )
             
-        user.points_balance = new_points
         user.is_verified = data.get('is_verified', user.is_verified)
         user.is_suspended = data.get('is_suspended', user.is_suspended)
         user.is_approved = data.get('is_approved', user.is_approved)
@@ -780,7 +782,7 @@ def verify_user_documents(user_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         return jsonify({
             'message': 'Documents verified successfully',
@@ -829,7 +831,7 @@ def send_user_message(user_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         return jsonify({
             'message': 'Message sent successfully',
@@ -869,44 +871,12 @@ def get_pending_withdrawals():
                 'user': user.to_dict() if user else None
             })
         
-        # Calculate stats for the overview
-        from datetime import datetime, timedelta
-        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
-        week_ago = today - timedelta(days=7)
-        
-        pending_count = Transaction.query.filter_by(
-            type=TransactionType.POINT_WITHDRAWAL,
-            status=TransactionStatus.PENDING
-        ).count()
-        
-        today_approved = Transaction.query.filter(
-            Transaction.type == TransactionType.POINT_WITHDRAWAL,
-            Transaction.status == TransactionStatus.COMPLETED,
-            Transaction.updated_at >= today
-        ).count()
-        
-        week_approved_sum = db.session.query(db.func.coalesce(db.func.sum(Transaction.amount), 0.0)).filter(
-            Transaction.type == TransactionType.POINT_WITHDRAWAL,
-            Transaction.status == TransactionStatus.COMPLETED,
-            Transaction.updated_at >= week_ago
-        ).scalar() or 0.0
-        
-        rejected_count = Transaction.query.filter(
-            Transaction.type == TransactionType.POINT_WITHDRAWAL,
-            Transaction.status == TransactionStatus.FAILED
-        ).count()
-        
         return jsonify({
             'withdrawals': withdrawal_data,
             'total': withdrawals.total,
             'pages': withdrawals.pages,
             'current_page': page,
-            'stats': {
-                'pending': pending_count,
-                'today_approved': today_approved,
-                'week_total_amount': abs(week_approved_sum),
-                'rejected': rejected_count
-            }
+            'stats': get_withdrawal_stats()
         }), 200
         
     except Exception as e:
@@ -935,19 +905,26 @@ def approve_withdrawal(transaction_id):
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Verify that points were already deducted when the withdrawal was requested
-        # The points should have been deducted when the request was submitted
-        points_to_deduct = abs(transaction.points_amount)
-        
-        # Update transaction status to completed
-        transaction.status = TransactionStatus.COMPLETED
-        transaction.updated_at = db.func.current_timestamp()
+        # Points were already deducted when the withdrawal was requested
+        if not claim_pending_withdrawal(transaction.id, TransactionStatus.COMPLETED):
+            return jsonify({'message': 'Transaction is not pending approval'}), 409
+        bump_ledger_version(user.id)  # The guarded UPDATE skips the ORM events
+        record_activity(
+            'withdrawal_approved',
+            user_id=user.id,
+            user_name=user.full_name,
+            actor_id=current_user_id,
+            subject_id=transaction.id,
+            points=abs(transaction.points_amount or 0),
+            cash_value=abs(transaction.amount or 0)
+        )
         
         db.session.commit()
+        invalidate_withdrawal_stats()
         
-        # Send email notification
-        emailer = Emailer()
-        emailer.send_withdrawal_approved_notification(
+        # Queue email notification
+        queue_email(
+            'send_withdrawal_approved_notification',
             user_email=user.email,
             user_name=user.full_name,
             points=abs(transaction.points_amount),
@@ -965,6 +942,23 @@ def approve_withdrawal(transaction_id):
     except Exception as e:
         return jsonify({'message': 'Failed to approve withdrawal', 'error': str(e)}), 500
 
+def claim_pending_withdrawal(transaction_id, new_status):
+    """
+    Move a pending withdrawal to new_status with one guarded UPDATE.
+
+    Returns False when another review (single or bulk) got there first, so
+    a withdrawal is never approved and refunded, or refunded twice.
+    """
+    transactions_table = Transaction.__table__
+    return db.session.execute(transactions_table.update().where(
+        transactions_table.c.id == transaction_id,
+        transactions_table.c.type == TransactionType.POINT_WITHDRAWAL,
+        transactions_table.c.status == TransactionStatus.PENDING
+    ).values(
+        status=new_status,
+        updated_at=db.func.current_timestamp()
+    )).rowcount == 1
+
 @admin_bp.route('/withdrawals/<int:transaction_id>/reject', methods=['POST'])
 @admin_required
 def reject_withdrawal(transaction_id):
@@ -988,22 +982,28 @@ def reject_withdrawal(transaction_id):
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Refund points and amount to user
-        # points_amount and amount are negative for withdrawals
-        user.points_balance -= transaction.points_amount
-        user.total_points_withdrawn += transaction.points_amount
-        user.total_earnings -= transaction.amount
-        user.total_withdrawn += transaction.amount
-        
-        # Update transaction status to failed
-        transaction.status = TransactionStatus.FAILED
-        transaction.updated_at = db.func.current_timestamp()
+        # Mark the transaction failed, then refund points and amount to the user
+        if not claim_pending_withdrawal(transaction.id, TransactionStatus.FAILED):
+            return jsonify({'message': 'Transaction is not pending approval'}), 409
+        ledger.reverse_many([(transaction.id, transaction.user_id, transaction.type,
+                              transaction.points_amount, transaction.amount)])
+        record_activity(
+            'withdrawal_rejected',
+            user_id=user.id,
+            user_name=user.full_name,
+            actor_id=current_user_id,
+            subject_id=transaction.id,
+            points=abs(transaction.points_amount or 0),
+            cash_value=abs(transaction.amount or 0),
+            reason='Administrative review'
+        )
         
         db.session.commit()
+        invalidate_withdrawal_stats()
         
-        # Send email notification
-        emailer = Emailer()
-        emailer.send_withdrawal_rejected_notification(
+        # Queue email notification
+        queue_email(
+            'send_withdrawal_rejected_notification',
             user_email=user.email,
             user_name=user.full_name,
             points=abs(transaction.points_amount),
@@ -1023,6 +1023,163 @@ def reject_withdrawal(transaction_id):
         return jsonify({'message': 'Failed to reject withdrawal', 'error': str(e)}), 500
 
 
+@admin_bp.route('/withdrawals/bulk-approve', methods=['POST'])
+@admin_required
+def bulk_approve_withdrawals():
+    try:
+        return process_withdrawals_in_bulk('approve')
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Failed to approve withdrawals', 'error': str(e)}), 500
+
+@admin_bp.route('/withdrawals/bulk-reject', methods=['POST'])
+@admin_required
+def bulk_reject_withdrawals():
+    try:
+        return process_withdrawals_in_bulk('reject')
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'message': 'Failed to reject withdrawals', 'error': str(e)}), 500
+
+def process_withdrawals_in_bulk(action):
+    """
+    Approve or reject a list of pending withdrawals in one DB transaction.
+
+    Status changes are a single UPDATE ... RETURNING (create_app refuses
+    SQLite older than 3.35, which lacks it), rejections are refunded
+    through ledger.reverse_many, and notifications/emails are queued after
+    the commit. Every requested id gets a result entry.
+    """
+    data = request.get_json() or {}
+    transaction_ids = data.get('transaction_ids')
+    reason = data.get('reason') or 'Administrative review'
+    
+    if not isinstance(transaction_ids, list) or not transaction_ids:
+        return jsonify({'message': 'transaction_ids must be a non-empty list'}), 400
+    if len(transaction_ids) > BULK_WITHDRAWAL_LIMIT:
+        return jsonify({'message': f'At most {BULK_WITHDRAWAL_LIMIT} withdrawals can be processed at once'}), 400
+    try:
+        transaction_ids = list(dict.fromkeys(int(transaction_id) for transaction_id in transaction_ids))
+    except (TypeError, ValueError):
+        return jsonify({'message': 'transaction_ids must be integers'}), 400
+    
+    # One query for the requested rows, to explain the ids that can't be processed
+    found = {
+        row.id: row for row in db.session.query(
+            Transaction.id, Transaction.type, Transaction.status
+        ).filter(Transaction.id.in_(transaction_ids)).all()
+    }
+    
+    results = {}
+    for transaction_id in transaction_ids:
+        row = found.get(transaction_id)
+        if row is None:
+            results[transaction_id] = {'transaction_id': transaction_id, 'status': 'error', 'message': 'Transaction not found'}
+        elif row.type != TransactionType.POINT_WITHDRAWAL:
+            results[transaction_id] = {'transaction_id': transaction_id, 'status': 'error', 'message': 'Transaction is not a withdrawal request'}
+        elif row.status != TransactionStatus.PENDING:
+            results[transaction_id] = {'transaction_id': transaction_id, 'status': 'error', 'message': 'Transaction is not pending approval'}
+    
+    candidates = [transaction_id for transaction_id in transaction_ids if transaction_id not in results]
+    processed = []
+    if candidates:
+        transactions_table = Transaction.__table__
+        new_status = TransactionStatus.COMPLETED if action == 'approve' else TransactionStatus.FAILED
+        # The status guard makes concurrent reviews of the same id harmless
+        processed = db.session.execute(
+            transactions_table.update().where(
+                transactions_table.c.id.in_(candidates),
+                transactions_table.c.type == TransactionType.POINT_WITHDRAWAL,
+                transactions_table.c.status == TransactionStatus.PENDING
+            ).values(
+                status=new_status,
+                updated_at=db.func.current_timestamp()
+            ).returning(
+                transactions_table.c.id,
+                transactions_table.c.user_id,
+                transactions_table.c.type,
+                transactions_table.c.points_amount,
+                transactions_table.c.amount,
+                transactions_table.c.description
+            )
+        ).all()
+        
+        if action == 'reject':
+            ledger.reverse_many([(row.id, row.user_id, row.type, row.points_amount, row.amount) for row in processed])
+        else:
+            # Bulk updates skip the ORM events, so bump the owners' versions here
+            user_ids = {row.user_id for row in processed}
+            if user_ids:
+                users_table = User.__table__
+                db.session.execute(users_table.update().where(users_table.c.id.in_(user_ids)).values(
+                    ledger_version=users_table.c.ledger_version + 1
+                ))
+    
+    processed_ids = {row.id for row in processed}
+    for transaction_id in candidates:
+        if transaction_id not in processed_ids:
+            results[transaction_id] = {'transaction_id': transaction_id, 'status': 'error', 'message': 'Transaction is not pending approval'}
+    
+    # In-app notifications in the same transaction; emails once it commits
+    users = {user.id: user for user in User.query.filter(User.id.in_({row.user_id for row in processed})).all()} if processed else {}
+    emails = []
+    activities = []
+    for row in processed:
+        points = abs(row.points_amount or 0)
+        amount = abs(row.amount or 0)
+        method = get_method_from_description(row.description or '')
+        user = users.get(row.user_id)
+        
+        if action == 'approve':
+            title = 'Withdrawal Approved'
+            message = f'Your withdrawal of {points:g} points (${amount:.2f}) via {method} has been approved.'
+            notification_type = NotificationType.SUCCESS
+        else:
+            title = 'Withdrawal Rejected'
+            message = f'Your withdrawal of {points:g} points (${amount:.2f}) was rejected ({reason}). The points have been refunded.'
+            notification_type = NotificationType.WARNING
+        db.session.add(Notification(user_id=row.user_id, title=title, message=message, type=notification_type))
+        queue_user_event(db.session, row.user_id, 'balance')
+        
+        if user:
+            email_args = {'user_email': user.email, 'user_name': user.full_name, 'points': points, 'amount': amount, 'method': method}
+            if action == 'reject':
+                email_args['reason'] = reason
+            emails.append(email_args)
+        
+        activities.append({
+            'type': 'withdrawal_approved' if action == 'approve' else 'withdrawal_rejected',
+            'user_id': row.user_id,
+            'user_name': user.full_name if user else None,
+            'actor_id': int(get_jwt_identity()),
+            'subject_id': row.id,
+            'points': points,
+            'cash_value': amount,
+            'reason': reason if action == 'reject' else None
+        })
+        
+        results[row.id] = {
+            'transaction_id': row.id,
+            'status': 'approved' if action == 'approve' else 'rejected',
+            'user_id': row.user_id,
+            'points': points,
+            'amount': amount
+        }
+    
+    record_activities(activities)
+    db.session.commit()
+    invalidate_withdrawal_stats()
+    
+    email_method = 'send_withdrawal_approved_notification' if action == 'approve' else 'send_withdrawal_rejected_notification'
+    for email_args in emails:
+        queue_email(email_method, **email_args)
+    
+    return jsonify({
+        'message': f'{len(processed)} of {len(transaction_ids)} withdrawals {"approved" if action == "approve" else "rejected"}',
+        'processed': len(processed),
+        'failed': len(transaction_ids) - len(processed),
+        'results': [results[transaction_id] for transaction_id in transaction_ids]
+    }), 200
 
 def get_method_from_description(description):
     """Extract payment method from transaction description"""
@@ -1054,25 +1211,17 @@ def award_referral_bonus():
         if points > 0:
             raw_points = int(points)  # Ensure points is an integer
             points_to_add = max(1, raw_points)  # Ensure at least 1 point if any points are awarded
-            user.points_balance += points_to_add
-            user.total_points_earned += points_to_add
         else:
             points_to_add = 0  # No points to add
-            
-        if amount > 0:
-            user.total_earnings += amount
         
         # Create referral bonus transaction
-        transaction = Transaction(
-            user_id=user_id,
-            type=TransactionType.REFERRAL_BONUS,
-            status=TransactionStatus.COMPLETED,
-            description=reason,
-            amount=amount,
-            points_amount=points_to_add if points > 0 else 0
+        ledger.post(
+            user.id,
+            TransactionType.REFERRAL_BONUS,
+            points=points_to_add,
+            amount=max(amount, 0.0),
+            description=reason
         )
-        
-        db.session.add(transaction)
         db.session.commit()
         
         return jsonify({
@@ -1249,7 +1398,7 @@ def create_task():
         # Refresh the task object to ensure all data is current
         db.session.refresh(task)
         
-        print(f"Task created successfully: {task.id} - {task.title}, is_active: {task.is_active}")  # Debug print
+        logger.debug("Task created: %s - %s, is_active: %s", task.id, task.title, task.is_active)
         
         return jsonify({
             'message': 'Task created successfully',
@@ -1258,7 +1407,7 @@ def create_task():
         
     except Exception as e:
         db.session.rollback()  # Rollback in case of error
-        print(f"Error creating task: {str(e)}")  # Debug print
+        logger.exception("Error creating task")
         return jsonify({'message': 'Failed to create task', 'error': str(e)}), 500
 
 @admin_bp.route('/tasks/<int:task_id>/update', methods=['POST'])
@@ -1287,7 +1436,7 @@ def update_task(task_id):
         # Refresh the task object to ensure all data is current
         db.session.refresh(task)
         
-        print(f"Task updated successfully: {task.id} - {task.title}, is_active: {task.is_active}")  # Debug print
+        logger.debug("Task updated: %s - %s, is_active: %s", task.id, task.title, task.is_active)
         
         return jsonify({
             'message': 'Task updated successfully',
@@ -1296,7 +1445,7 @@ def update_task(task_id):
         
     except Exception as e:
         db.session.rollback()  # Rollback in case of error
-        print(f"Error updating task: {str(e)}")  # Debug print
+        logger.exception("Error updating task")
         return jsonify({'message': 'Failed to update task', 'error': str(e)}), 500
 
 @admin_bp.route('/tasks/<int:task_id>/delete', methods=['DELETE'])
@@ -1313,11 +1462,11 @@ def delete_task(task_id):
         db.session.delete(task)
         db.session.commit()
         
-        print(f"Task deleted successfully: {task_id}")  # Debug print
+        logger.debug("Task deleted: %s", task_id)
         
         return jsonify({'message': 'Task deleted successfully'}), 200
         
     except Exception as e:
         db.session.rollback()  # Rollback in case of error
-        print(f"Error deleting task: {str(e)}")  # Debug print
+        logger.exception("Error deleting task")
         return jsonify({'message': 'Failed to delete task', 'error': str(e)}), 500
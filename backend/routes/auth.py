@@ -1,3 +1,4 @@
+import logging
 from flask import Blueprint, request, jsonify
 from backend.extensions import db, bcrypt
 from backend.models.user import User, UserRole
@@ -5,13 +6,23 @@ from backend.models.password_reset import PasswordResetToken
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
 from backend.utils.helpers import generate_referral_code
 from backend.utils.emailer import Emailer
+from backend.utils.ledger_version import ledger_etag
+from backend.utils.rate_limit import rate_limit
+from backend.utils.referral_leaderboard import record_referral, invalidate_leaderboard
+from backend.utils.referral_tree import record_referral_path, ancestor_ids
+from backend.utils.partner_metrics import mark_partner_metrics_stale
+from backend.utils.activity import record_activity
+from backend.utils import ledger
 from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
 import re
 import os
 
+logger = logging.getLogger(__name__)
+
 auth_bp = Blueprint('auth', __name__)
 
 @auth_bp.route('/register', methods=['POST'])
+@rate_limit('20/hour', per='ip')
 def register():
     try:
         data = request.get_json()
@@ -55,32 +66,38 @@ def register():
             referrer = User.query.filter_by(referral_code=data.get('referral_code')).first()
             if referrer:
                 user.referred_by = referrer.id
+                record_referral(referrer.id)
         
         db.session.add(user)
+        db.session.flush()
+        record_referral_path(user.id, referrer.id if referrer else None)
+        if referrer:
+            mark_partner_metrics_stale(*ancestor_ids(user.id))
+        record_activity(
+            'user_registration',
+            user_id=user.id,
+            user_name=user.full_name,
+            subject_id=referrer.id if referrer else None,
+            referral_code=user.referral_code,
+            role=role
+        )
         db.session.commit()
+        if referrer:
+            invalidate_leaderboard()
         
         # Award referral bonus to referrer if applicable
         if referrer:
-            # Award 1 point as referral bonus
+            # Award 1 point as referral bonus (1 point = 0.30)
             bonus_points = 1
-            referrer.points_balance += bonus_points
-            referrer.total_points_earned += bonus_points
-            
-            # Update total earnings (1 point = 0.30)
             bonus_amount = 0.30
-            referrer.total_earnings += bonus_amount
             
-            # Create referral bonus transaction
-            transaction = Transaction(
-                user_id=referrer.id,
-                type=TransactionType.REFERRAL_BONUS,
-                status=TransactionStatus.COMPLETED,
-                description=f"Referral bonus for {user.full_name}",
+            ledger.post(
+                referrer.id,
+                TransactionType.REFERRAL_BONUS,
+                points=bonus_points,
                 amount=bonus_amount,
-                points_amount=bonus_points
+                description=f"Referral bonus for {user.full_name}"
             )
-            
-            db.session.add(transaction)
             db.session.commit()
         
         # Create access token
@@ -96,6 +113,7 @@ def register():
         return jsonify({'message': 'Registration failed', 'error': str(e)}), 500
 
 @auth_bp.route('/login', methods=['POST'])
+@rate_limit('10/minute', per='ip')
 def login():
     try:
         data = request.get_json()
@@ -128,6 +146,7 @@ def login():
 
 @auth_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@ledger_etag('profile')
 def get_profile():
     try:
         current_user_id = int(get_jwt_identity())
@@ -146,6 +165,7 @@ def get_profile():
         return jsonify({'message': 'Failed to fetch profile', 'error': str(e)}), 500
 
 @auth_bp.route('/forgot-password', methods=['POST'])
+@rate_limit('5/hour', per='ip')
 def forgot_password():
     try:
         data = request.get_json()
@@ -217,11 +237,10 @@ MyFigPoint Team
         # Send email (in development, this might fail if email settings aren't configured)
         email_sent = emailer.send_email(email, subject, body, html_body)
         
-        # Always print the link to the server console for debugging/testing
-        print(f"----------------------------------------------------------------")
-        print(f"PASSWORD RESET LINK for {email}:")
-        print(f"{reset_link}")
-        print(f"----------------------------------------------------------------")
+        # The link is logged at debug level only, for testing without a mail server
+        if not email_sent:
+            logger.warning("Password reset email to %s was not sent", email)
+        logger.debug("Password reset link for %s: %s", email, reset_link)
         
         # For development purposes, we'll return the token so you can test manually
         # In production, you should only return a success message
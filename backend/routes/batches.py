@@ -1,10 +1,11 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, request, jsonify, send_file, current_app
 from backend.extensions import db
 from backend.models.user import User, UserRole
 from backend.models.batch import Batch
 from backend.models.reward_code import RewardCode
-from backend.utils.helpers import generate_reward_code
 from backend.utils.admin_auth import admin_required
+from backend.utils.code_generation import create_reward_codes
+from backend.utils.batch_purge import batch_purger, purge_batch
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import csv
 import io
@@ -17,7 +18,7 @@ batches_bp = Blueprint('batches', __name__)
 @admin_required
 def list_batches():
     try:
-        batches = Batch.query.order_by(Batch.created_at.desc()).all()
+        batches = Batch.query.filter_by(deleted_at=None).order_by(Batch.created_at.desc()).all()
         return jsonify({
             'batches': [batch.to_dict() for batch in batches]
         }), 200
@@ -57,33 +58,75 @@ def create_batch():
 @admin_required
 def get_batch(batch_id):
     try:
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
-            
-        codes = [code.to_dict() for code in batch.codes]
+        
+        # Only the first page of codes; the rest come from /<batch_id>/codes
+        codes = paginate_batch_codes(batch_id)
         
         return jsonify({
             'batch': batch.to_dict(),
-            'codes': codes
+            'codes': [code.to_dict() for code in codes.items],
+            'codes_total': codes.total,
+            'codes_pages': codes.pages
         }), 200
     except Exception as e:
         return jsonify({'message': 'Failed to fetch batch details', 'error': str(e)}), 500
 
+@batches_bp.route('/<int:batch_id>/codes', methods=['GET'])
+@jwt_required()
+@admin_required
+def get_batch_codes(batch_id):
+    try:
+        if not Batch.get_live(batch_id):
+            return jsonify({'message': 'Batch not found'}), 404
+        
+        page = request.args.get('page', 1, type=int)
+        per_page = min(request.args.get('per_page', 50, type=int), 500)
+        status = request.args.get('status')  # 'used' or 'unused'
+        
+        codes = paginate_batch_codes(batch_id, page, per_page, status)
+        
+        return jsonify({
+            'codes': [code.to_dict() for code in codes.items],
+            'total': codes.total,
+            'pages': codes.pages,
+            'current_page': page
+        }), 200
+    except Exception as e:
+        return jsonify({'message': 'Failed to fetch batch codes', 'error': str(e)}), 500
+
+def paginate_batch_codes(batch_id, page=1, per_page=50, status=None):
+    query = RewardCode.query.filter_by(batch_id=batch_id)
+    if status == 'used':
+        query = query.filter_by(is_used=True)
+    elif status == 'unused':
+        query = query.filter_by(is_used=False)
+    return query.order_by(RewardCode.id).paginate(page=page, per_page=per_page, error_out=False)
+
 @batches_bp.route('/<int:batch_id>', methods=['DELETE'])
 @jwt_required()
 @admin_required
 def delete_batch(batch_id):
     try:
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
-            
-        # The relationship is set to cascade delete codes
-        db.session.delete(batch)
+        
+        # Retire the batch first (its codes stop working at once), so a purge cut short
+        # by a crash is still found and finished by the background purger
+        batch.deleted_at = datetime.utcnow()
         db.session.commit()
+
+        # ?soft=1 purges it in the background
+        if request.args.get('soft') in ('1', 'true'):
+            batch_purger.enqueue(current_app._get_current_object(), batch_id)
+            return jsonify({'message': 'Batch retired; its codes will be deleted in the background'}), 202
+
+        deleted = purge_batch(batch_id)
         
-        return jsonify({'message': 'Batch and all associated codes deleted successfully'}), 200
+        return jsonify({'message': 'Batch and all associated codes deleted successfully', 'codes_deleted': deleted}), 200
     except Exception as e:
         return jsonify({'message': 'Failed to delete batch', 'error': str(e)}), 500
 
@@ -92,7 +135,7 @@ def delete_batch(batch_id):
 @admin_required
 def generate_codes_for_batch(batch_id):
     try:
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
             
@@ -102,26 +145,11 @@ def generate_codes_for_batch(batch_id):
         if count <= 0 or count > 5000:
             return jsonify({'message': 'Count must be between 1 and 5000'}), 400
             
-        codes_list = []
-        for _ in range(count):
-            code_str = generate_reward_code()
-            # Double check if code exists already (rare but possible)
-            while RewardCode.query.filter_by(code=code_str).first():
-                code_str = generate_reward_code()
-                
-            reward_code = RewardCode(
-                code=code_str,
-                point_value=batch.point_value,
-                batch_id=batch.id
-            )
-            db.session.add(reward_code)
-            codes_list.append(code_str)
-            
-        batch.count += count
-        db.session.commit()
+        batch_name = batch.name
+        create_reward_codes(batch, count)
         
         return jsonify({
-            'message': f'Successfully generated {count} codes for batch {batch.name}',
+            'message': f'Successfully generated {count} codes for batch {batch_name}',
             'count': count
         }), 201
     except Exception as e:
@@ -132,7 +160,7 @@ def generate_codes_for_batch(batch_id):
 @admin_required
 def export_batch(batch_id):
     try:
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
             
@@ -2,17 +2,26 @@ from flask import Blueprint, request, jsonify
 from backend.app import db
 from backend.models.user import User, UserRole
 from backend.models.reward_code import RewardCode
+from backend.models.batch import Batch
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
-from backend.utils.helpers import generate_reward_code
+from backend.utils.helpers import generate_reward_code, encode_reward_code
 from backend.utils.decorators import partner_restricted
+from backend.utils.idempotency import idempotent
+from backend.utils.rate_limit import rate_limit
+from backend.utils.code_filter import code_might_exist
+from backend.utils.code_rollup import record_redemptions, redemption_series, batch_totals
+from backend.utils import ledger
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
+from datetime import datetime, timedelta
 import re
 
 codes_bp = Blueprint('codes', __name__)
 
 @codes_bp.route('/redeem', methods=['POST'])
 @jwt_required()
+@rate_limit('10/minute')
+@rate_limit('100/hour')
+@idempotent
 @partner_restricted
 def redeem_code():
     try:
@@ -32,8 +41,10 @@ def redeem_code():
         if not re.match(r'^[A-Z]{5}[0-9]{3}$', code_value):
             return jsonify({'message': 'Invalid code format. Code must be 5 uppercase letters followed by 3 digits (e.g., ABCDE123)'}), 400
         
-        # Find the code
-        reward_code = RewardCode.query.filter_by(code=code_value).first()
+        # Find the code; most guesses are rejected by the in-memory index
+        if not code_might_exist(code_value):
+            return jsonify({'message': 'Invalid code'}), 404
+        reward_code = RewardCode.live().filter(RewardCode.code_key == encode_reward_code(code_value)).first()
         
         if not reward_code:
             return jsonify({'message': 'Invalid code'}), 404
@@ -41,34 +52,28 @@ def redeem_code():
         if reward_code.is_used:
             return jsonify({'message': 'Code has already been used'}), 400
         
-        # Mark code as used
-        reward_code.is_used = True
-        reward_code.used_by = current_user_id
-        reward_code.used_at = datetime.utcnow()
+        # Mark code as used; of two concurrent redemptions only one claims it
+        if not RewardCode.claim([reward_code.id], current_user_id):
+            return jsonify({'message': 'Code has already been used'}), 400
+        Batch.adjust_counts(reward_code.batch_id, used=1)
         
         # Add points to user
         # Convert float point value to integer, rounding to nearest integer
         raw_points = round(reward_code.point_value)
         points_to_add = max(1, raw_points)  # Ensure at least 1 point if any points are awarded
-        user.points_balance += points_to_add
-        user.total_points_earned += points_to_add
         
-        # Calculate and add USD value to total earnings (1 point = $0.30)
+        # Calculate USD value for total earnings (1 point = $0.30)
         usd_value = points_to_add * 0.30
-        user.total_earnings += usd_value
+        record_redemptions({reward_code.batch_id: (1, points_to_add)})
         
-        # Create transaction record
-        transaction = Transaction(
-            user_id=current_user_id,
-            type=TransactionType.CODE_REDEMPTION,
-            status=TransactionStatus.COMPLETED,
-            description=f"Redeemed code {code_value}",
+        ledger.post(
+            current_user_id,
+            TransactionType.CODE_REDEMPTION,
+            points=points_to_add,
             amount=usd_value,  # Store the USD value in the amount field
-            points_amount=points_to_add,  # Use the integer value
+            description=f"Redeemed code {code_value}",
             reference_id=reward_code.id
         )
-        
-        db.session.add(transaction)
         db.session.commit()
         
         return jsonify({
@@ -105,9 +110,14 @@ def get_redemption_history():
 
 @codes_bp.route('/validate/<code>', methods=['GET'])
 @jwt_required()
+@rate_limit('20/minute', scope='code_lookup')
+@rate_limit('60/minute', per='ip', scope='code_lookup')
 def validate_code(code):
     try:
-        reward_code = RewardCode.query.filter_by(code=code.upper()).first()
+        code_key = encode_reward_code(code)
+        if code_key is None or not code_might_exist(code.upper()):
+            return jsonify({'valid': False, 'message': 'Invalid code'}), 404
+        reward_code = RewardCode.live().filter(RewardCode.code_key == code_key).first()
         
         if not reward_code:
             return jsonify({'valid': False, 'message': 'Invalid code'}), 404
@@ -127,9 +137,14 @@ def validate_code(code):
 
 @codes_bp.route('/info/<code>', methods=['GET'])
 @jwt_required()
+@rate_limit('20/minute', scope='code_lookup')
+@rate_limit('60/minute', per='ip', scope='code_lookup')
 def get_code_info(code):
     try:
-        reward_code = RewardCode.query.filter_by(code=code.upper()).first()
+        code_key = encode_reward_code(code)
+        if code_key is None or not code_might_exist(code.upper()):
+            return jsonify({'valid': False, 'message': 'Invalid code'}), 404
+        reward_code = RewardCode.live().filter(RewardCode.code_key == code_key).first()
         
         if not reward_code:
             return jsonify({'valid': False, 'message': 'Invalid code'}), 404
@@ -207,6 +222,7 @@ def delete_code(code_id):
         if code.is_used:
             return jsonify({'message': 'Cannot delete used codes'}), 400
         
+        Batch.adjust_counts(code.batch_id, codes=-1)
         db.session.delete(code)
         db.session.commit()
         
@@ -226,26 +242,24 @@ def get_code_stats():
         if user.role != UserRole.ADMIN:
             return jsonify({'message': 'Access denied'}), 403
         
-        total_codes = RewardCode.query.count()
-        used_codes = RewardCode.query.filter_by(is_used=True).count()
-        unused_codes = total_codes - used_codes
-        
-        # Get stats by batch
-        batch_stats = db.session.query(
-            RewardCode.batch_id,
-            db.func.count(RewardCode.id).label('total'),
-            db.func.sum(db.case((RewardCode.is_used == True, 1), else_=0)).label('used')
-        ).group_by(RewardCode.batch_id).all()
+        # Read from the per-batch counters; no scan of reward_codes
+        batch_stats = db.session.query(Batch.id, Batch.count, Batch.used_count).filter(
+            Batch.deleted_at.is_(None)
+        ).all()
         
         batch_data = []
-        for batch in batch_stats:
+        for batch_id, total, used in batch_stats:
             batch_data.append({
-                'batch_id': batch.batch_id,
-                'total': batch.total,
-                'used': batch.used,
-                'unused': batch.total - batch.used
+                'batch_id': batch_id,
+                'total': total,
+                'used': used,
+                'unused': total - used
             })
         
+        total_codes = sum(batch['total'] for batch in batch_data)
+        used_codes = sum(batch['used'] for batch in batch_data)
+        unused_codes = total_codes - used_codes
+        
         return jsonify({
             'total_codes': total_codes,
             'used_codes': used_codes,
@@ -256,3 +270,52 @@ def get_code_stats():
     except Exception as e:
         return jsonify({'message': 'Failed to fetch code stats', 'error': str(e)}), 500
 
+@codes_bp.route('/admin/analytics', methods=['GET'])
+@jwt_required()
+def get_code_analytics():
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
+        
+        # Check if user is admin
+        if user.role != UserRole.ADMIN:
+            return jsonify({'message': 'Access denied'}), 403
+        
+        granularity = request.args.get('granularity', 'hour')
+        if granularity not in ('hour', 'day'):
+            return jsonify({'message': 'granularity must be hour or day'}), 400
+        days = max(1, min(request.args.get('days', 7 if granularity == 'hour' else 30, type=int), 90))
+        batch_id = request.args.get('batch_id', type=int)
+        
+        # Window ends with the current (partial) hour
+        end = datetime.utcnow().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        start = end - timedelta(days=days)
+        
+        window_totals = batch_totals(start, end)
+        batches = Batch.query.filter(Batch.deleted_at.is_(None)).order_by(Batch.created_at.desc()).all()
+        batch_data = []
+        for batch in batches:
+            if batch_id is not None and batch.id != batch_id:
+                continue
+            redemptions, points = window_totals.get(batch.id, (0, 0.0))
+            batch_data.append({
+                'batch_id': batch.id,
+                'name': batch.name,
+                'total_codes': batch.count,
+                'used_codes': batch.used_count,
+                'redemptions_in_window': redemptions,
+                'points_in_window': points
+            })
+        
+        return jsonify({
+            'granularity': granularity,
+            'start': start.isoformat(),
+            'end': end.isoformat(),
+            'batch_id': batch_id,
+            'batches': batch_data,
+            'series': redemption_series(start, end, granularity, batch_id)
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to fetch code analytics', 'error': str(e)}), 500
+
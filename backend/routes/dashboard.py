@@ -0,0 +1,112 @@
+from flask import Blueprint, jsonify
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.task import Task, UserTask
+from backend.models.transaction import Transaction
+from backend.models.notification import Notification
+from backend.routes.transactions import get_transaction_totals
+from backend.utils.helpers import get_tier_level
+from backend.utils.decorators import partner_restricted
+from backend.utils.http_cache import make_etag, not_modified, request_matches
+from flask_jwt_extended import jwt_required, get_jwt_identity
+
+dashboard_bp = Blueprint('dashboard', __name__)
+
+RECENT_TRANSACTIONS_LIMIT = 4
+DASHBOARD_TASKS_LIMIT = 3
+UNREAD_NOTIFICATIONS_LIMIT = 20
+
+def bootstrap_etag(user):
+    """
+    Validator for the bootstrap payload, derived before building it.
+
+    The user's ledger version moves with every balance, transaction,
+    notification and profile change. Tasks and the user's task statuses
+    aren't versioned, so one aggregate query over their counts, highest
+    ids and latest updated_at stands in for them.
+    """
+    task_state = db.session.query(
+        db.session.query(db.func.count(Task.id)).scalar_subquery(),
+        db.session.query(db.func.max(Task.id)).scalar_subquery(),
+        db.session.query(db.func.max(Task.updated_at)).scalar_subquery(),
+        db.session.query(db.func.count(UserTask.id)).filter(UserTask.user_id == user.id).scalar_subquery(),
+        db.session.query(db.func.max(UserTask.updated_at)).filter(UserTask.user_id == user.id).scalar_subquery()
+    ).one()
+    return f'bootstrap-{user.id}-{user.ledger_version}-{make_etag(list(task_state))}'
+
+@dashboard_bp.route('/bootstrap', methods=['GET'])
+@jwt_required()
+@partner_restricted
+def get_dashboard_bootstrap():
+    try:
+        current_user_id = int(get_jwt_identity())
+        # Already loaded by partner_restricted, so this comes from the identity map
+        user = User.query.get(current_user_id)
+
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+
+        # Answer a revalidation before running any of the queries below
+        etag = bootstrap_etag(user)
+        if request_matches(etag):
+            return not_modified(etag)
+
+        # Per-type totals (one grouped query)
+        summary = get_transaction_totals(current_user_id)
+
+        # Most recent activity
+        recent_transactions = Transaction.query.filter_by(user_id=current_user_id).order_by(
+            Transaction.created_at.desc()
+        ).limit(RECENT_TRANSACTIONS_LIMIT).all()
+
+        # Latest active tasks with the user's status for just those tasks
+        tasks = Task.query.filter_by(is_active=True).order_by(
+            Task.created_at.desc()
+        ).limit(DASHBOARD_TASKS_LIMIT).all()
+
+        user_task_map = {}
+        if tasks:
+            user_task_rows = db.session.query(UserTask.task_id, UserTask.status).filter(
+                UserTask.user_id == current_user_id,
+                UserTask.task_id.in_([task.id for task in tasks])
+            ).all()
+            user_task_map = {task_id: status for task_id, status in user_task_rows}
+
+        task_list = []
+        for task in tasks:
+            task_dict = task.to_dict()
+            task_dict['user_status'] = user_task_map.get(task.id, 'available')
+            task_list.append(task_dict)
+
+        # Unread notifications; only count separately when the page is full
+        unread = Notification.query.filter_by(user_id=current_user_id, is_read=False).order_by(
+            Notification.created_at.desc()
+        ).limit(UNREAD_NOTIFICATIONS_LIMIT).all()
+
+        if len(unread) < UNREAD_NOTIFICATIONS_LIMIT:
+            unread_count = len(unread)
+        else:
+            unread_count = Notification.query.filter_by(user_id=current_user_id, is_read=False).count()
+
+        response = jsonify({
+            'user': user.to_dict(),
+            'points': {
+                'points_balance': user.points_balance,
+                'total_points_earned': user.total_points_earned,
+                'total_points_withdrawn': user.total_points_withdrawn,
+                'tier_level': get_tier_level(user.points_balance)
+            },
+            'summary': summary,
+            'recent_transactions': [t.to_dict() for t in recent_transactions],
+            'tasks': task_list,
+            'notifications': {
+                'notifications': [n.to_dict() for n in unread],
+                'unread_count': unread_count
+            }
+        })
+        response.set_etag(etag, weak=True)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to load dashboard', 'error': str(e)}), 500
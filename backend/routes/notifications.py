@@ -1,7 +1,8 @@
 from flask import Blueprint, request, jsonify
 from backend.app import db
 from backend.models.user import User, UserRole
-from backend.models.notification import Notification, NotificationType
+from backend.models.notification import Notification, NotificationType, serialize_notification
+from backend.utils.ledger_version import ledger_etag, bump_ledger_version
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 notifications_bp = Blueprint('notifications', __name__)
@@ -15,17 +16,17 @@ def get_notifications():
         per_page = request.args.get('per_page', 20, type=int)
         unread_only = request.args.get('unread_only', 'false').lower() == 'true'
 
-        query = Notification.query.filter_by(user_id=current_user_id)
+        query = db.session.query(*serialize_notification.columns).filter(Notification.user_id == current_user_id)
 
         if unread_only:
-            query = query.filter_by(is_read=False)
+            query = query.filter(Notification.is_read == False)
 
         notifications = query.order_by(Notification.created_at.desc()).paginate(
             page=page, per_page=per_page, error_out=False
         )
 
         return jsonify({
-            'notifications': [n.to_dict() for n in notifications.items],
+            'notifications': serialize_notification.many(notifications.items),
             'total': notifications.total,
             'pages': notifications.pages,
             'current_page': page,
@@ -69,6 +70,10 @@ def mark_all_as_read():
             user_id=current_user_id,
             is_read=False
         ).update({'is_read': True})
+        
+        # Bulk updates skip the ORM events, so move the version explicitly
+        if updated_count:
+            bump_ledger_version(current_user_id)
 
         db.session.commit()
 
@@ -81,6 +86,7 @@ def mark_all_as_read():
 
 @notifications_bp.route('/unread-count', methods=['GET'])
 @jwt_required()
+@ledger_etag('unread-count')
 def get_unread_count():
     try:
         current_user_id = int(get_jwt_identity())
@@ -2,10 +2,13 @@ from flask import Blueprint, request, jsonify
 from backend.app import db
 from backend.models.user import User, UserRole
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
-from backend.models.reward_code import RewardCode
 from backend.models.batch import Batch
-from backend.utils.helpers import generate_batch_id, generate_reward_code
+from backend.utils.helpers import generate_batch_id
+from backend.utils.code_generation import create_reward_codes
 from backend.utils.partner_approval import require_partner_approval
+from backend.utils.referral_leaderboard import WINDOWS, get_leaderboard, find_rank
+from backend.utils.partner_metrics import get_partner_snapshot
+from backend.utils.activity import record_activity
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 partners_bp = Blueprint('partners', __name__)
@@ -28,29 +31,14 @@ def get_partner_stats():
         if not user.is_approved:
             return jsonify({'message': 'Partner account pending approval. Please contact admin.'}), 403
         
-        # Get partner statistics
-        # Count referred users
-        referred_count = User.query.filter_by(referred_by=current_user_id).count()
-        
-        # Calculate total earnings from referrals
-        referral_earnings = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
-        # Calculate total points earned
-        referral_points = db.session.query(db.func.sum(Transaction.points_amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
+        # Maintained counters, served from the cached partner snapshot
+        snapshot = get_partner_snapshot(current_user_id)
         
         return jsonify({
-            'referred_users_count': referred_count,
-            'total_earnings': abs(referral_earnings),
-            'total_points_earned': abs(referral_points),
-            'partner_since': user.created_at.isoformat() if user.created_at else None
+            'referred_users_count': snapshot['referred_users_count'],
+            'total_earnings': snapshot['total_earnings'],
+            'total_points_earned': snapshot['total_points_earned'],
+            'partner_since': snapshot['partner_since']
         }), 200
         
     except Exception as e:
@@ -109,47 +97,19 @@ def get_commission_rates():
         if not user.is_approved:
             return jsonify({'message': 'Partner account pending approval. Please contact admin.'}), 403
         
-        # Commission rates based on tier
-        commission_rates = {
-            'bronze': {
-                'referral_bonus': 5.0,  # percentage
-                'monthly_payout': 'Net 30'
-            },
-            'silver': {
-                'referral_bonus': 7.5,
-                'monthly_payout': 'Net 15'
-            },
-            'gold': {
-                'referral_bonus': 10.0,
-                'monthly_payout': 'Net 7'
-            },
-            'platinum': {
-                'referral_bonus': 15.0,
-                'monthly_payout': 'Net 7'
-            }
-        }
-        
-        # Determine partner tier based on referred users count
-        referred_count = User.query.filter_by(referred_by=current_user_id).count()
-        if referred_count >= 1000:
-            tier = 'platinum'
-        elif referred_count >= 500:
-            tier = 'gold'
-        elif referred_count >= 100:
-            tier = 'silver'
-        else:
-            tier = 'bronze'
+        # Tier from the configured tier table and the maintained referral count
+        snapshot = get_partner_snapshot(current_user_id)
+        tier = snapshot['tier']
+        next_tier = snapshot['next_tier']
         
         return jsonify({
-            'current_tier': tier,
-            'referred_users_count': referred_count,
-            'commission_rate': commission_rates[tier]['referral_bonus'],
-            'payout_terms': commission_rates[tier]['monthly_payout'],
-            'next_tier_requirements': {
-                'silver': 100,
-                'gold': 500,
-                'platinum': 1000
-            }
+            'current_tier': tier['name'],
+            'referred_users_count': snapshot['referred_users_count'],
+            'commission_rate': tier['referral_bonus'],
+            'payout_terms': tier['monthly_payout'],
+            'next_tier': next_tier['name'] if next_tier else None,
+            'referrals_to_next_tier': next_tier['min_referrals'] - snapshot['referred_users_count'] if next_tier else None,
+            'next_tier_requirements': snapshot['tier_requirements']
         }), 200
         
     except Exception as e:
@@ -173,33 +133,60 @@ def get_partner_dashboard():
         if not user.is_approved:
             return jsonify({'message': 'Partner account pending approval. Please contact admin.'}), 403
         
-        # Get partner statistics
-        # Count referred users
-        referred_count = User.query.filter_by(referred_by=current_user_id).count()
+        # Counters, tier and the multi-level network from the cached partner snapshot
+        snapshot = get_partner_snapshot(current_user_id)
+        network = snapshot['network']
+        
+        return jsonify({
+            'referred_users_count': snapshot['referred_users_count'],
+            'total_earnings': snapshot['total_earnings'],
+            'total_points_earned': snapshot['total_points_earned'],
+            'partner_since': snapshot['partner_since'],
+            'current_tier': snapshot['tier']['name'],
+            'network_size': network['network_size'],
+            'network_earnings': network['network_earnings'],
+            'network_levels': network['levels']
+        }), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to fetch partner dashboard', 'error': str(e)}), 500
+
+@partners_bp.route('/leaderboard', methods=['GET'])
+@jwt_required()
+def get_partner_leaderboard():
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
+        
+        if not user:
+            return jsonify({'message': 'User not found'}), 404
+            
+        # Approved partners and admins only
+        if user.role == UserRole.PARTNER:
+            if not user.is_approved:
+                return jsonify({'message': 'Partner account pending approval. Please contact admin.'}), 403
+        elif user.role != UserRole.ADMIN:
+            return jsonify({'message': 'Access denied. Partner access required.'}), 403
         
-        # Calculate total earnings from referrals
-        referral_earnings = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
+        window = request.args.get('window', 'all')
+        if window not in WINDOWS:
+            return jsonify({'message': f'window must be one of: {", ".join(WINDOWS)}'}), 400
+        limit = request.args.get('limit', 10, type=int)
         
-        # Calculate total points earned
-        referral_points = db.session.query(db.func.sum(Transaction.points_amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
+        # Partners see names and counts, not other users' contact details
+        public_fields = ('rank', 'id', 'full_name', 'role', 'referral_count')
+        leaderboard = [{field: entry[field] for field in public_fields} for entry in get_leaderboard(window, limit)]
+        own_entry = find_rank(current_user_id, window)
         
         return jsonify({
-            'referred_users_count': referred_count,
-            'total_earnings': abs(referral_earnings),
-            'total_points_earned': abs(referral_points),
-            'partner_since': user.created_at.isoformat() if user.created_at else None
+            'window': window,
+            'leaderboard': leaderboard,
+            'your_rank': own_entry['rank'] if own_entry else None,
+            'your_referral_count': own_entry['referral_count'] if own_entry else (user.referral_count if window == 'all' else None)
         }), 200
         
     except Exception as e:
-        return jsonify({'message': 'Failed to fetch partner dashboard', 'error': str(e)}), 500
+        return jsonify({'message': 'Failed to fetch referral leaderboard', 'error': str(e)}), 500
 
 @partners_bp.route('/admin/promote', methods=['POST'])
 @jwt_required()
@@ -297,6 +284,7 @@ def approve_partner():
         
         # Approve partner
         user.is_approved = True
+        record_activity('partner_approved', user_id=user.id, user_name=user.full_name, actor_id=current_user_id)
         
         db.session.commit()
         
@@ -336,6 +324,7 @@ def deny_partner():
         # Deny partner (demote back to user)
         user.role = UserRole.USER
         user.is_approved = False
+        record_activity('partner_denied', user_id=user.id, user_name=user.full_name, actor_id=current_user_id)
         
         db.session.commit()
         
@@ -416,7 +405,7 @@ def generate_partner_codes():
         if not batch_id:
             return jsonify({'message': 'Batch ID is required'}), 400
             
-        batch = Batch.query.get(batch_id)
+        batch = Batch.get_live(batch_id)
         if not batch:
             return jsonify({'message': 'Batch not found'}), 404
 
@@ -427,27 +416,13 @@ def generate_partner_codes():
         if count <= 0 or count > 10000:
             return jsonify({'message': 'Count must be between 1 and 10,000'}), 400
         
-        # Point value is taken from the batch
-        point_value = batch.point_value
-        
-        # Generate codes
-        codes = []
-        for _ in range(count):
-            code = generate_reward_code()
-            reward_code = RewardCode(
-                code=code,
-                point_value=point_value,
-                batch_id=batch.id
-            )
-            db.session.add(reward_code)
-            codes.append(code)
-        
-        batch.count += count
-        db.session.commit()
+        # Generate codes (committed by create_reward_codes)
+        batch_id, batch_name = batch.id, batch.name
+        codes = create_reward_codes(batch, count)
         
         return jsonify({
-            'message': f'Successfully generated {count} codes for batch {batch.name}',
-            'batch_id': batch.id,
+            'message': f'Successfully generated {count} codes for batch {batch_name}',
+            'batch_id': batch_id,
             'codes': codes[:10],
             'total_generated': count
         }), 201
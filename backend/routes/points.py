@@ -1,16 +1,24 @@
+import logging
 from flask import Blueprint, request, jsonify
 from backend.extensions import db
 from backend.models.user import User, UserRole
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
 from backend.utils.helpers import points_to_usd, get_tier_level
-from backend.utils.emailer import Emailer
+from backend.utils.mail_queue import queue_email
+from backend.utils.withdrawal_stats import invalidate_withdrawal_stats
 from backend.utils.decorators import partner_restricted
+from backend.utils.idempotency import idempotent
+from backend.utils.ledger_version import ledger_etag
+from backend.utils import ledger
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+logger = logging.getLogger(__name__)
+
 points_bp = Blueprint('points', __name__)
 
 @points_bp.route('/balance', methods=['GET'])
 @jwt_required()
+@ledger_etag('points-balance')
 def get_points_balance():
     try:
         current_user_id = int(get_jwt_identity())
@@ -57,6 +65,7 @@ def get_points_history():
 
 @points_bp.route('/withdraw', methods=['POST'])
 @jwt_required()
+@idempotent
 @partner_restricted
 def withdraw_points():
     try:
@@ -133,58 +142,46 @@ def withdraw_points():
 
         # Convert points to USD
         usd_amount = points_to_usd(points)
-        
-        # Store original balance for rollback if needed
-        original_balance = user.points_balance
-        original_withdrawn_points = user.total_points_withdrawn
-        original_withdrawn_amount = user.total_withdrawn
-
-        # Deduct points and amount from user balance
-        user.points_balance -= points
-        user.total_points_withdrawn += points
-        user.total_earnings -= usd_amount
-        user.total_withdrawn += usd_amount
-
-        # Create pending withdrawal transaction
+
+        # Build the description (validating the gift card type before anything is posted)
         description = f"Withdrawal request: {points} points (${usd_amount:.2f}) via {method}"
         if method == 'bank':
             description += f" to {user.bank_name} account ending in {user.account_number[-4:] if user.account_number else '****'}"
         elif method == 'gift_card':
             gift_card_type = data.get('gift_card_type', 'gift card')
             if not gift_card_type or not isinstance(gift_card_type, str):
-                # Rollback changes
-                user.points_balance = original_balance
-                user.total_points_withdrawn = original_withdrawn_points
-                user.total_withdrawn = original_withdrawn_amount
                 return jsonify({'message': 'Invalid gift card type'}), 400
             description += f" as {gift_card_type}"
 
-        transaction = Transaction(
-            user_id=current_user_id,
-            type=TransactionType.POINT_WITHDRAWAL,
-            status=TransactionStatus.PENDING,
-            description=description,
-            amount=-usd_amount,
-            points_amount=-points,
-            reference_id=data.get('gift_card_type')
-        )
+        # Deduct points and amount from user balance as a pending withdrawal;
+        # the balance check is repeated atomically in the UPDATE
+        try:
+            transaction = ledger.post(
+                current_user_id,
+                TransactionType.POINT_WITHDRAWAL,
+                points=-points,
+                amount=-usd_amount,
+                description=description,
+                status=TransactionStatus.PENDING,
+                reference_id=data.get('gift_card_type'),
+                require_funds=True
+            )
+        except ledger.InsufficientFundsError:
+            db.session.rollback()
+            return jsonify({'message': 'Insufficient points balance'}), 400
 
-        db.session.add(transaction)
         db.session.commit()
+        invalidate_withdrawal_stats()
 
-        # Send email notification
-        emailer = Emailer()
-        email_sent = emailer.send_withdrawal_request_notification(
+        # Queue email notification; the worker logs failed sends
+        queue_email(
+            'send_withdrawal_request_notification',
             user_email=user.email,
             user_name=user.full_name,
             points=points,
             amount=usd_amount,
             method=method
         )
-        
-        # Log email sending status (for debugging)
-        if not email_sent:
-            print(f"Warning: Failed to send withdrawal notification email to {user.email}")
 
         current_tier = get_tier_level(user.points_balance + points)  # Calculate tier before deduction
         return jsonify({
@@ -199,7 +196,7 @@ def withdraw_points():
 
     except Exception as e:
         # Log the error for debugging
-        print(f"Error processing withdrawal: {str(e)}")
+        logger.exception("Error processing withdrawal")
         
         # Attempt to rollback any changes if session is still active
         try:
@@ -3,12 +3,16 @@ from backend.extensions import db
 from backend.models.user import User, UserRole
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
 from backend.utils.decorators import partner_restricted
+from backend.utils.ledger_version import ledger_etag
+from backend.utils.referral_leaderboard import WINDOWS, get_leaderboard
+from backend.utils.referral_tree import DEFAULT_MAX_DEPTH, downline_summary
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 referrals_bp = Blueprint('referrals', __name__)
 
 @referrals_bp.route('/stats', methods=['GET'])
 @jwt_required()
+@ledger_etag('referral-stats')
 @partner_restricted
 def get_referral_stats():
     try:
@@ -18,28 +22,12 @@ def get_referral_stats():
         if not user:
             return jsonify({'message': 'User not found'}), 404
         
-        # Count referred users
-        referred_count = User.query.filter_by(referred_by=current_user_id).count()
-        
-        # Calculate referral earnings
-        referral_earnings = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
-        # Calculate referral points
-        referral_points = db.session.query(db.func.sum(Transaction.points_amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
+        # Maintained on registration and by the ledger on referral bonuses
         return jsonify({
             'referral_code': user.referral_code,
-            'referred_users_count': referred_count,
-            'total_referral_earnings': abs(referral_earnings),
-            'total_referral_points': abs(referral_points)
+            'referred_users_count': user.referral_count,
+            'total_referral_earnings': abs(user.referral_earnings or 0.0),
+            'total_referral_points': abs(user.referral_points_earned or 0.0)
         }), 200
         
     except Exception as e:
@@ -142,40 +130,54 @@ def get_top_referrers():
         if user.role != UserRole.ADMIN:
             return jsonify({'message': 'Access denied'}), 403
         
-        from sqlalchemy import func
-        
-        # Get users with the most referrals using a cleaner query
-        referrer_alias = db.aliased(User)
-        referred_alias = db.aliased(User)
-        
-        top_referrers = db.session.query(
-            referrer_alias,
-            func.count(referred_alias.id).label('referral_count')
-        ).join(
-            referred_alias, 
-            referred_alias.referred_by == referrer_alias.id
-        ).group_by(
-            referrer_alias.id
-        ).order_by(
-            db.desc('referral_count')
-        ).limit(10).all()
-        
-        referrer_data = []
-        for user, count in top_referrers:
-            referrer_data.append({
-                'id': user.id,
-                'full_name': user.full_name,
-                'email': user.email,
-                'referral_code': user.referral_code,
-                'referral_count': count,
-                'total_earnings': user.total_earnings
-            })
+        window = request.args.get('window', 'all')
+        if window not in WINDOWS:
+            return jsonify({'message': f'window must be one of: {", ".join(WINDOWS)}'}), 400
+        limit = request.args.get('limit', 10, type=int)
         
-        return jsonify({'top_referrers': referrer_data}), 200
+        # Served from the cached leaderboard, not a self-join over all users
+        referrer_data = get_leaderboard(window, limit)
+        
+        return jsonify({'top_referrers': referrer_data, 'window': window}), 200
         
     except Exception as e:
         return jsonify({'message': 'Failed to fetch top referrers', 'error': str(e)}), 500
 
+@referrals_bp.route('/downline', methods=['GET'])
+@jwt_required()
+def get_downline():
+    try:
+        current_user_id = int(get_jwt_identity())
+        max_depth = max(1, min(request.args.get('max_depth', DEFAULT_MAX_DEPTH, type=int), 50))
+        
+        return jsonify(downline_summary(current_user_id, max_depth)), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to fetch referral network', 'error': str(e)}), 500
+
+@referrals_bp.route('/admin/downline/<int:user_id>', methods=['GET'])
+@jwt_required()
+def get_user_downline(user_id):
+    try:
+        current_user_id = int(get_jwt_identity())
+        user = User.query.get(current_user_id)
+        
+        # Check if user is admin
+        if user.role != UserRole.ADMIN:
+            return jsonify({'message': 'Access denied'}), 403
+        
+        if not User.query.get(user_id):
+            return jsonify({'message': 'User not found'}), 404
+        
+        max_depth = max(1, min(request.args.get('max_depth', DEFAULT_MAX_DEPTH, type=int), 50))
+        summary = downline_summary(user_id, max_depth)
+        summary['user_id'] = user_id
+        
+        return jsonify(summary), 200
+        
+    except Exception as e:
+        return jsonify({'message': 'Failed to fetch referral network', 'error': str(e)}), 500
+
 @referrals_bp.route('/users', methods=['GET'])
 @jwt_required()
 @partner_restricted
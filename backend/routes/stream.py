@@ -0,0 +1,116 @@
+import json
+import time
+from datetime import timedelta
+from flask import Blueprint, Response, current_app, jsonify, stream_with_context
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.notification import Notification
+from backend.utils.helpers import get_tier_level
+from backend.utils.pubsub import get_broker, user_channel, STREAM_TOKEN_SCOPE
+from flask_jwt_extended import create_access_token, get_jwt, get_jwt_identity, get_jwt_request_location, jwt_required
+
+stream_bp = Blueprint('stream', __name__)
+
+def format_event(event_name, data):
+    return f'event: {event_name}\ndata: {json.dumps(data, default=str)}\n\n'
+
+def load_snapshot(user_id):
+    """Current balance and unread count, read in a short transaction"""
+    try:
+        row = db.session.query(
+            User.points_balance, User.total_points_earned, User.total_points_withdrawn, User.total_earnings
+        ).filter(User.id == user_id).first()
+        unread_count = Notification.query.filter_by(user_id=user_id, is_read=False).count()
+    finally:
+        # Don't hold a pooled connection for the lifetime of the stream
+        db.session.remove()
+
+    if row is None:
+        return None
+
+    points_balance, total_points_earned, total_points_withdrawn, total_earnings = row
+    return {
+        'balance': {
+            'points_balance': points_balance,
+            'total_points_earned': total_points_earned,
+            'total_points_withdrawn': total_points_withdrawn,
+            'total_earnings': total_earnings,
+            'tier_level': get_tier_level(points_balance)
+        },
+        'unread_count': unread_count
+    }
+
+@stream_bp.route('/token', methods=['POST'])
+@jwt_required()
+def stream_token():
+    """
+    A token for ?jwt= on the event stream.
+
+    EventSource can't send headers, and a query string is written to access
+    logs, so browsers never put their session token there. This one expires
+    after SSE_TOKEN_SECONDS and opens nothing but the stream.
+    """
+    expires_in = current_app.config['SSE_TOKEN_SECONDS']
+    token = create_access_token(
+        identity=get_jwt_identity(),
+        additional_claims={'scope': STREAM_TOKEN_SCOPE},
+        expires_delta=timedelta(seconds=expires_in)
+    )
+    return jsonify({'token': token, 'expires_in': expires_in}), 200
+
+# Session tokens in the Authorization header, stream tokens (POST /token) as ?jwt=<token>
+@stream_bp.route('', methods=['GET'])
+@jwt_required(locations=['headers', 'query_string'])
+def stream_events():
+    if get_jwt_request_location() == 'query_string' and get_jwt().get('scope') != STREAM_TOKEN_SCOPE:
+        return jsonify({'message': 'Use a token from POST /api/stream/token in the query string', 'error': 'invalid_token'}), 401
+    try:
+        current_user_id = int(get_jwt_identity())
+        broker = get_broker()
+        if broker is None:
+            return jsonify({'message': 'Event stream is not available'}), 503
+
+        snapshot = load_snapshot(current_user_id)
+        if snapshot is None:
+            return jsonify({'message': 'User not found'}), 404
+
+        heartbeat = current_app.config['SSE_HEARTBEAT_SECONDS']
+        max_duration = current_app.config['SSE_MAX_STREAM_SECONDS']
+        subscription = broker.subscribe(user_channel(current_user_id))
+
+        def generate(last):
+            try:
+                # Initial state, so clients never need a separate fetch after (re)connecting
+                yield 'retry: 5000\n\n'
+                yield format_event('balance', last['balance'])
+                yield format_event('unread_count', {'unread_count': last['unread_count']})
+
+                # Close periodically so the client reconnects and workers get recycled
+                deadline = time.monotonic() + max_duration
+                while time.monotonic() < deadline:
+                    message = subscription.get(timeout=heartbeat)
+                    if message is None:
+                        yield ': keepalive\n\n'
+                        continue
+
+                    for notification in message.get('notifications', []):
+                        yield format_event('notification', notification)
+
+                    current = load_snapshot(current_user_id)
+                    if current is None:
+                        break
+                    if current['balance'] != last['balance']:
+                        yield format_event('balance', current['balance'])
+                    if current['unread_count'] != last['unread_count']:
+                        yield format_event('unread_count', {'unread_count': current['unread_count']})
+                    last = current
+            finally:
+                subscription.close()
+
+        response = Response(stream_with_context(generate(snapshot)), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    except Exception as e:
+        return jsonify({'message': 'Failed to open event stream', 'error': str(e)}), 500
@@ -3,6 +3,7 @@ from backend.extensions import db
 from backend.models.user import User, UserRole
 from backend.models.support_message import SupportMessage, MessageType, MessageStatus
 from backend.utils.decorators import partner_restricted
+from backend.utils.activity import record_activity
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
 support_bp = Blueprint('support', __name__)
@@ -38,6 +39,14 @@ def create_support_message():
         )
 
         db.session.add(support_message)
+        db.session.flush()
+        record_activity(
+            'support_message',
+            user_id=current_user_id,
+            user_name=user.full_name,
+            subject_id=support_message.id,
+            task_title=subject
+        )
         db.session.commit()
 
         return jsonify({
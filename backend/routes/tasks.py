@@ -1,18 +1,32 @@
-from flask import Blueprint, request, jsonify
+import logging
+from flask import Blueprint, request, jsonify, current_app
 from backend.extensions import db
 from backend.models.user import User, UserRole
 from backend.models.task import Task, UserTask
 from backend.models.transaction import Transaction, TransactionType, TransactionStatus
 from backend.models.reward_code import RewardCode
+from backend.models.batch import Batch
+from backend.utils.helpers import encode_reward_code
 from backend.utils.decorators import partner_restricted
+from backend.utils.idempotency import idempotent
+from backend.utils.rate_limit import rate_limit
+from backend.utils.code_filter import code_might_exist
 from backend.utils.admin_auth import admin_required
+from backend.utils import ledger
+from backend.utils.batch_purge import delete_in_chunks
+from backend.utils.code_rollup import record_redemptions
+from backend.utils.activity import record_activity
 from flask_jwt_extended import jwt_required, get_jwt_identity
 import re
 import os
-import time
+from collections import Counter
 from werkzeug.utils import secure_filename
+from werkzeug.exceptions import RequestEntityTooLarge
+from backend.utils.proof_images import ProofImageError
 from backend.models.notification import Notification, NotificationType
 
+logger = logging.getLogger(__name__)
+
 tasks_bp = Blueprint('tasks', __name__)
 
 @tasks_bp.route('/', methods=['GET'])
@@ -111,6 +125,7 @@ def start_task(task_id):
 
 @tasks_bp.route('/<int:task_id>/complete', methods=['POST'])
 @jwt_required()
+@idempotent
 def complete_task(task_id):
     try:
         current_user_id = int(get_jwt_identity())
@@ -132,51 +147,58 @@ def complete_task(task_id):
             return jsonify({'message': 'Task not started or already completed'}), 400
         
         # Handle both JSON and form data (for file uploads)
+        proof_upload_path = None
         if request.is_json:
             data = request.get_json() or {}
             proof_text = data.get('proof_text', '')
             proof_image = data.get('proof_image', '')
         else:
             # Handle form data with file upload
-            proof_text = request.form.get('proof_text', '')
-            proof_image_file = request.files.get('proof_image')
+            pipeline = current_app.extensions['proof_images']
+            # Refuse oversized bodies before the multipart parser spools them
+            request.max_content_length = pipeline.max_bytes + 1024 * 1024
+            try:
+                proof_text = request.form.get('proof_text', '')
+                proof_image_file = request.files.get('proof_image')
+            except RequestEntityTooLarge:
+                return jsonify({'message': f'Image is larger than {pipeline.max_bytes // (1024 * 1024)} MB'}), 413
             proof_image = None
             
             if proof_image_file and proof_image_file.filename != '':
+                # Validate file type
+                allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp'}
+                filename = secure_filename(proof_image_file.filename)
+                file_ext = os.path.splitext(filename)[1].lower()
+                
+                # Check if the extension (without the dot) is in allowed extensions
+                if not file_ext or file_ext[1:] not in allowed_extensions:  # Remove the dot from extension
+                    return jsonify({'message': f'Invalid file type. Allowed types: {", ".join(allowed_extensions)}'}), 400
+                
+                # Stream to the incoming folder; resizing and EXIF stripping happen in the background
                 try:
-                    # Validate file type
-                    allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp', 'bmp'}
-                    filename = secure_filename(proof_image_file.filename)
-                    file_ext = os.path.splitext(filename)[1].lower()
-                    
-                    # Check if the extension (without the dot) is in allowed extensions
-                    if not file_ext or file_ext[1:] not in allowed_extensions:  # Remove the dot from extension
-                        return jsonify({'message': f'Invalid file type. Allowed types: {", ".join(allowed_extensions)}'}), 400
-                    
-                    # Create upload directory if it doesn't exist (using absolute path)
-                    import os
-                    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-                    upload_dir = os.path.join(project_root, 'uploads', 'task_proofs')
-                    os.makedirs(upload_dir, exist_ok=True)
-                    
-                    # Create unique filename using user_id and timestamp
-                    unique_filename = f"user_{current_user_id}_task_{task_id}_{int(time.time())}{file_ext}"
-                    filepath = os.path.join(upload_dir, unique_filename)
-                    
-                    proof_image_file.save(filepath)
-                    proof_image = f"/uploads/task_proofs/{unique_filename}"
+                    proof_upload_path = pipeline.save_upload(proof_image_file, user_task.id)
+                except ProofImageError as e:
+                    return jsonify({'message': str(e)}), 400
                 except Exception as e:
-                    print(f"Error saving proof image: {str(e)}")
+                    logger.exception("Error saving proof image")
                     return jsonify({'message': f'Failed to save proof image: {str(e)}'}), 500
         
+        # Record the proof; an uploaded image's URLs are filled in once it is processed
+        user_task.proof_text = proof_text
+        if proof_upload_path:
+            user_task.proof_image = None
+            user_task.proof_image_thumb = None
+            user_task.proof_image_status = 'processing'
+        elif proof_image:
+            user_task.proof_image = proof_image
+            user_task.proof_image_status = 'ready'
+        
         # Check if task requires admin verification
         if task.requires_admin_verification:
             # For tasks requiring admin verification, we just mark it as pending review
             # and notify the admin
             user_task.status = 'pending_review'
             user_task.completed_at = db.func.current_timestamp()
-            user_task.proof_text = proof_text
-            user_task.proof_image = proof_image
             
             # Create notification for admin
             admin_users = User.query.filter_by(role=UserRole.ADMIN).all()
@@ -191,11 +213,15 @@ def complete_task(task_id):
             
             db.session.commit()
             
+            if proof_upload_path:
+                pipeline.enqueue(proof_upload_path)
+            
             return jsonify({
                 'message': 'Task submitted for admin review',
                 'status': 'pending_review',
                 'task': task.to_dict(),
-                'proof_image': proof_image,
+                'proof_image': user_task.proof_image,
+                'proof_image_status': user_task.proof_image_status,
                 'proof_text': proof_text
             }), 200
         else:
@@ -206,23 +232,19 @@ def complete_task(task_id):
             # Award points and Reward to user
             raw_points = int(task.points_reward)  # Ensure points is an integer
             points_to_add = max(1, raw_points)  # Ensure at least 1 point if any points are awarded
-            user.points_balance += points_to_add
-            user.total_points_earned += points_to_add
-            user.total_earnings += task.reward_amount
             
-            # Create transaction record
-            transaction = Transaction(
-                user_id=current_user_id,
-                type=TransactionType.EARNING,
-                status=TransactionStatus.COMPLETED,
-                description=f"Completed task: {task.title}",
+            ledger.post(
+                current_user_id,
+                TransactionType.EARNING,
+                points=points_to_add,
                 amount=task.reward_amount,
-                points_amount=points_to_add  # Use integer value
+                description=f"Completed task: {task.title}"
             )
-            
-            db.session.add(transaction)
             db.session.commit()
             
+            if proof_upload_path:
+                pipeline.enqueue(proof_upload_path)
+            
             return jsonify({
                 'message': 'Task completed successfully',
                 'points_awarded': task.points_reward,
@@ -315,10 +337,9 @@ def manage_task(task_id):
             return jsonify({'message': 'Task not found'}), 404
             
         if request.method == 'DELETE':
-            # Check if any user_tasks are associated
-            user_tasks = UserTask.query.filter_by(task_id=task_id).all()
-            for ut in user_tasks:
-                db.session.delete(ut)
+            # Remove associated user_tasks set-based, without loading them
+            user_tasks_table = UserTask.__table__
+            delete_in_chunks(user_tasks_table, user_tasks_table.c.task_id == task_id)
             
             db.session.delete(task)
             db.session.commit()
@@ -369,7 +390,7 @@ def get_all_tasks_for_admin():
             page=page, per_page=per_page, error_out=False
         )
         
-        print(f"Admin fetching {len(tasks.items)} tasks, total: {tasks.total}")  # Debug print
+        logger.debug("Admin fetching %d tasks, total: %d", len(tasks.items), tasks.total)
         
         return jsonify({
             'tasks': [task.to_dict() for task in tasks.items],
@@ -383,6 +404,9 @@ def get_all_tasks_for_admin():
 
 @tasks_bp.route('/daily/upload-codes', methods=['POST'])
 @jwt_required()
+@rate_limit('5/minute')
+@rate_limit('30/hour')
+@idempotent
 @partner_restricted
 def upload_daily_codes():
     try:
@@ -402,33 +426,61 @@ def upload_daily_codes():
         valid_codes = []
         invalid_codes = []
         
+        # One IN query on the packed keys for every code that might exist
+        candidate_keys = [
+            encode_reward_code(code_str) for code_str in codes
+            if isinstance(code_str, str) and re.match(r'^[A-Z]{5}[0-9]{3}$', code_str) and code_might_exist(code_str)
+        ]
+        unused_codes = {
+            code.code_key: code for code in RewardCode.live().filter(
+                RewardCode.code_key.in_(candidate_keys),
+                RewardCode.is_used == False
+            ).all()
+        } if candidate_keys else {}
+        
         for code_str in codes:
             # Validate format: 5 uppercase letters + 3 digits
-            if not re.match(r'^[A-Z]{5}[0-9]{3}$', code_str):
+            if not isinstance(code_str, str) or not re.match(r'^[A-Z]{5}[0-9]{3}$', code_str):
                 invalid_codes.append({'code': code_str, 'reason': 'Invalid format'})
                 continue
             
-            # Check if code exists and is unused
-            code = RewardCode.query.filter_by(code=code_str, is_used=False).first()
+            # Check if code exists and is unused (a code listed twice only counts once)
+            code = unused_codes.pop(encode_reward_code(code_str), None)
             if not code:
                 invalid_codes.append({'code': code_str, 'reason': 'Code not found or already used'})
                 continue
             
             valid_codes.append(code)
         
+        # Mark them used; codes redeemed concurrently by someone else drop out here
+        claimed = RewardCode.claim([code.id for code in valid_codes], current_user_id)
+        for code in valid_codes:
+            if code.id not in claimed:
+                invalid_codes.append({'code': code.code, 'reason': 'Code not found or already used'})
+        valid_codes = [code for code in valid_codes if code.id in claimed]
+        
         # Process valid codes
         points_earned = 0
+        redeemed_per_batch = Counter(code.batch_id for code in valid_codes)
+        for batch_id, redeemed in redeemed_per_batch.items():
+            Batch.adjust_counts(batch_id, used=redeemed)
+        points_per_batch = Counter()
+        for code in valid_codes:
+            points_per_batch[code.batch_id] += max(1, round(code.point_value))
+        record_redemptions({
+            batch_id: (redeemed, points_per_batch[batch_id]) for batch_id, redeemed in redeemed_per_batch.items()
+        })
         for code in valid_codes:
-            # Mark code as used
-            code.is_used = True
-            code.used_by = current_user_id
-            code.used_at = db.func.current_timestamp()
-            
             # Add points to user (round to nearest integer and ensure at least 1)
             raw_code_points = round(code.point_value)
             code_points = max(1, raw_code_points)  # Ensure at least 1 point if any points are awarded
-            user.points_balance += code_points
-            user.total_points_earned += code_points
+            ledger.post(
+                current_user_id,
+                TransactionType.CODE_REDEMPTION,
+                points=code_points,
+                description=f"Redeemed code {code.code}",
+                reference_id=code.id
+            )
             points_earned += code_points
         
         # Check if user completed daily requirement (5 or 10 codes)
@@ -439,34 +491,12 @@ def upload_daily_codes():
             # Award extra 2 points for completing daily requirement
             raw_extra_points = int(2)  # Ensure integer value
             extra_points = max(1, raw_extra_points)  # Ensure at least 1 point if any points are awarded
-            user.points_balance += extra_points
-            user.total_points_earned += extra_points
-            
-            # Create transaction for extra points
-            extra_transaction = Transaction(
-                user_id=current_user_id,
-                type=TransactionType.EARNING,
-                status=TransactionStatus.COMPLETED,
-                description=f"Daily code upload bonus for {len(valid_codes)} codes",
-                amount=0,
-                points_amount=extra_points  # Use integer value
+            ledger.post(
+                current_user_id,
+                TransactionType.EARNING,
+                points=extra_points,
+                description=f"Daily code upload bonus for {len(valid_codes)} codes"
             )
-            db.session.add(extra_transaction)
-        
-        # Create transactions for each redeemed code
-        for code in valid_codes:
-            raw_code_points = round(code.point_value)  # Round to nearest integer
-            code_points = max(1, raw_code_points)  # Ensure at least 1 point if any points are awarded
-            transaction = Transaction(
-                user_id=current_user_id,
-                type=TransactionType.CODE_REDEMPTION,
-                status=TransactionStatus.COMPLETED,
-                description=f"Redeemed code {code.code}",
-                amount=0,
-                points_amount=code_points,  # Use integer value
-                reference_id=code.id
-            )
-            db.session.add(transaction)
         
         db.session.commit()
         
@@ -556,18 +586,22 @@ def admin_complete_task(task_id):
         # Award points and Reward to user
         raw_points = int(task.points_reward)  # Ensure points is an integer
         points_to_add = max(1, raw_points)  # Ensure at least 1 point if any points are awarded
-        user.points_balance += points_to_add
-        user.total_points_earned += points_to_add
-        user.total_earnings += task.reward_amount
-        
-        # Create transaction record
-        transaction = Transaction(
-            user_id=user_id,
-            type=TransactionType.EARNING,
-            status=TransactionStatus.COMPLETED,
-            description=f"Completed task: {task.title}",
+        ledger.post(
+            user.id,
+            TransactionType.EARNING,
+            points=points_to_add,
             amount=task.reward_amount,
-            points_amount=points_to_add  # Use integer value
+            description=f"Completed task: {task.title}"
+        )
+        record_activity(
+            'task_review',
+            user_id=user.id,
+            user_name=user.full_name,
+            actor_id=current_user_id,
+            subject_id=user_task.id,
+            task_title=task.title,
+            decision='approved',
+            points=points_to_add
         )
         
         # Create notification for the user
@@ -578,7 +612,6 @@ def admin_complete_task(task_id):
             type=NotificationType.SUCCESS
         )
         
-        db.session.add(transaction)
         db.session.add(notification)
         db.session.commit()
         
@@ -591,7 +624,7 @@ def admin_complete_task(task_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         # Create notification for admin (task completion confirmation)
         admin_notification = Notification(
@@ -638,6 +671,11 @@ def get_completed_tasks_for_review():
                 'user_task_id': user_task.id,
                 'task': task.to_dict() if task else None,
                 'user': user.to_dict() if user else None,
+                'user_id': user_task.user_id,
+                'proof_text': user_task.proof_text,
+                'proof_image': user_task.proof_image,
+                'proof_image_thumb': user_task.proof_image_thumb,
+                'proof_image_status': user_task.proof_image_status,
                 'started_at': user_task.created_at.isoformat() if user_task.created_at else None,
                 'submitted_at': user_task.completed_at.isoformat() if user_task.completed_at else None
             })
@@ -712,6 +750,17 @@ def admin_reject_task(user_task_id):
         user = User.query.get(user_task.user_id)
         task = Task.query.get(user_task.task_id)
         
+        record_activity(
+            'task_review',
+            user_id=user.id,
+            user_name=user.full_name,
+            actor_id=current_user_id,
+            subject_id=user_task.id,
+            task_title=task.title,
+            decision='rejected',
+            reason=reason
+        )
+        
         # Create notification for the user
         notification = Notification(
             user_id=user.id,
@@ -732,7 +781,7 @@ def admin_reject_task(user_task_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         return jsonify({
             'message': 'Task rejected successfully',
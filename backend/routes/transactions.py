@@ -1,10 +1,14 @@
+import logging
 from flask import Blueprint, request, jsonify
 from backend.app import db
 from backend.models.user import User, UserRole
-from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus, serialize_transaction
 from backend.utils.decorators import partner_restricted
+from backend.utils.ledger_version import ledger_etag
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+logger = logging.getLogger(__name__)
+
 transactions_bp = Blueprint('transactions', __name__)
 
 @transactions_bp.route('/', methods=['GET'])
@@ -17,11 +21,12 @@ def get_transactions():
         per_page = request.args.get('per_page', 10, type=int)
         transaction_type = request.args.get('type')
         
-        query = Transaction.query.filter_by(user_id=current_user_id)
+        # Plain column rows: a page is read-only, so skip building ORM objects
+        query = db.session.query(*serialize_transaction.columns).filter(Transaction.user_id == current_user_id)
         
         if transaction_type:
             try:
-                query = query.filter_by(type=TransactionType(transaction_type))
+                query = query.filter(Transaction.type == TransactionType(transaction_type))
             except ValueError:
                 pass  # Invalid transaction type, ignore filter
         
@@ -30,7 +35,7 @@ def get_transactions():
         )
         
         return jsonify({
-            'transactions': [t.to_dict() for t in transactions.items],
+            'transactions': serialize_transaction.many(transactions.items),
             'total': transactions.total,
             'pages': transactions.pages,
             'current_page': page
@@ -159,7 +164,7 @@ def update_transaction_status(transaction_id):
                     send_email(user_email, email_subject, email_body)
                 except Exception as email_error:
                     # If email fails, log the error but don't fail the entire operation
-                    print(f"Failed to send email notification: {str(email_error)}")
+                    logger.warning("Failed to send email notification: %s", email_error)
         
         db.session.commit()
         
@@ -204,42 +209,35 @@ def get_user_transactions(user_id):
 
 @transactions_bp.route('/summary', methods=['GET'])
 @jwt_required()
+@ledger_etag('transaction-summary')
 @partner_restricted
 def get_transaction_summary():
     try:
         current_user_id = int(get_jwt_identity())
         
-        # Calculate totals for different transaction types
-        total_earnings = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.EARNING,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
-        total_withdrawn = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.POINT_WITHDRAWAL,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
-        total_referral_bonus = db.session.query(db.func.sum(Transaction.amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.REFERRAL_BONUS,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
-        
-        total_code_redemption = db.session.query(db.func.sum(Transaction.points_amount)).filter(
-            Transaction.user_id == current_user_id,
-            Transaction.type == TransactionType.CODE_REDEMPTION,
-            Transaction.status == TransactionStatus.COMPLETED
-        ).scalar() or 0.0
+        totals = get_transaction_totals(current_user_id)
         
-        return jsonify({
-            'total_earnings': abs(total_earnings),
-            'total_withdrawn': abs(total_withdrawn),
-            'total_referral_bonus': abs(total_referral_bonus),
-            'total_code_redemption_points': abs(total_code_redemption)
-        }), 200
+        return jsonify(totals), 200
         
     except Exception as e:
-        return jsonify({'message': 'Failed to fetch transaction summary', 'error': str(e)}), 500
\ No newline at end of file
+        return jsonify({'message': 'Failed to fetch transaction summary', 'error': str(e)}), 500
+
+def get_transaction_totals(user_id):
+    """Sum a user's completed transactions per type in a single grouped query"""
+    rows = db.session.query(
+        Transaction.type,
+        db.func.sum(Transaction.amount),
+        db.func.sum(Transaction.points_amount)
+    ).filter(
+        Transaction.user_id == user_id,
+        Transaction.status == TransactionStatus.COMPLETED
+    ).group_by(Transaction.type).all()
+    
+    amounts = {tx_type: (amount or 0.0, points or 0.0) for tx_type, amount, points in rows}
+    
+    return {
+        'total_earnings': abs(amounts.get(TransactionType.EARNING, (0.0, 0.0))[0]),
+        'total_withdrawn': abs(amounts.get(TransactionType.POINT_WITHDRAWAL, (0.0, 0.0))[0]),
+        'total_referral_bonus': abs(amounts.get(TransactionType.REFERRAL_BONUS, (0.0, 0.0))[0]),
+        'total_code_redemption_points': abs(amounts.get(TransactionType.CODE_REDEMPTION, (0.0, 0.0))[1])
+    }
\ No newline at end of file
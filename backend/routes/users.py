@@ -1,13 +1,20 @@
+import logging
 from flask import Blueprint, request, jsonify
 from backend.extensions import db, bcrypt
 from backend.models.user import User, UserRole
 from backend.utils.decorators import partner_restricted
+from backend.utils.ledger_version import ledger_etag
+from backend.utils import ledger
+from backend.models.transaction import TransactionType
 from flask_jwt_extended import jwt_required, get_jwt_identity
 
+logger = logging.getLogger(__name__)
+
 users_bp = Blueprint('users', __name__)
 
 @users_bp.route('/profile', methods=['GET'])
 @jwt_required()
+@ledger_etag('profile')
 def get_profile():
     try:
         current_user_id = int(get_jwt_identity())
@@ -182,19 +189,35 @@ def admin_update_user_points(user_id):
         points = data.get('points', 0)
         operation = data.get('operation', 'set')  # set, add, subtract
         
+        if not isinstance(points, (int, float)) or points < 0:
+            return jsonify({'message': 'Points must be a non-negative number'}), 400
+        
+        # Every operation is recorded as an admin adjustment transaction
         if operation == 'set':
-            user.points_balance = points
+            delta = points - user.points_balance
+            description = f'Admin set points balance to {points:g}'
         elif operation == 'add':
-            user.points_balance += points
-            user.total_points_earned += points
+            delta = points
+            description = f'Admin added {points:g} points'
         elif operation == 'subtract':
-            if user.points_balance < points:
-                return jsonify({'message': 'Insufficient points balance'}), 400
-            user.points_balance -= points
-            user.total_points_withdrawn += points
+            delta = -points
+            description = f'Admin subtracted {points:g} points'
         else:
             return jsonify({'message': 'Invalid operation. Use "set", "add", or "subtract"'}), 400
         
+        if delta:
+            try:
+                ledger.post(
+                    user.id,
+                    TransactionType.ADMIN_ADJUSTMENT,
+                    points=delta,
+                    description=description,
+                    require_funds=operation == 'subtract'
+                )
+            except ledger.InsufficientFundsError:
+                db.session.rollback()
+                return jsonify({'message': 'Insufficient points balance'}), 400
+        
         db.session.commit()
         
         return jsonify({
@@ -282,7 +305,7 @@ def suspend_user(user_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         return jsonify({
             'message': 'User suspended successfully',
@@ -332,7 +355,7 @@ def unsuspend_user(user_id):
             send_email(user_email, email_subject, email_body)
         except Exception as email_error:
             # If email fails, log the error but don't fail the entire operation
-            print(f"Failed to send email notification: {str(email_error)}")
+            logger.warning("Failed to send email notification: %s", email_error)
         
         return jsonify({
             'message': 'User suspension lifted successfully',
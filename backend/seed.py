@@ -6,16 +6,15 @@ from backend.models.task import Task
 from backend.models.notification import Notification, NotificationType
 from backend.models.support_message import SupportMessage, MessageType, MessageStatus
 from backend.utils.helpers import generate_reward_code, generate_referral_code
+from backend.utils.referral_tree import record_referral_path
 import random
 
-def seed_database():
-    app = create_app()
+def seed_database(app=None):
+    if app is None:
+        app = create_app()
     
     with app.app_context():
-        # Initialize database tables if they don't exist
-        from backend.app import db
-        db.create_all()
-        # Create tables
+        # Create tables if they don't exist
         db.create_all()
         
         # Check if admin user already exists
@@ -30,6 +29,8 @@ def seed_database():
                 referral_code=generate_referral_code()
             )
             db.session.add(admin)
+            db.session.flush()
+            record_referral_path(admin.id)
             print("Created admin user")
         else:
             print("Admin user already exists")
@@ -0,0 +1,89 @@
+import json
+from datetime import datetime
+from sqlalchemy import event, insert, select
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.activity_event import ActivityEvent
+
+ACTIVITY_TYPES = (
+    'user_registration', 'task_completion', 'code_redemption', 'withdrawal_request',
+    'referral_bonus', 'admin_adjustment', 'deposit', 'withdrawal_approved',
+    'withdrawal_rejected', 'task_review', 'support_message', 'support_reply',
+    'partner_approved', 'partner_denied'
+)
+MAX_PAGE_SIZE = 100
+
+activity_table = ActivityEvent.__table__
+users_table = User.__table__
+
+
+@event.listens_for(ActivityEvent, 'before_update')
+@event.listens_for(ActivityEvent, 'before_delete')
+def _refuse_event_changes(mapper, connection, target):
+    raise ValueError('Activity events are append-only')
+
+
+def _row(type, user_id, user_name, actor_id, subject_id, payload):
+    if type not in ACTIVITY_TYPES:
+        raise ValueError(f'Unknown activity type: {type}')
+    payload = {key: value for key, value in payload.items() if value is not None}
+    return {
+        'type': type,
+        'user_id': user_id,
+        # Looked up inside the INSERT when the caller doesn't have the name at hand
+        'user_name': user_name if user_name is not None or user_id is None else select(
+            users_table.c.full_name
+        ).where(users_table.c.id == user_id).scalar_subquery(),
+        'actor_id': actor_id,
+        'subject_id': subject_id,
+        'payload': json.dumps(payload, separators=(',', ':'), default=str) if payload else None,
+        'created_at': datetime.utcnow()
+    }
+
+
+def record_activity(type, user_id=None, user_name=None, actor_id=None, subject_id=None, **payload):
+    """
+    Append an event to the activity feed (in the current session; callers commit).
+
+    payload holds the few display fields the feed needs (points,
+    cash_value, task_title, code...); None values are left out.
+    """
+    db.session.execute(insert(activity_table).values(
+        **_row(type, user_id, user_name, actor_id, subject_id, payload)
+    ))
+
+
+def record_activities(events):
+    """Append many events in one multi-row INSERT; events are record_activity kwargs dicts"""
+    rows = []
+    for kwargs in events:
+        kwargs = dict(kwargs)
+        rows.append(_row(kwargs.pop('type'), kwargs.pop('user_id', None), kwargs.pop('user_name', None),
+                         kwargs.pop('actor_id', None), kwargs.pop('subject_id', None), kwargs))
+    if rows:
+        db.session.execute(insert(activity_table).values(rows))
+
+
+def list_activities(cursor=None, limit=20, types=None, user_id=None):
+    """
+    One page of the feed, newest first.
+
+    cursor is the next_cursor of the previous page (an event id); pages
+    are a range scan on the primary key, or on the (type, id) / (user_id,
+    id) indexes when filtered, so page 1000 costs the same as page 1.
+
+    Returns (events, next_cursor); next_cursor is None on the last page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = ActivityEvent.query
+    if cursor is not None:
+        query = query.filter(ActivityEvent.id < cursor)
+    if types:
+        query = query.filter(ActivityEvent.type.in_(types))
+    if user_id is not None:
+        query = query.filter(ActivityEvent.user_id == user_id)
+
+    # One extra row tells whether there is another page
+    events = query.order_by(ActivityEvent.id.desc()).limit(limit + 1).all()
+    next_cursor = events[limit - 1].id if len(events) > limit else None
+    return events[:limit], next_cursor
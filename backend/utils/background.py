@@ -0,0 +1,28 @@
+import os
+import threading
+
+
+class ProcessThread:
+    """
+    A daemon thread started on first use, once per process.
+
+    Threads don't survive fork: a gunicorn worker forked from a process
+    that had already started one finds it gone and starts its own.
+    """
+
+    def __init__(self, target, name):
+        self.target = target
+        self.name = name
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def ensure_started(self, *args):
+        """Start target(*args) unless this process runs it already; returns True if it was started"""
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+                return False
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self.target, args=args, name=self.name, daemon=True)
+            self._thread.start()
+            return True
@@ -0,0 +1,85 @@
+import logging
+import queue
+from sqlalchemy import delete, select
+from backend.extensions import db
+from backend.models.batch import Batch
+from backend.models.reward_code import RewardCode
+from backend.models.code_redemption_rollup import CodeRedemptionRollup
+from backend.utils.background import ProcessThread
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def delete_in_chunks(table, whereclause, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    DELETE the matching rows chunk_size at a time, committing after each chunk.
+
+    Rows are never loaded into the session, and short transactions keep
+    SQLite's write lock free for other requests between chunks.
+    """
+    total = 0
+    while True:
+        ids = select(table.c.id).where(whereclause).limit(chunk_size).scalar_subquery()
+        deleted = db.session.execute(delete(table).where(table.c.id.in_(ids))).rowcount
+        db.session.commit()
+        total += deleted
+        if deleted < chunk_size:
+            return total
+
+
+def purge_batch(batch_id, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Delete a batch and its codes; returns the number of codes deleted"""
+    codes_table = RewardCode.__table__
+    deleted = delete_in_chunks(codes_table, codes_table.c.batch_id == batch_id, chunk_size)
+    rollups_table = CodeRedemptionRollup.__table__
+    delete_in_chunks(rollups_table, rollups_table.c.batch_id == batch_id, chunk_size)
+    db.session.execute(delete(Batch.__table__).where(Batch.__table__.c.id == batch_id))
+    db.session.commit()
+    return deleted
+
+
+class BatchPurger:
+    """
+    Deletes retired (soft-deleted) batches from a background thread.
+
+    When the worker starts it also picks up batches retired before a
+    restart, so an interrupted purge is finished eventually.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._worker = ProcessThread(self._run, 'batch-purge')
+
+    def enqueue(self, app, batch_id):
+        self._worker.ensure_started(app)
+        self._queue.put(batch_id)
+
+    def _run(self, app):
+        with app.app_context():
+            for (batch_id,) in db.session.query(Batch.id).filter(Batch.deleted_at.isnot(None)).all():
+                self._queue.put(batch_id)
+            db.session.remove()
+
+        while True:
+            batch_id = self._queue.get()
+            try:
+                with app.app_context():
+                    purge_batch(batch_id)
+            except Exception:
+                logger.exception("Failed to purge batch %s", batch_id)
+            finally:
+                self._queue.task_done()
+
+
+batch_purger = BatchPurger()
+
+
+if __name__ == '__main__':
+    from backend.app import create_app
+
+    app = create_app()
+    with app.app_context():
+        for (batch_id,) in db.session.query(Batch.id).filter(Batch.deleted_at.isnot(None)).all():
+            print(f'Batch {batch_id}: deleted {purge_batch(batch_id)} codes')
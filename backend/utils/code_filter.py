@@ -0,0 +1,221 @@
+import logging
+import math
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+logger = logging.getLogger(__name__)
+
+
+class BloomFilter:
+    """
+    Fixed-size Bloom filter over strings.
+
+    No false negatives: a string that was added is always reported as
+    present. Absent strings are reported present with probability about
+    error_rate while no more than capacity strings have been added.
+    """
+
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(int(capacity), 1)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.num_hashes = max(1, round(self.num_bits / capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        # Double hashing from Python's string hash: fast, and stable for the
+        # life of the process, which is as long as a filter lives
+        h1 = hash(value)
+        h2 = hash(value + '\x00') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        for position in self._positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
+
+
+class RewardCodeIndex:
+    """
+    In-process "could this reward code exist?" check.
+
+    Built from reward_codes in a background thread on first use; until it
+    is ready every code is reported as possible and callers query the
+    database as before. Codes committed by this process are added right
+    away. Codes written by other worker processes are picked up by a
+    catch-up query on ids above the high-water mark (reward_codes ids are
+    AUTOINCREMENT, so a new code never gets an id at or below it), run at
+    most once per refresh_interval, so they can look invalid here for that
+    long. Deleted
+    codes stay in the filter (a Bloom filter can't remove) until the
+    periodic full rebuild; they only cost a database lookup.
+    """
+
+    def __init__(self, app, error_rate=0.01, refresh_interval=1.0, rebuild_interval=3600, chunk_size=50000):
+        self.app = app
+        self.error_rate = error_rate
+        self.refresh_interval = refresh_interval
+        self.rebuild_interval = rebuild_interval
+        self.chunk_size = chunk_size
+        self._filter = None
+        self._high_water = 0
+        self._built_at = 0.0
+        self._refreshed_at = 0.0
+        self._lock = threading.Lock()
+        self._building = False
+        self._retry_at = 0.0
+
+    @property
+    def ready(self):
+        return self._filter is not None
+
+    def might_exist(self, code):
+        """False only when the code is definitely not in reward_codes"""
+        bloom = self._filter
+        if bloom is None or time.time() - self._built_at > self.rebuild_interval:
+            self._start_build()
+            if bloom is None:
+                return True
+        if code in bloom:
+            return True
+        # A miss may be a code another worker just created
+        if time.time() - self._refreshed_at > self.refresh_interval:
+            self._catch_up()
+            return code in self._filter
+        return False
+
+    def add(self, codes):
+        bloom = self._filter
+        if bloom is None:
+            return
+        with self._lock:
+            for code in codes:
+                bloom.add(code)
+            # Past capacity the false-positive rate climbs; resize on a rebuild
+            if bloom.count > bloom.capacity:
+                self._built_at = 0.0
+
+    def _start_build(self):
+        with self._lock:
+            if self._building or time.time() < self._retry_at:
+                return
+            self._building = True
+        threading.Thread(target=self._build, name='reward-code-index', daemon=True).start()
+
+    def _build(self):
+        from backend.extensions import db
+        from backend.models.reward_code import RewardCode
+
+        try:
+            with self.app.app_context():
+                total = db.session.query(db.func.count(RewardCode.id)).scalar() or 0
+                bloom = BloomFilter(max(total * 2, 100000), self.error_rate)
+                started_at = time.time()
+                last_id = 0
+                while True:
+                    # Keyset pagination; only one chunk of codes in memory at a time
+                    rows = db.session.query(RewardCode.id, RewardCode.code).filter(
+                        RewardCode.id > last_id
+                    ).order_by(RewardCode.id).limit(self.chunk_size).all()
+                    if not rows:
+                        break
+                    for _, code in rows:
+                        bloom.add(code)
+                    last_id = rows[-1][0]
+                db.session.remove()
+
+            with self._lock:
+                self._filter = bloom
+                self._high_water = last_id
+                self._built_at = started_at
+                self._refreshed_at = started_at
+            # Codes committed while the build ran
+            self._catch_up()
+        except Exception:
+            logger.exception("Failed to build reward code index")
+            self._retry_at = time.time() + 30
+        finally:
+            self._building = False
+
+    def _catch_up(self):
+        from backend.extensions import db
+        from backend.models.reward_code import RewardCode
+
+        self._refreshed_at = time.time()
+        try:
+            with self.app.app_context():
+                rows = db.session.query(RewardCode.id, RewardCode.code).filter(
+                    RewardCode.id > self._high_water
+                ).order_by(RewardCode.id).all()
+        except Exception:
+            logger.exception("Failed to refresh reward code index")
+            return
+        if rows:
+            self.add(code for _, code in rows)
+            self._high_water = max(self._high_water, rows[-1][0])
+
+
+def init_code_index(app):
+    index = RewardCodeIndex(
+        app,
+        error_rate=app.config.get('REWARD_CODE_FILTER_ERROR_RATE', 0.01),
+        refresh_interval=app.config.get('REWARD_CODE_FILTER_REFRESH_SECONDS', 1.0)
+    )
+    app.extensions['reward_code_index'] = index
+    return index
+
+
+def code_might_exist(code):
+    """
+    Cheap pre-check before looking a code up in the database.
+
+    Returns False only for codes that definitely don't exist; True means
+    "query the database".
+    """
+    if not has_app_context():
+        return True
+    index = current_app.extensions.get('reward_code_index')
+    if index is None or not current_app.config.get('REWARD_CODE_FILTER_ENABLED', True):
+        return True
+    return index.might_exist(code)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_codes(session, flush_context):
+    from backend.models.reward_code import RewardCode
+
+    for obj in session.new:
+        if isinstance(obj, RewardCode):
+            session.info.setdefault('reward_codes_added', []).append(obj.code)
+
+
+@event.listens_for(Session, 'after_commit')
+def _index_codes(session):
+    codes = session.info.pop('reward_codes_added', None)
+    if codes and has_app_context():
+        index = current_app.extensions.get('reward_code_index')
+        if index is not None:
+            index.add(codes)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_codes(session):
+    session.info.pop('reward_codes_added', None)
@@ -0,0 +1,56 @@
+from sqlalchemy.exc import IntegrityError
+from backend.extensions import db
+from backend.models.batch import Batch
+from backend.models.reward_code import RewardCode
+from backend.utils.code_filter import code_might_exist
+from backend.utils.helpers import generate_reward_code, encode_reward_code
+
+INSERT_ATTEMPTS = 3
+
+
+def _pick_codes(codes, count):
+    """Add fresh candidates to codes (a dict used as an ordered set) until it holds count"""
+    while len(codes) < count:
+        code = generate_reward_code()
+        # Codes picked earlier in this call aren't in the index until they're committed
+        if code in codes:
+            continue
+        if code_might_exist(code) and RewardCode.query.filter_by(code_key=encode_reward_code(code)).first():
+            continue
+        codes[code] = None
+
+
+def create_reward_codes(batch, count):
+    """
+    Add count new codes to batch and commit; returns them.
+
+    Candidates are checked against the codes already picked, then against
+    the database when the reward code index says they might exist. A code
+    another worker committed a moment ago can pass both checks; the unique
+    constraint catches it, and the set is rolled back and inserted again
+    with the clashing codes replaced.
+    """
+    batch_id, point_value = batch.id, batch.point_value
+    codes = {}
+    _pick_codes(codes, count)
+
+    for attempt in range(INSERT_ATTEMPTS):
+        try:
+            for code in codes:
+                db.session.add(RewardCode(code=code, point_value=point_value, batch_id=batch_id))
+            # Its UPDATE flushes the new codes, so a clash can surface here already
+            Batch.adjust_counts(batch_id, codes=count)
+            db.session.commit()
+            return list(codes)
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == INSERT_ATTEMPTS - 1:
+                raise
+            taken = {code for (code,) in db.session.query(RewardCode.code).filter(
+                RewardCode.code_key.in_([encode_reward_code(code) for code in codes])
+            ).all()}
+            if not taken:
+                raise  # Some other constraint; retrying won't help
+            for code in taken:
+                del codes[code]
+            _pick_codes(codes, count)
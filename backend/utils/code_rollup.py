@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from backend.extensions import db
+from backend.models.code_redemption_rollup import CodeRedemptionRollup
+
+rollups_table = CodeRedemptionRollup.__table__
+
+
+def hour_bucket(moment):
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+def _upsert():
+    # INSERT ... ON CONFLICT DO UPDATE is spelled the same in SQLite and PostgreSQL
+    if db.engine.dialect.name == 'postgresql':
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(rollups_table)
+
+
+def record_redemptions(per_batch, at=None):
+    """
+    Add redemptions to the current hour's rollup rows (callers commit).
+
+    per_batch maps batch_id to (redemptions, points awarded).
+    """
+    if not per_batch:
+        return
+    bucket = hour_bucket(at or datetime.utcnow())
+    for batch_id, (redemptions, points) in per_batch.items():
+        stmt = _upsert().values(batch_id=batch_id, bucket=bucket, redemptions=redemptions, points=points)
+        db.session.execute(stmt.on_conflict_do_update(
+            index_elements=['batch_id', 'bucket'],
+            set_={
+                'redemptions': rollups_table.c.redemptions + stmt.excluded.redemptions,
+                'points': rollups_table.c.points + stmt.excluded.points
+            }
+        ))
+
+
+def redemption_series(start, end, granularity='hour', batch_id=None):
+    """
+    Redemptions per bucket between start and end, zero-filled.
+
+    granularity is 'hour' or 'day'; with batch_id only that batch counts.
+    Days are folded from the hourly rows here, which keeps the SQL the
+    same on every database.
+    """
+    query = db.session.query(
+        CodeRedemptionRollup.bucket,
+        db.func.sum(CodeRedemptionRollup.redemptions),
+        db.func.sum(CodeRedemptionRollup.points)
+    ).filter(
+        CodeRedemptionRollup.bucket >= start,
+        CodeRedemptionRollup.bucket < end
+    )
+    if batch_id is not None:
+        query = query.filter(CodeRedemptionRollup.batch_id == batch_id)
+
+    step = timedelta(days=1) if granularity == 'day' else timedelta(hours=1)
+    truncate = (lambda moment: moment.replace(hour=0, minute=0, second=0, microsecond=0)) \
+        if granularity == 'day' else hour_bucket
+
+    totals = {}
+    for bucket, redemptions, points in query.group_by(CodeRedemptionRollup.bucket).all():
+        entry = totals.setdefault(truncate(bucket), [0, 0.0])
+        entry[0] += redemptions or 0
+        entry[1] += points or 0.0
+
+    series = []
+    moment = truncate(start)
+    while moment < end:
+        redemptions, points = totals.get(moment, (0, 0.0))
+        series.append({'bucket': moment.isoformat(), 'redemptions': redemptions, 'points': points})
+        moment += step
+    return series
+
+
+def batch_totals(start, end):
+    """Redemptions and points per batch between start and end"""
+    rows = db.session.query(
+        CodeRedemptionRollup.batch_id,
+        db.func.sum(CodeRedemptionRollup.redemptions),
+        db.func.sum(CodeRedemptionRollup.points)
+    ).filter(
+        CodeRedemptionRollup.bucket >= start,
+        CodeRedemptionRollup.bucket < end
+    ).group_by(CodeRedemptionRollup.batch_id).all()
+    return {batch_id: (redemptions or 0, points or 0.0) for batch_id, redemptions, points in rows}
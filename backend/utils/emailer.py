@@ -1,11 +1,9 @@
-import smtplib
+import logging
 import os
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.base import MIMEBase
-from email import encoders
 from typing import List, Optional
 
+logger = logging.getLogger(__name__)
+
 class Emailer:
     def __init__(self):
         self.smtp_server = os.environ.get('SMTP_SERVER', 'smtp.gmail.com')
@@ -26,6 +24,11 @@ class Emailer:
         Returns:
             bool: True if email was sent successfully, False otherwise
         """
+        # smtplib and email.mime (which pull in ssl) are only loaded once mail is sent
+        import smtplib
+        from email.mime.text import MIMEText
+        from email.mime.multipart import MIMEMultipart
+        
         try:
             # Create message
             msg = MIMEMultipart('alternative')
@@ -52,8 +55,8 @@ class Emailer:
             
             return True
             
-        except Exception as e:
-            print(f"Failed to send email: {str(e)}")
+        except Exception:
+            logger.exception("Failed to send email")
             return False
     
     def send_withdrawal_request_notification(self, user_email: str, user_name: str, points: float, amount: float, method: str) -> bool:
@@ -1,4 +1,5 @@
 import random
+import re
 import string
 from datetime import datetime
 
@@ -13,6 +14,32 @@ def generate_reward_code():
     digits = ''.join(random.choice(string.digits) for _ in range(3))
     return letters + digits
 
+REWARD_CODE_PATTERN = re.compile(r'^[A-Z]{5}[0-9]{3}$')
+
+def encode_reward_code(code):
+    """
+    Pack a reward code into an integer (26^5 * 1000 values, under 2^34).
+
+    Letters are base-26 digits, followed by the 3-digit number. Lowercase
+    input is accepted; returns None for anything not in the code format.
+    """
+    code = (code or '').upper()
+    if not REWARD_CODE_PATTERN.match(code):
+        return None
+    key = 0
+    for letter in code[:5]:
+        key = key * 26 + (ord(letter) - 65)
+    return key * 1000 + int(code[5:])
+
+def decode_reward_code(key):
+    """Inverse of encode_reward_code"""
+    key, number = divmod(key, 1000)
+    letters = []
+    for _ in range(5):
+        key, letter = divmod(key, 26)
+        letters.append(chr(65 + letter))
+    return ''.join(reversed(letters)) + f'{number:03d}'
+
 def generate_batch_id():
     """Generate a batch ID for grouping reward codes"""
     timestamp = datetime.now().strftime("%Y%m%d%H%M%S")
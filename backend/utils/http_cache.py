@@ -0,0 +1,37 @@
+import hashlib
+import json
+from flask import request, jsonify, make_response
+
+
+def make_etag(payload):
+    """Derive an ETag from a JSON-serialisable payload"""
+    encoded = json.dumps(payload, sort_keys=True, default=str, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha1(encoded).hexdigest()[:24]
+
+
+def not_modified(etag):
+    """Build an empty 304 response carrying the given weak ETag"""
+    response = make_response('', 304)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def request_matches(etag):
+    """Check whether the request's If-None-Match header already holds this ETag"""
+    return request.if_none_match.contains_weak(etag)
+
+
+def json_with_etag(payload, status=200):
+    """
+    Return payload as JSON tagged with a weak ETag, or a 304 when the client
+    already has this exact representation.
+    """
+    etag = make_etag(payload)
+    if request_matches(etag):
+        return not_modified(etag)
+
+    response = make_response(jsonify(payload), status)
+    response.set_etag(etag, weak=True)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
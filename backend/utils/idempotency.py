@@ -0,0 +1,197 @@
+import hashlib
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from flask import current_app, g, request, jsonify, make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import delete, insert, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import RequestEntityTooLarge
+from backend.extensions import db
+from backend.models.idempotency_key import IdempotencyKey
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+PURGE_INTERVAL = 600  # Seconds between sweeps of expired keys, per process
+CHUNK_SIZE = 64 * 1024
+
+keys_table = IdempotencyKey.__table__
+_last_purge = 0.0
+
+
+def request_fingerprint():
+    """
+    Hash what makes a request "the same": method, path and body.
+
+    Multipart bodies are hashed part by part (the boundary differs between
+    retries): every form field, then every file's name and content, with
+    the file rewound for the endpoint. The form is parsed here, before the
+    endpoint can set its own upload limit, so IDEMPOTENCY_MAX_MULTIPART_BYTES
+    caps it instead. Computed once per request.
+    """
+    if 'idempotency_fingerprint' in g:
+        return g.idempotency_fingerprint
+    digest = hashlib.sha256()
+    digest.update(request.method.encode())
+    digest.update(request.full_path.encode())
+    if request.mimetype == 'multipart/form-data':
+        request.max_content_length = current_app.config['IDEMPOTENCY_MAX_MULTIPART_BYTES']
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f'{len(name)}:{name}={len(value)}:{value}'.encode())
+        for name, upload in sorted(request.files.items(multi=True), key=lambda item: (item[0], item[1].filename or '')):
+            digest.update(f'{len(name)}:{name}@{upload.filename}'.encode())
+            for chunk in iter(lambda: upload.stream.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+            upload.stream.seek(0)
+    else:
+        digest.update(request.get_data(cache=True))
+    g.idempotency_fingerprint = digest.hexdigest()
+    return g.idempotency_fingerprint
+
+
+def is_completed_replay():
+    """
+    Whether this request repeats a completed one whose response is stored.
+
+    Same user, Idempotency-Key and fingerprint, not expired. A single read
+    and no writes, so @rate_limit can ask before spending a token.
+    """
+    if 'idempotent_replay' in g:
+        return g.idempotent_replay
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    replay = False
+    try:
+        identity = get_jwt_identity()
+    except RuntimeError:
+        identity = None  # Not a @jwt_required() route
+    if key and len(key) <= MAX_KEY_LENGTH and identity is not None:
+        try:
+            fingerprint = request_fingerprint()
+        except RequestEntityTooLarge:
+            fingerprint = None
+        replay = fingerprint is not None and db.session.query(IdempotencyKey.id).filter(
+            IdempotencyKey.user_id == int(identity),
+            IdempotencyKey.key == key,
+            IdempotencyKey.status == 'completed',
+            IdempotencyKey.request_hash == fingerprint,
+            IdempotencyKey.expires_at >= datetime.utcnow()
+        ).first() is not None
+    g.idempotent_replay = replay
+    return replay
+
+
+def _purge_expired(now):
+    global _last_purge
+    if time.monotonic() - _last_purge < PURGE_INTERVAL:
+        return
+    _last_purge = time.monotonic()
+    db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.expires_at < now))
+
+
+def _claim(user_id, key, fingerprint, now):
+    """
+    Insert the 'processing' row for this key.
+
+    Returns None when the claim succeeded, otherwise the existing row. An
+    expired row, or a 'processing' row abandoned by a crashed worker, is
+    replaced and the claim retried.
+    """
+    ttl = timedelta(hours=current_app.config['IDEMPOTENCY_KEY_TTL_HOURS'])
+    lock_timeout = timedelta(seconds=current_app.config['IDEMPOTENCY_LOCK_SECONDS'])
+
+    for _ in range(2):
+        try:
+            db.session.execute(insert(IdempotencyKey).values(
+                user_id=user_id, key=key, request_hash=fingerprint,
+                status='processing', created_at=now, expires_at=now + ttl
+            ))
+            db.session.commit()
+            return None
+        except IntegrityError:
+            db.session.rollback()
+
+        existing = db.session.query(
+            IdempotencyKey.id, IdempotencyKey.request_hash, IdempotencyKey.status,
+            IdempotencyKey.response_status, IdempotencyKey.response_body,
+            IdempotencyKey.response_mimetype, IdempotencyKey.created_at, IdempotencyKey.expires_at
+        ).filter_by(user_id=user_id, key=key).first()
+        if existing is None:
+            continue
+
+        stale = existing.expires_at < now or (
+            existing.status == 'processing' and existing.created_at < now - lock_timeout
+        )
+        if not stale:
+            return existing
+        # Only the request that deletes the stale row gets to retry the claim
+        if db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.id == existing.id)).rowcount:
+            db.session.commit()
+        else:
+            db.session.rollback()
+    return existing
+
+
+def idempotent(f):
+    """
+    Decorator making a POST endpoint safe to retry with an Idempotency-Key header.
+
+    The first request with a key runs the endpoint and stores its response;
+    repeats replay that response without touching the business tables.
+    Place it under @jwt_required() (keys are scoped per user) and under any
+    @rate_limit, so the limiter rejects a request before a key is claimed;
+    the limiter lets completed replays through without spending a token.
+    Responses with a 5xx status aren't stored, so the key can be retried.
+    Requests without the header are passed through unchanged.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        key = request.headers.get(IDEMPOTENCY_HEADER)
+        if not key:
+            return f(*args, **kwargs)
+        if len(key) > MAX_KEY_LENGTH:
+            return jsonify({'message': f'{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters'}), 400
+
+        user_id = int(get_jwt_identity())
+        try:
+            fingerprint = request_fingerprint()
+        except RequestEntityTooLarge:
+            return jsonify({'message': 'Request body is too large'}), 413
+        now = datetime.utcnow()
+
+        _purge_expired(now)
+        existing = _claim(user_id, key, fingerprint, now)
+        if existing is not None:
+            if existing.request_hash != fingerprint:
+                return jsonify({'message': f'{IDEMPOTENCY_HEADER} was already used for a different request'}), 422
+            if existing.status != 'completed':
+                return jsonify({'message': 'A request with this Idempotency-Key is still being processed'}), 409
+            response = make_response(existing.response_body, existing.response_status)
+            response.mimetype = existing.response_mimetype or 'application/json'
+            response.headers['Idempotent-Replayed'] = 'true'
+            return response
+
+        try:
+            response = make_response(f(*args, **kwargs))
+        except Exception:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(
+                IdempotencyKey.user_id == user_id, IdempotencyKey.key == key
+            ))
+            db.session.commit()
+            raise
+
+        # Whatever the endpoint left uncommitted is not part of its response
+        db.session.rollback()
+        row = (IdempotencyKey.user_id == user_id) & (IdempotencyKey.key == key)
+        if response.status_code >= 500:
+            db.session.execute(delete(IdempotencyKey).where(row))
+        else:
+            db.session.execute(update(IdempotencyKey).where(row).values(
+                status='completed',
+                response_status=response.status_code,
+                response_body=response.get_data(as_text=True),
+                response_mimetype=response.mimetype
+            ))
+        db.session.commit()
+        return response
+    return decorated_function
@@ -0,0 +1,344 @@
+import glob
+import hmac
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Histogram upper bounds: request/DB time in seconds, statements per request
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 250)
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus sense (not thread-safe; Metrics locks)"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def samples(self):
+        """(le, cumulative count) pairs, ending with +Inf"""
+        running = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            running += count
+            yield bound, running
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(names, values, extra=''):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}'
+
+
+class Metrics:
+    """
+    Per-process request and database metrics.
+
+    Every gunicorn worker keeps its own. With a MetricsDirectory they are
+    summed across workers on each scrape; without one /metrics reports the
+    worker that served the scrape.
+    """
+
+    HISTOGRAMS = (
+        ('request_latency', LATENCY_BUCKETS),
+        ('request_queries', QUERY_COUNT_BUCKETS),
+        ('request_db_time', LATENCY_BUCKETS),
+    )
+    COUNTERS = ('background_queries', 'background_db_time', 'slow_queries')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+        self.pid = os.getpid()  # None for metrics summed over several processes
+        self.request_latency = {}  # (method, endpoint, status) -> Histogram
+        self.request_queries = {}  # (method, endpoint) -> Histogram
+        self.request_db_time = {}  # (method, endpoint) -> Histogram
+        self.background_queries = 0
+        self.background_db_time = 0.0
+        self.slow_queries = 0
+
+    def observe_request(self, method, endpoint, status, duration, queries, db_time):
+        with self._lock:
+            key = (method, endpoint)
+            histogram = self.request_latency.get((method, endpoint, status))
+            if histogram is None:
+                histogram = self.request_latency[(method, endpoint, status)] = Histogram(LATENCY_BUCKETS)
+            histogram.observe(duration)
+            if key not in self.request_queries:
+                self.request_queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+                self.request_db_time[key] = Histogram(LATENCY_BUCKETS)
+            self.request_queries[key].observe(queries)
+            self.request_db_time[key].observe(db_time)
+
+    def observe_background_query(self, duration):
+        with self._lock:
+            self.background_queries += 1
+            self.background_db_time += duration
+
+    def count_slow_query(self):
+        with self._lock:
+            self.slow_queries += 1
+
+    def state(self):
+        """Everything observed so far, as JSON-serialisable data for merge()"""
+        with self._lock:
+            state = {'started_at': self.started_at}
+            for name, _ in self.HISTOGRAMS:
+                state[name] = [[list(key), histogram.counts, histogram.sum, histogram.count]
+                               for key, histogram in getattr(self, name).items()]
+            for name in self.COUNTERS:
+                state[name] = getattr(self, name)
+        return state
+
+    def merge(self, state):
+        """Add another process's state() to this one"""
+        with self._lock:
+            self.started_at = min(self.started_at, state['started_at'])
+            for name, buckets in self.HISTOGRAMS:
+                series = getattr(self, name)
+                for key, counts, total, count in state[name]:
+                    histogram = series.get(tuple(key))
+                    if histogram is None:
+                        histogram = series[tuple(key)] = Histogram(buckets)
+                    histogram.counts = [mine + theirs for mine, theirs in zip(histogram.counts, counts)]
+                    histogram.sum += total
+                    histogram.count += count
+            for name in self.COUNTERS:
+                setattr(self, name, getattr(self, name) + state[name])
+
+    def render(self):
+        """The metrics in the Prometheus text exposition format"""
+        lines = []
+
+        def histogram_family(name, help_text, label_names, series):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} histogram')
+            for label_values, histogram in sorted(series.items()):
+                for bound, count in histogram.samples():
+                    le = f'le="{bound}"'
+                    lines.append(f'{name}_bucket{_labels(label_names, label_values, le)} {count}')
+                lines.append(f'{name}_sum{_labels(label_names, label_values)} {histogram.sum:.6f}')
+                lines.append(f'{name}_count{_labels(label_names, label_values)} {histogram.count}')
+
+        with self._lock:
+            histogram_family('http_request_duration_seconds', 'Request latency by endpoint.',
+                             ('method', 'endpoint', 'status'), self.request_latency)
+            histogram_family('http_request_db_queries', 'SQL statements executed per request.',
+                             ('method', 'endpoint'), self.request_queries)
+            histogram_family('http_request_db_seconds', 'Time spent in SQL per request.',
+                             ('method', 'endpoint'), self.request_db_time)
+            lines.extend([
+                '# HELP db_background_queries_total SQL statements executed outside requests.',
+                '# TYPE db_background_queries_total counter',
+                f'db_background_queries_total {self.background_queries}',
+                '# HELP db_background_seconds_total Time spent in SQL outside requests.',
+                '# TYPE db_background_seconds_total counter',
+                f'db_background_seconds_total {self.background_db_time:.6f}',
+                '# HELP db_slow_queries_total SQL statements slower than SLOW_QUERY_MS.',
+                '# TYPE db_slow_queries_total counter',
+                f'db_slow_queries_total {self.slow_queries}',
+                '# HELP process_start_time_seconds Start time of the process since unix epoch.',
+                '# TYPE process_start_time_seconds gauge',
+                f'process_start_time_seconds{_labels(("pid",), (self.pid,)) if self.pid else ""} {self.started_at:.3f}',
+            ])
+        return '\n'.join(lines) + '\n'
+
+
+class MetricsDirectory:
+    """
+    Per-worker metric snapshots in a shared directory, summed on scrape.
+
+    Each worker writes its own <pid>.json at most once per interval while
+    it serves requests, and again when it is scraped, so another worker's
+    figures may be up to that far behind. Snapshots of workers that exited
+    are folded into retired.json by the gunicorn master (retire_worker),
+    so counters never go backwards when workers are recycled.
+    """
+
+    RETIRED = 'retired.json'
+
+    def __init__(self, path, metrics, interval=1.0):
+        self.path = path
+        self.metrics = metrics
+        self.interval = interval
+        self._written_at = 0.0
+        os.makedirs(path, exist_ok=True)
+
+    def maybe_write(self):
+        if time.monotonic() - self._written_at >= self.interval:
+            self.write()
+
+    def write(self):
+        self._written_at = time.monotonic()
+        _write_state(os.path.join(self.path, f'{os.getpid()}.json'), self.metrics.state())
+
+    def collect(self):
+        """A Metrics holding the sum of every worker's latest snapshot"""
+        self.write()
+        total = Metrics()
+        total.pid = None
+        for filename in glob.glob(os.path.join(self.path, '*.json')):
+            state = _read_state(filename)
+            if state is not None:
+                total.merge(state)
+        return total
+
+
+def _write_state(filename, state):
+    # Readers never see a half-written file
+    temporary = f'{filename}.{os.getpid()}.tmp'
+    with open(temporary, 'w') as output:
+        json.dump(state, output)
+    os.replace(temporary, filename)
+
+
+def _read_state(filename):
+    try:
+        with open(filename) as snapshot:
+            return json.load(snapshot)
+    except (OSError, ValueError):
+        return None
+
+
+def retire_worker(path, pid):
+    """Fold an exited worker's snapshot into retired.json (called from the gunicorn master only)"""
+    filename = os.path.join(path, f'{pid}.json')
+    state = _read_state(filename)
+    if state is None:
+        return
+    retired = Metrics()
+    retired.pid = None
+    previous = _read_state(os.path.join(path, MetricsDirectory.RETIRED))
+    if previous is not None:
+        retired.merge(previous)
+    retired.merge(state)
+    _write_state(os.path.join(path, MetricsDirectory.RETIRED), retired.state())
+    os.remove(filename)
+
+
+def clear_metrics_directory(path):
+    """Drop snapshots left by an earlier server run (called before workers start)"""
+    for filename in glob.glob(os.path.join(path, '*.json')):
+        os.remove(filename)
+
+
+def redact_parameters(parameters):
+    """Statement parameters with every value replaced by its type name"""
+    if isinstance(parameters, dict):
+        return {key: type(value).__name__ for key, value in parameters.items()}
+    if isinstance(parameters, (list, tuple)):
+        if parameters and isinstance(parameters[0], (list, tuple, dict)):
+            return f'<{len(parameters)} parameter sets>'
+        return [type(value).__name__ for value in parameters]
+    return type(parameters).__name__
+
+
+def _endpoint():
+    rule = request.url_rule
+    # The route pattern, not the path, so ids don't explode the label set
+    return rule.rule if rule is not None else '<unmatched>'
+
+
+def init_instrumentation(app, db):
+    """
+    Request timing, SQL counting and the slow-query log.
+
+    With METRICS_ENABLED off nothing is registered: no request hooks, no
+    cursor events and no /metrics route. When on, each request records its
+    latency, statement count and DB time per endpoint; statements slower
+    than SLOW_QUERY_MS are logged with their parameters redacted.
+    SERVER_TIMING_ENABLED adds a Server-Timing header (app and db time) to
+    every response. /metrics is only served when METRICS_TOKEN is set, and
+    then requires it as a bearer token. With METRICS_MULTIPROC_DIR set
+    (several gunicorn workers) it reports the sum over all workers.
+    """
+    if not app.config.get('METRICS_ENABLED'):
+        return None
+
+    metrics = Metrics()
+    app.extensions['metrics'] = metrics
+    directory = None
+    if app.config.get('METRICS_MULTIPROC_DIR'):
+        directory = MetricsDirectory(app.config['METRICS_MULTIPROC_DIR'], metrics)
+        app.extensions['metrics_directory'] = directory
+    slow_query_seconds = app.config.get('SLOW_QUERY_MS', 200) / 1000.0
+    server_timing = app.config.get('SERVER_TIMING_ENABLED', False)
+    token = app.config.get('METRICS_TOKEN')
+
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started_at', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        duration = time.perf_counter() - conn.info['query_started_at'].pop()
+
+        stats = g.get('_request_stats') if has_request_context() else None
+        if stats is not None:
+            stats[1] += 1
+            stats[2] += duration
+        else:
+            metrics.observe_background_query(duration)
+
+        if duration >= slow_query_seconds:
+            metrics.count_slow_query()
+            logger.warning('Slow query (%.1f ms) in %s: %s; parameters: %s',
+                           duration * 1000, _endpoint() if has_request_context() else 'background',
+                           ' '.join(statement.split()), redact_parameters(parameters))
+
+    @app.before_request
+    def _start_request_timer():
+        # [started_at, statements, db seconds]
+        g._request_stats = [time.perf_counter(), 0, 0.0]
+
+    @app.after_request
+    def _record_request(response):
+        stats = g.pop('_request_stats', None)
+        if stats is None:
+            return response
+        duration = time.perf_counter() - stats[0]
+        metrics.observe_request(request.method, _endpoint(), response.status_code, duration, stats[1], stats[2])
+        if directory is not None:
+            directory.maybe_write()
+        if server_timing:
+            response.headers.add(
+                'Server-Timing',
+                f'app;dur={duration * 1000:.1f}, db;dur={stats[2] * 1000:.1f};desc="{stats[1]} queries"'
+            )
+        return response
+
+    if not token:
+        # Route patterns, latencies and slow-query counts aren't for the public
+        logger.info('METRICS_TOKEN is not set; /metrics is not served')
+        return metrics
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode()):
+            return Response('Unauthorized\n', status=401, mimetype='text/plain')
+        current = directory.collect() if directory is not None else metrics
+        return Response(current.render(), mimetype='text/plain; version=0.0.4')
+
+    return metrics
@@ -0,0 +1,69 @@
+import logging
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # Optional; the stdlib provider is used without it
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    Flask's JSON provider with orjson doing the work.
+
+    Produces the same documents as DefaultJSONProvider: keys sorted when
+    sort_keys is set, dates as HTTP dates and other non-native values
+    through the same default(). The one visible difference is that
+    non-ASCII text is written as UTF-8 rather than \\u escapes. Anything
+    orjson refuses (integers beyond 64 bits, say) and calls with json.dumps
+    keyword arguments go to the stdlib provider.
+    """
+
+    def _options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _encode(self, obj, indent=False):
+        try:
+            return orjson.dumps(obj, default=self.default, option=self._options(indent))
+        except TypeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        if not kwargs:
+            encoded = self._encode(obj)
+            if encoded is not None:
+                return encoded.decode()
+        return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if kwargs:
+            return super().loads(s, **kwargs)
+        # orjson.JSONDecodeError is a json.JSONDecodeError, so callers see the usual error
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = (self.compact is None and self._app.debug) or self.compact is False
+        encoded = self._encode(obj, indent)
+        if encoded is None:
+            return super().response(obj)
+        return self._app.response_class(encoded + b'\n', mimetype=self.mimetype)
+
+
+def init_json_provider(app):
+    """Install the JSON_PROVIDER named in the config ('orjson' or 'default')"""
+    name = app.config.get('JSON_PROVIDER', 'default')
+    if name == 'orjson':
+        if orjson is None:
+            logger.warning('JSON_PROVIDER=orjson but orjson is not installed; using the default provider')
+            return
+        app.json = OrjsonProvider(app)
+    elif name != 'default':
+        raise ValueError(f'Unknown JSON_PROVIDER: {name}')
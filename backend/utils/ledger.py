@@ -0,0 +1,234 @@
+from sqlalchemy import event, func, insert
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+from backend.models.ledger_posting import LedgerPosting
+from backend.utils.partner_metrics import mark_partner_metrics_stale
+from backend.utils.activity import record_activity
+
+# Minor units per major unit: hundredths of a point and cents
+POINTS_SCALE = 100
+USD_SCALE = 100
+
+USER_POINTS_ACCOUNT = 'user:points'
+USER_EARNINGS_ACCOUNT = 'user:earnings'
+
+BALANCE_COLUMNS = ('points_balance', 'total_points_earned', 'total_points_withdrawn',
+                   'total_earnings', 'total_withdrawn')
+
+users_table = User.__table__
+
+# Activity feed event written for each transaction type
+TRANSACTION_ACTIVITY = {
+    TransactionType.EARNING: 'task_completion',
+    TransactionType.CODE_REDEMPTION: 'code_redemption',
+    TransactionType.POINT_WITHDRAWAL: 'withdrawal_request',
+    TransactionType.REFERRAL_BONUS: 'referral_bonus',
+    TransactionType.ADMIN_ADJUSTMENT: 'admin_adjustment',
+    TransactionType.DEPOSIT: 'deposit',
+}
+
+
+class InsufficientFundsError(Exception):
+    """Raised when a debit would take a user's points balance below zero"""
+
+
+@event.listens_for(LedgerPosting, 'before_update')
+@event.listens_for(LedgerPosting, 'before_delete')
+def _refuse_posting_changes(mapper, connection, target):
+    raise ValueError('Ledger postings are append-only; post a reversal instead')
+
+
+def to_minor(value, scale):
+    return int(round((value or 0) * scale))
+
+
+def from_minor(value, scale):
+    return value / scale
+
+
+def balance_deltas(type, points_minor, amount_minor):
+    """
+    Map a transaction's signed amounts onto the User balance columns.
+
+    Withdrawals also move the withdrawn totals; every other type credits or
+    debits the balance, with debits counted as points withdrawn. Referral
+    bonuses also feed the referral earnings counters.
+    """
+    deltas = {'points_balance': points_minor, 'total_earnings': amount_minor}
+
+    if type == TransactionType.REFERRAL_BONUS:
+        deltas['referral_points_earned'] = points_minor
+        deltas['referral_earnings'] = amount_minor
+
+    if type == TransactionType.POINT_WITHDRAWAL:
+        deltas['total_points_withdrawn'] = -points_minor
+        deltas['total_withdrawn'] = -amount_minor
+    elif points_minor > 0:
+        deltas['total_points_earned'] = points_minor
+    elif points_minor < 0:
+        deltas['total_points_withdrawn'] = -points_minor
+
+    return {column: delta for column, delta in deltas.items() if delta}
+
+
+def _apply_deltas(user_id, deltas, require_funds, bump_version=False):
+    """Apply balance deltas with one atomic UPDATE; no read-modify-write in Python"""
+    if not deltas:
+        return
+
+    values = {}
+    for column, delta in deltas.items():
+        scale = POINTS_SCALE if 'points' in column else USD_SCALE
+        values[column] = func.round(
+            func.coalesce(users_table.c[column], 0) + from_minor(delta, scale), 2
+        )
+
+    # Callers that don't also write a Transaction through the ORM bump the version here
+    if bump_version:
+        values['ledger_version'] = users_table.c.ledger_version + 1
+
+    stmt = users_table.update().where(users_table.c.id == user_id).values(**values)
+
+    points_delta = deltas.get('points_balance', 0)
+    if require_funds and points_delta < 0:
+        stmt = stmt.where(users_table.c.points_balance >= from_minor(-points_delta, POINTS_SCALE))
+
+    result = db.session.execute(stmt)
+    if result.rowcount == 0:
+        if require_funds:
+            raise InsufficientFundsError('Insufficient points balance')
+        raise ValueError(f'User {user_id} not found')
+
+    # The identity-map copy is stale now; reload these columns on next access
+    user = db.session.identity_map.get(db.session.identity_key(User, ident=user_id))
+    if user is not None:
+        db.session.expire(user, list(deltas.keys()))
+
+
+def _journal_lines(transaction_id, user_id, type, points_minor, amount_minor, is_reversal=False):
+    """Balanced postings: the user's account against the platform account for the type"""
+    counter_account = f'platform:{type.value}'
+    lines = []
+    for commodity, user_account, amount in (('PTS', USER_POINTS_ACCOUNT, points_minor),
+                                            ('USD', USER_EARNINGS_ACCOUNT, amount_minor)):
+        if not amount:
+            continue
+        lines.append({'transaction_id': transaction_id, 'user_id': user_id, 'account': user_account,
+                      'commodity': commodity, 'amount_minor': amount, 'is_reversal': is_reversal})
+        lines.append({'transaction_id': transaction_id, 'user_id': None, 'account': counter_account,
+                      'commodity': commodity, 'amount_minor': -amount, 'is_reversal': is_reversal})
+    return lines
+
+
+def _insert_lines(lines):
+    # One multi-row INSERT; postings are never loaded back into the session
+    if lines:
+        db.session.execute(insert(LedgerPosting), lines)
+
+
+def post(user_id, type, points=0, amount=0.0, description=None,
+         status=TransactionStatus.COMPLETED, reference_id=None, require_funds=False):
+    """
+    Record a balance change for a user.
+
+    Writes the Transaction, its balanced ledger postings, the matching
+    atomic increments to the user's balance columns and an activity feed
+    event, all in the current session (the caller commits). points and
+    amount are signed.
+
+    Args:
+        user_id: User whose balance changes
+        type: TransactionType
+        points: Signed points delta
+        amount: Signed USD delta
+        description: Transaction description
+        status: Transaction status (pending withdrawals still move the balance)
+        reference_id: Optional reference stored on the transaction
+        require_funds: Refuse debits that would make the points balance negative
+
+    Returns:
+        Transaction: The new, flushed transaction
+
+    Raises:
+        InsufficientFundsError: If require_funds is set and the balance is too low
+    """
+    points_minor = to_minor(points, POINTS_SCALE)
+    amount_minor = to_minor(amount, USD_SCALE)
+
+    # Balance first: if the guard fails nothing has been written yet
+    _apply_deltas(user_id, balance_deltas(type, points_minor, amount_minor), require_funds)
+
+    transaction = Transaction(
+        user_id=user_id,
+        type=type,
+        status=status,
+        description=description,
+        amount=from_minor(amount_minor, USD_SCALE),
+        points_amount=from_minor(points_minor, POINTS_SCALE),
+        reference_id=str(reference_id) if reference_id is not None else None
+    )
+    db.session.add(transaction)
+    db.session.flush()
+
+    _insert_lines(_journal_lines(transaction.id, user_id, type, points_minor, amount_minor))
+    record_activity(
+        TRANSACTION_ACTIVITY[type],
+        user_id=user_id,
+        subject_id=transaction.id,
+        points=abs(transaction.points_amount),
+        cash_value=abs(transaction.amount),
+        task_title=description,
+        code=transaction.reference_id if type == TransactionType.CODE_REDEMPTION else None,
+        status=status.value
+    )
+    if type == TransactionType.REFERRAL_BONUS:
+        mark_partner_metrics_stale(user_id)
+    return transaction
+
+
+def reverse(transaction, status=TransactionStatus.FAILED):
+    """
+    Undo a posted transaction (e.g. a rejected withdrawal).
+
+    Appends negated postings, reverses the balance effects and sets the
+    transaction's status; the original postings are left untouched.
+    """
+    points_minor = to_minor(transaction.points_amount, POINTS_SCALE)
+    amount_minor = to_minor(transaction.amount, USD_SCALE)
+
+    deltas = balance_deltas(transaction.type, points_minor, amount_minor)
+    _apply_deltas(transaction.user_id, {column: -delta for column, delta in deltas.items()}, False)
+
+    transaction.status = status
+    _insert_lines(_journal_lines(transaction.id, transaction.user_id, transaction.type,
+                                 -points_minor, -amount_minor, is_reversal=True))
+    if transaction.type == TransactionType.REFERRAL_BONUS:
+        mark_partner_metrics_stale(transaction.user_id)
+    return transaction
+
+
+def reverse_many(rows):
+    """
+    Reverse many transactions at once (bulk withdrawal rejection).
+
+    rows are (transaction_id, user_id, type, points_amount, amount) tuples
+    whose status the caller has already updated. Refunds are summed per
+    user so each user's row is updated once, and all reversal postings go
+    in a single INSERT.
+    """
+    per_user = {}
+    lines = []
+    for transaction_id, user_id, type, points_amount, amount in rows:
+        points_minor = to_minor(points_amount, POINTS_SCALE)
+        amount_minor = to_minor(amount, USD_SCALE)
+        refunds = per_user.setdefault(user_id, {})
+        for column, delta in balance_deltas(type, points_minor, amount_minor).items():
+            refunds[column] = refunds.get(column, 0) - delta
+        lines.extend(_journal_lines(transaction_id, user_id, type, -points_minor, -amount_minor, is_reversal=True))
+        if type == TransactionType.REFERRAL_BONUS:
+            mark_partner_metrics_stale(user_id)
+
+    for user_id, deltas in per_user.items():
+        _apply_deltas(user_id, deltas, False, bump_version=True)
+    _insert_lines(lines)
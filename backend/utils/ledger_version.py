@@ -0,0 +1,81 @@
+from functools import wraps
+from flask import make_response
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.transaction import Transaction
+from backend.models.notification import Notification
+from backend.utils.http_cache import request_matches, not_modified
+
+users_table = User.__table__
+
+
+def bump_ledger_version(user_id, connection=None):
+    """
+    Increment a user's ledger version.
+
+    Use this after bulk query.update()/delete() calls on transactions or
+    notifications, which bypass the ORM events below.
+    """
+    stmt = users_table.update().where(users_table.c.id == user_id).values(
+        ledger_version=users_table.c.ledger_version + 1
+    )
+    if connection is not None:
+        connection.execute(stmt)
+    else:
+        db.session.execute(stmt)
+
+
+def get_ledger_version(user_id):
+    """Fetch a user's current ledger version (a single primary-key lookup)"""
+    return db.session.query(User.ledger_version).filter(User.id == user_id).scalar()
+
+
+def _bump_owner(mapper, connection, target):
+    if target.user_id:
+        bump_ledger_version(target.user_id, connection)
+
+
+def _bump_on_user_update(mapper, connection, target):
+    # Any change to the user's own row (balances, profile, suspension...) moves the version
+    if db.session.is_modified(target, include_collections=False):
+        target.ledger_version = User.ledger_version + 1
+
+
+for _model in (Transaction, Notification):
+    event.listen(_model, 'after_insert', _bump_owner)
+    event.listen(_model, 'after_update', _bump_owner)
+    event.listen(_model, 'after_delete', _bump_owner)
+
+event.listen(User, 'before_update', _bump_on_user_update)
+
+
+def ledger_etag(scope):
+    """
+    Decorator deriving a weak ETag from the current user's ledger version.
+
+    If-None-Match requests whose tag is still current get a 304 after one
+    version lookup, without running the view. Apply it after jwt_required
+    and before any decorator that loads the user.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            user_id = int(get_jwt_identity())
+            version = get_ledger_version(user_id)
+
+            if version is None:
+                return f(*args, **kwargs)
+
+            etag = f'{scope}-{user_id}-{version}'
+            if request_matches(etag):
+                return not_modified(etag)
+
+            response = make_response(f(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=True)
+                response.headers['Cache-Control'] = 'private, no-cache'
+            return response
+        return decorated_function
+    return decorator
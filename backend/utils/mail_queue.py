@@ -0,0 +1,45 @@
+import logging
+import queue
+from backend.utils.background import ProcessThread
+from backend.utils.emailer import Emailer
+
+logger = logging.getLogger(__name__)
+
+
+class MailQueue:
+    """
+    Sends Emailer messages from a background thread.
+
+    Requests enqueue the Emailer method name and its arguments and return
+    immediately instead of waiting on SMTP. Messages still queued when the
+    process exits are lost; the in-app notifications written alongside
+    them are the durable record.
+    """
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._worker = ProcessThread(self._run, 'mail-queue')
+
+    def enqueue(self, email_method, /, **kwargs):
+        """Queue Emailer().<method>(**kwargs)"""
+        self._worker.ensure_started()
+        self._queue.put((email_method, kwargs))
+
+    def _run(self):
+        emailer = Emailer()
+        while True:
+            method, kwargs = self._queue.get()
+            try:
+                if not getattr(emailer, method)(**kwargs):
+                    logger.warning("Queued email %s to %s was not sent", method, kwargs.get('user_email') or kwargs.get('recipient_email'))
+            except Exception:
+                logger.exception("Queued email %s failed", method)
+            finally:
+                self._queue.task_done()
+
+
+mail_queue = MailQueue()
+
+
+def queue_email(email_method, /, **kwargs):
+    mail_queue.enqueue(email_method, **kwargs)
@@ -0,0 +1,126 @@
+import json
+from bisect import bisect_right
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from backend.extensions import db
+from backend.models.user import User
+from backend.utils.referral_tree import downline_summary
+from backend.utils.ttl_cache import cache
+
+# Default tier table: a partner is in the highest tier whose
+# min_referrals they have reached. Override with PARTNER_TIERS (JSON list).
+DEFAULT_TIERS = (
+    {'name': 'bronze', 'min_referrals': 0, 'referral_bonus': 5.0, 'monthly_payout': 'Net 30'},
+    {'name': 'silver', 'min_referrals': 100, 'referral_bonus': 7.5, 'monthly_payout': 'Net 15'},
+    {'name': 'gold', 'min_referrals': 500, 'referral_bonus': 10.0, 'monthly_payout': 'Net 7'},
+    {'name': 'platinum', 'min_referrals': 1000, 'referral_bonus': 15.0, 'monthly_payout': 'Net 7'},
+)
+SNAPSHOT_TTL = 60  # Seconds
+
+_parsed_tiers = {}
+
+
+def _cache_key(partner_id):
+    return f'partners:metrics:{partner_id}'
+
+
+def parse_tiers(raw):
+    """
+    Validate a tier table and sort it by min_referrals.
+
+    raw is a JSON string or a list of {'name', 'min_referrals',
+    'referral_bonus', 'monthly_payout'} dicts; the lowest tier must start
+    at 0 referrals so every partner has one.
+    """
+    tiers = json.loads(raw) if isinstance(raw, str) else raw
+    if not tiers:
+        raise ValueError('Partner tier table is empty')
+
+    tiers = sorted(({
+        'name': str(tier['name']),
+        'min_referrals': int(tier['min_referrals']),
+        'referral_bonus': float(tier['referral_bonus']),
+        'monthly_payout': str(tier.get('monthly_payout', ''))
+    } for tier in tiers), key=lambda tier: tier['min_referrals'])
+
+    if tiers[0]['min_referrals'] != 0:
+        raise ValueError('The lowest partner tier must have min_referrals 0')
+    return tuple(tiers)
+
+
+def get_tiers():
+    """The configured tier table (PARTNER_TIERS), parsed once per distinct value"""
+    raw = current_app.config.get('PARTNER_TIERS') if has_app_context() else None
+    if not raw:
+        return DEFAULT_TIERS
+    tiers = _parsed_tiers.get(raw)
+    if tiers is None:
+        tiers = _parsed_tiers[raw] = parse_tiers(raw)
+    return tiers
+
+
+def tier_for(referral_count, tiers=None):
+    """(tier, next_tier) for a referral count; next_tier is None at the top"""
+    tiers = tiers or get_tiers()
+    position = bisect_right([tier['min_referrals'] for tier in tiers], referral_count) - 1
+    next_tier = tiers[position + 1] if position + 1 < len(tiers) else None
+    return tiers[position], next_tier
+
+
+def _compute(partner_id):
+    row = db.session.query(
+        User.referral_count, User.referral_earnings, User.referral_points_earned, User.created_at
+    ).filter(User.id == partner_id).first()
+    if row is None:
+        return None
+
+    referral_count = row.referral_count or 0
+    tiers = get_tiers()
+    tier, next_tier = tier_for(referral_count, tiers)
+    network = downline_summary(partner_id)
+
+    return {
+        'referred_users_count': referral_count,
+        'total_earnings': abs(row.referral_earnings or 0.0),
+        'total_points_earned': abs(row.referral_points_earned or 0.0),
+        'partner_since': row.created_at.isoformat() if row.created_at else None,
+        'tier': tier,
+        'next_tier': next_tier,
+        'tier_requirements': {t['name']: t['min_referrals'] for t in tiers[1:]},
+        'network': network
+    }
+
+
+def get_partner_snapshot(partner_id):
+    """
+    Referral metrics, tier and network summary for one partner.
+
+    Built from the maintained counters on the user row plus one closure
+    table query, and cached for SNAPSHOT_TTL. The entry is dropped when a
+    commit in this process adds a referral under the partner or posts a
+    referral bonus to them; network earnings can otherwise lag by the TTL.
+    Returns None for an unknown user.
+    """
+    return cache.get_or_set(_cache_key(partner_id), SNAPSHOT_TTL, lambda: _compute(partner_id))
+
+
+def invalidate_partner_metrics(*partner_ids):
+    cache.invalidate(*[_cache_key(partner_id) for partner_id in partner_ids])
+
+
+def mark_partner_metrics_stale(*partner_ids):
+    """Drop these partners' snapshots once the current transaction commits"""
+    db.session.info.setdefault('partner_metrics_stale', set()).update(partner_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_stale(session):
+    partner_ids = session.info.pop('partner_metrics_stale', None)
+    if partner_ids:
+        invalidate_partner_metrics(*partner_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale(session):
+    session.info.pop('partner_metrics_stale', None)
@@ -0,0 +1,128 @@
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from flask import Response, g, request
+from backend.utils.admin_auth import admin_required
+
+_pyinstrument = []  # [Profiler class or None] once looked up
+
+PSTATS_SORT_KEYS = ('cumulative', 'tottime', 'ncalls')
+PSTATS_LINES = 60
+
+
+def _pyinstrument_profiler():
+    """pyinstrument's Profiler, imported on first use; None when not installed"""
+    if not _pyinstrument:
+        try:
+            from pyinstrument import Profiler
+        except ImportError:  # Optional; cProfile is always available
+            Profiler = None
+        _pyinstrument.append(Profiler)
+    return _pyinstrument[0]
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    module = os.path.splitext(os.path.basename(code.co_filename))[0]
+    # ';' separates frames in the collapsed format
+    return f'{code.co_name} ({module}:{frame.f_lineno})'.replace(';', ':')
+
+
+def collapse_stack(frame, thread_name):
+    """One stack as 'thread;outermost;...;innermost'"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.append(thread_name.replace(';', ':'))
+    return ';'.join(reversed(labels))
+
+
+def sample_stacks(seconds, interval=0.005):
+    """
+    Sample every other thread of this process for the given time.
+
+    Returns a Counter of collapsed stacks; each sample of each thread
+    counts once. The calling thread (and the stacks it would add) is left
+    out, so under a sync worker there is nothing else to see.
+    """
+    own_id = threading.get_ident()
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id != own_id:
+                stacks[collapse_stack(frame, names.get(thread_id, f'thread-{thread_id}'))] += 1
+        time.sleep(interval)
+    return stacks
+
+
+def render_collapsed(stacks):
+    """Brendan Gregg's collapsed-stack format, as read by flamegraph.pl and speedscope"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.most_common())
+
+
+def _render_cprofile(profiler, sort):
+    output = io.StringIO()
+    stats = pstats.Stats(profiler, stream=output)
+    stats.sort_stats(sort if sort in PSTATS_SORT_KEYS else 'cumulative').print_stats(PSTATS_LINES)
+    return output.getvalue()
+
+
+def init_profiling(app):
+    """
+    ?__profile=1 on any request returns that request's profile instead of its body.
+
+    Only registered when PROFILING_ENABLED is set, so normal requests pay
+    nothing otherwise. The caller must pass admin_required; '1' or
+    'cprofile' runs cProfile (sort with __profile_sort), 'pyinstrument'
+    uses pyinstrument when it is installed.
+    """
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+
+    allow_admin = admin_required(lambda: None)
+
+    @app.before_request
+    def _start_request_profile():
+        mode = request.args.get('__profile')
+        if not mode or mode == '0':
+            return None
+
+        denied = allow_admin()
+        if denied is not None:
+            return denied
+
+        if mode == 'pyinstrument' and _pyinstrument_profiler() is not None:
+            profiler = _pyinstrument_profiler()()
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        g._request_profiler = profiler
+        return None
+
+    @app.after_request
+    def _finish_request_profile(response):
+        profiler = g.pop('_request_profiler', None)
+        if profiler is None:
+            return response
+
+        if isinstance(profiler, cProfile.Profile):
+            profiler.disable()
+            body = _render_cprofile(profiler, request.args.get('__profile_sort', 'cumulative'))
+        else:
+            profiler.stop()
+            body = profiler.output_text(unicode=True, color=False)
+
+        if request.args.get('__profile') == 'pyinstrument' and _pyinstrument_profiler() is None:
+            body = 'pyinstrument is not installed; showing cProfile output\n\n' + body
+        profiled = Response(body, mimetype='text/plain')
+        profiled.headers['X-Profiled-Status'] = str(response.status_code)
+        return profiled
@@ -0,0 +1,195 @@
+import logging
+import hashlib
+import os
+import queue
+import uuid
+from backend.utils.background import ProcessThread
+
+logger = logging.getLogger(__name__)
+
+# Sniffed from the first bytes of the upload; the extension is never trusted
+IMAGE_SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpeg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+    (b'BM', 'bmp'),
+)
+
+REVIEW_MAX_SIZE = (1600, 1600)
+THUMBNAIL_MAX_SIZE = (320, 320)
+REVIEW_QUALITY = 82
+THUMBNAIL_QUALITY = 70
+CHUNK_SIZE = 64 * 1024
+
+
+class ProofImageError(ValueError):
+    """Raised for uploads that are too large or are not images"""
+
+
+def sniff_image_type(head):
+    """Return the image format from a file's leading bytes, or None"""
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    for signature, image_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return image_type
+    return None
+
+
+class ProofImagePipeline:
+    """
+    Ingests task proof images.
+
+    The request only streams the upload into an incoming folder (enforcing
+    the size limit) and queues it. A background worker then decodes it,
+    drops EXIF metadata, writes a review-size JPEG and a thumbnail under a
+    content-hash path and records both on the UserTask.
+
+    Re-encoding needs Pillow. Without it uploads stay in the incoming folder
+    (which is never served) with the UserTask still processing; the next
+    process that has Pillow picks them up. Raw uploads are never published,
+    as they would carry the camera's EXIF data, GPS position included.
+    """
+
+    def __init__(self, app, upload_root, max_bytes, run_async=True):
+        self.app = app
+        self.upload_root = upload_root
+        self.incoming_dir = os.path.join(upload_root, 'incoming')
+        self.max_bytes = max_bytes
+        self.run_async = run_async
+        self._queue = queue.Queue()
+        self._worker = ProcessThread(self._run, 'proof-image-worker')
+        os.makedirs(self.incoming_dir, exist_ok=True)
+
+    def save_upload(self, file_storage, user_task_id):
+        """
+        Stream an uploaded file into the incoming folder.
+
+        Returns the incoming path. Raises ProofImageError if the upload is
+        over the size limit or doesn't start with a known image signature.
+        """
+        head = file_storage.stream.read(16)
+        if not sniff_image_type(head):
+            raise ProofImageError('Uploaded file is not a supported image')
+
+        path = os.path.join(self.incoming_dir, f'{user_task_id}-{uuid.uuid4().hex}.upload')
+        written = len(head)
+        try:
+            with open(path, 'wb') as out:
+                out.write(head)
+                while True:
+                    chunk = file_storage.stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    written += len(chunk)
+                    if written > self.max_bytes:
+                        raise ProofImageError(f'Image is larger than {self.max_bytes // (1024 * 1024)} MB')
+                    out.write(chunk)
+        except Exception:
+            if os.path.exists(path):
+                os.remove(path)
+            raise
+        return path
+
+    def enqueue(self, incoming_path):
+        """Hand a saved upload to the worker (call after the UserTask is committed)"""
+        if not self.run_async:
+            self._process(incoming_path)
+            return
+        if self._worker.ensure_started():
+            # Pick up uploads left behind by a previous process
+            for name in sorted(os.listdir(self.incoming_dir)):
+                if name.endswith('.upload'):
+                    self._queue.put(os.path.join(self.incoming_dir, name))
+        self._queue.put(incoming_path)
+
+    def _run(self):
+        while True:
+            incoming_path = self._queue.get()
+            try:
+                self._process(incoming_path)
+            except Exception:
+                logger.exception("Proof image processing failed for %s", incoming_path)
+
+    def _process(self, incoming_path):
+        if not os.path.exists(incoming_path):
+            return
+        try:
+            import PIL  # noqa: F401
+        except ImportError:
+            logger.warning("Pillow is not installed; proof image %s stays pending", incoming_path)
+            return
+
+        user_task_id = int(os.path.basename(incoming_path).split('-', 1)[0])
+        try:
+            image_url, thumb_url = self._store(incoming_path)
+            status = 'ready'
+        except Exception as e:
+            logger.warning("Rejected proof image for user task %s: %s", user_task_id, e)
+            image_url, thumb_url, status = None, None, 'failed'
+        finally:
+            if os.path.exists(incoming_path):
+                os.remove(incoming_path)
+
+        from backend.extensions import db
+        from backend.models.task import UserTask
+
+        with self.app.app_context():
+            user_task = db.session.get(UserTask, user_task_id)
+            if user_task is None:
+                return
+            user_task.proof_image = image_url
+            user_task.proof_image_thumb = thumb_url
+            user_task.proof_image_status = status
+            db.session.commit()
+
+    def _store(self, incoming_path):
+        """Write the review and thumbnail variants; returns their URLs"""
+        digest = hashlib.sha256()
+        with open(incoming_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                digest.update(chunk)
+        content_hash = digest.hexdigest()
+
+        # Two-level fan-out keeps directories small
+        relative_dir = content_hash[:2]
+        target_dir = os.path.join(self.upload_root, relative_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        url_prefix = f'/uploads/task_proofs/{relative_dir}'
+
+        from PIL import Image, ImageOps
+
+        review_name = f'{content_hash}.jpg'
+        thumb_name = f'{content_hash}_thumb.jpg'
+        review_path = os.path.join(target_dir, review_name)
+        thumb_path = os.path.join(target_dir, thumb_name)
+
+        # Identical uploads were already processed
+        if os.path.exists(review_path) and os.path.exists(thumb_path):
+            return f'{url_prefix}/{review_name}', f'{url_prefix}/{thumb_name}'
+
+        with Image.open(incoming_path) as image:
+            image.verify()
+
+        with Image.open(incoming_path) as image:
+            # Apply the EXIF orientation before the metadata is dropped
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'L'):
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                rgba = image.convert('RGBA')
+                background.paste(rgba, mask=rgba.split()[-1])
+                image = background
+
+            review = image.copy()
+            review.thumbnail(REVIEW_MAX_SIZE)
+            # Saving without exif= writes no EXIF block
+            review.save(review_path + '.tmp', 'JPEG', quality=REVIEW_QUALITY, optimize=True, progressive=True)
+
+            thumb = image.copy()
+            thumb.thumbnail(THUMBNAIL_MAX_SIZE)
+            thumb.save(thumb_path + '.tmp', 'JPEG', quality=THUMBNAIL_QUALITY, optimize=True)
+
+        os.replace(review_path + '.tmp', review_path)
+        os.replace(thumb_path + '.tmp', thumb_path)
+        return f'{url_prefix}/{review_name}', f'{url_prefix}/{thumb_name}'
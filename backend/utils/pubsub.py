@@ -0,0 +1,241 @@
+import logging
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+from flask import current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from backend.utils.background import ProcessThread
+
+logger = logging.getLogger(__name__)
+
+# 'scope' claim of the short-lived tokens that open /api/stream from a query string
+STREAM_TOKEN_SCOPE = 'stream'
+
+
+class Subscription:
+    """A single listener's mailbox on one channel"""
+
+    def __init__(self, broker, channel, maxsize=100):
+        self.broker = broker
+        self.channel = channel
+        self._queue = queue.Queue(maxsize=maxsize)
+
+    def put(self, message):
+        try:
+            self._queue.put_nowait(message)
+        except queue.Full:
+            # A stalled client must not block publishers; it resyncs on the next message
+            pass
+
+    def get(self, timeout=None):
+        """Wait for the next message, returning None on timeout"""
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class InProcessBroker:
+    """
+    Pub/sub between threads of a single process.
+
+    Enough for the development server and single-worker deployments. With
+    several worker processes, use SQLiteBroker so a write handled by one
+    worker reaches streams held open by another.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            listeners = self._subscribers.get(subscription.channel)
+            if listeners:
+                listeners.discard(subscription)
+                if not listeners:
+                    del self._subscribers[subscription.channel]
+
+    def publish(self, channel, message):
+        self._deliver(channel, message)
+
+    def _deliver(self, channel, message):
+        with self._lock:
+            listeners = list(self._subscribers.get(channel, ()))
+        for subscription in listeners:
+            subscription.put(message)
+
+
+class SQLiteBroker(InProcessBroker):
+    """
+    Pub/sub shared by every worker process on one host.
+
+    Messages are appended to a small SQLite file kept apart from the main
+    database. Each process runs one poller thread that reads rows past its
+    high-water mark and hands them to its local subscribers, so the number
+    of open streams does not multiply the polling cost.
+    """
+
+    def __init__(self, path, poll_interval=0.5, retention_seconds=60):
+        super().__init__()
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._poller = ProcessThread(self._poll, 'pubsub-sqlite-poller')
+
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS pubsub_messages ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, '
+            'channel TEXT NOT NULL, '
+            'payload TEXT NOT NULL, '
+            'created_at REAL NOT NULL)'
+        )
+        conn.commit()
+
+    def _connect(self):
+        # Connections are per thread and never reused across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def subscribe(self, channel):
+        self._poller.ensure_started()
+        return super().subscribe(channel)
+
+    def publish(self, channel, message):
+        self._connect().execute(
+            'INSERT INTO pubsub_messages (channel, payload, created_at) VALUES (?, ?, ?)',
+            (channel, json.dumps(message, default=str), time.time())
+        )
+
+    def _poll(self):
+        conn = self._connect()
+        last_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM pubsub_messages').fetchone()[0]
+        last_prune = time.time()
+
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                rows = conn.execute(
+                    'SELECT id, channel, payload FROM pubsub_messages WHERE id > ? ORDER BY id',
+                    (last_id,)
+                ).fetchall()
+                for message_id, channel, payload in rows:
+                    last_id = message_id
+                    self._deliver(channel, json.loads(payload))
+
+                # Messages are only needed until every poller has seen them
+                if time.time() - last_prune > self.retention_seconds:
+                    conn.execute(
+                        'DELETE FROM pubsub_messages WHERE created_at < ?',
+                        (time.time() - self.retention_seconds,)
+                    )
+                    last_prune = time.time()
+            except sqlite3.Error:
+                logger.exception("Pub/sub poll failed")
+
+
+def init_pubsub(app, instance_path):
+    """Create the broker selected by PUBSUB_BACKEND ('memory' or 'sqlite')"""
+    backend = app.config.get('PUBSUB_BACKEND', 'memory')
+    if backend == 'sqlite':
+        path = app.config.get('PUBSUB_SQLITE_PATH') or os.path.join(instance_path, 'pubsub.db')
+        broker = SQLiteBroker(path)
+    elif backend == 'memory':
+        broker = InProcessBroker()
+    else:
+        raise ValueError(f'Unknown PUBSUB_BACKEND: {backend}')
+
+    app.extensions['pubsub'] = broker
+    return broker
+
+
+def get_broker():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('pubsub')
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def queue_user_event(session, user_id, kind, notification=None):
+    """
+    Record a change to publish once the session commits.
+
+    kind is 'balance' or 'notifications'. Nothing is published if the
+    transaction rolls back.
+    """
+    pending = session.info.setdefault('pubsub_pending', {})
+    entry = pending.setdefault(user_id, {'kinds': set(), 'notifications': []})
+    entry['kinds'].add(kind)
+    if notification is not None:
+        entry['notifications'].append(notification)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_events(session, flush_context):
+    from backend.models.user import User
+    from backend.models.transaction import Transaction
+    from backend.models.notification import Notification
+
+    for obj in session.new:
+        if isinstance(obj, Notification) and obj.user_id:
+            queue_user_event(session, obj.user_id, 'notifications', obj.to_dict())
+        elif isinstance(obj, Transaction) and obj.user_id:
+            queue_user_event(session, obj.user_id, 'balance')
+
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Notification) and obj.user_id:
+            queue_user_event(session, obj.user_id, 'notifications')
+        elif isinstance(obj, Transaction) and obj.user_id:
+            queue_user_event(session, obj.user_id, 'balance')
+        elif isinstance(obj, User) and session.is_modified(obj, include_collections=False):
+            queue_user_event(session, obj.id, 'balance')
+
+
+@event.listens_for(Session, 'after_commit')
+def _publish_events(session):
+    pending = session.info.pop('pubsub_pending', None)
+    if not pending:
+        return
+
+    broker = get_broker()
+    if broker is None:
+        return
+
+    for user_id, entry in pending.items():
+        try:
+            broker.publish(user_channel(user_id), {
+                'kinds': sorted(entry['kinds']),
+                'notifications': entry['notifications']
+            })
+        except Exception:
+            # Streams resync on the next event; never fail the request over it
+            logger.exception("Failed to publish event for user %s", user_id)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_events(session):
+    session.info.pop('pubsub_pending', None)
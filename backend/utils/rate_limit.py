@@ -0,0 +1,190 @@
+import logging
+import math
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, request, jsonify
+from flask_jwt_extended import get_jwt_identity
+from backend.utils.idempotency import IDEMPOTENCY_HEADER, is_completed_replay
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+def parse_limit(limit):
+    """'10/minute' -> (10, 60)"""
+    count, _, period = limit.partition('/')
+    if period not in PERIODS:
+        raise ValueError(f'Invalid rate limit: {limit}')
+    return int(count), PERIODS[period]
+
+
+def _refill(tokens, updated_at, capacity, period, now):
+    return min(capacity, tokens + (now - updated_at) * capacity / period)
+
+
+def _take(tokens, capacity, period):
+    """Returns (allowed, tokens left, seconds until the next token)"""
+    if tokens >= 1:
+        return True, tokens - 1, 0
+    return False, tokens, math.ceil((1 - tokens) * period / capacity)
+
+
+class MemoryRateLimitStore:
+    """
+    Token buckets in a dict, for a single process.
+
+    With several workers each keeps its own buckets, so the effective
+    limit is multiplied by the worker count; use SQLiteRateLimitStore to
+    share them. Past max_keys the least recently used bucket is dropped;
+    it is the one closest to full, so forgetting it costs its owner little.
+    """
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> (tokens, updated_at), least recently used first
+        self._lock = threading.Lock()
+
+    def consume(self, key, capacity, period):
+        now = time.time()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            allowed, tokens, retry_after = _take(_refill(tokens, updated_at, capacity, period, now), capacity, period)
+            if key in self._buckets:
+                self._buckets.move_to_end(key)
+            elif len(self._buckets) >= self.max_keys:
+                self._buckets.popitem(last=False)
+            self._buckets[key] = (tokens, now)
+        return allowed, tokens, retry_after
+
+
+class SQLiteRateLimitStore:
+    """
+    Token buckets shared by every worker process on one host.
+
+    Kept in a small SQLite file apart from the main database; each check
+    is one short write transaction on a single row.
+    """
+
+    def __init__(self, path, retention_seconds=86400):
+        self.path = path
+        self.retention_seconds = retention_seconds
+        self._local = threading.local()
+        self._last_prune = time.time()
+
+        conn = self._connect()
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS rate_limit_buckets ('
+            'key TEXT PRIMARY KEY, '
+            'tokens REAL NOT NULL, '
+            'updated_at REAL NOT NULL)'
+        )
+
+    def _connect(self):
+        # Connections are per thread and never reused across a fork
+        conn = getattr(self._local, 'conn', None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def consume(self, key, capacity, period):
+        conn = self._connect()
+        now = time.time()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            row = conn.execute('SELECT tokens, updated_at FROM rate_limit_buckets WHERE key = ?', (key,)).fetchone()
+            tokens, updated_at = row if row else (capacity, now)
+            allowed, tokens, retry_after = _take(_refill(tokens, updated_at, capacity, period, now), capacity, period)
+            conn.execute(
+                'INSERT INTO rate_limit_buckets (key, tokens, updated_at) VALUES (?, ?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated_at = excluded.updated_at',
+                (key, tokens, now)
+            )
+            # Buckets idle this long are full again and can go
+            if now - self._last_prune > 600:
+                self._last_prune = now
+                conn.execute('DELETE FROM rate_limit_buckets WHERE updated_at < ?', (now - self.retention_seconds,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return allowed, tokens, retry_after
+
+
+def init_rate_limiter(app, instance_path):
+    """Create the bucket store selected by RATE_LIMIT_BACKEND ('memory' or 'sqlite')"""
+    backend = app.config.get('RATE_LIMIT_BACKEND', 'memory')
+    if backend == 'sqlite':
+        path = app.config.get('RATE_LIMIT_SQLITE_PATH') or os.path.join(instance_path, 'ratelimit.db')
+        store = SQLiteRateLimitStore(path)
+    elif backend == 'memory':
+        store = MemoryRateLimitStore()
+    else:
+        raise ValueError(f'Unknown RATE_LIMIT_BACKEND: {backend}')
+
+    app.extensions['rate_limit'] = store
+    return store
+
+
+def client_ip():
+    # Behind a trusted proxy the address it appended last is the client's
+    if current_app.config.get('RATE_LIMIT_TRUST_PROXY') and request.access_route:
+        return request.access_route[-1]
+    return request.remote_addr or 'unknown'
+
+
+def rate_limit(limit, per='user', scope=None):
+    """
+    Decorator applying a token-bucket limit to a route.
+
+    limit is 'count/period' (second, minute, hour or day): bursts of up to
+    count requests, refilled evenly over the period. per is 'user' (the JWT
+    identity, so place it under @jwt_required()) or 'ip'. Decorators can be
+    stacked for several limits, above @idempotent. The check runs before
+    the view, so a rejected request costs no database writes and, without
+    an Idempotency-Key, no queries at all. With a key, one read recognises
+    the replay of a stored response, which is let through without a token.
+    """
+    capacity, period = parse_limit(limit)
+    if per not in ('user', 'ip'):
+        raise ValueError(f'Invalid rate limit key: {per}')
+
+    def decorator(f):
+        name = scope or f.__name__
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            if not current_app.config.get('RATE_LIMIT_ENABLED', True):
+                return f(*args, **kwargs)
+            if request.headers.get(IDEMPOTENCY_HEADER) and is_completed_replay():
+                return f(*args, **kwargs)
+
+            identity = get_jwt_identity() if per == 'user' else client_ip()
+            key = f'{name}:{per}:{identity}:{limit}'
+            try:
+                allowed, remaining, retry_after = current_app.extensions['rate_limit'].consume(key, capacity, period)
+            except Exception:
+                # Fail open: a broken limiter store must not take the endpoint down
+                logger.exception("Rate limit check failed")
+                return f(*args, **kwargs)
+
+            if not allowed:
+                response = jsonify({
+                    'message': 'Too many requests. Please try again later.',
+                    'error': 'rate_limited',
+                    'retry_after': retry_after
+                })
+                response.status_code = 429
+                response.headers['Retry-After'] = str(retry_after)
+                return response
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
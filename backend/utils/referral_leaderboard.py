@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+from backend.extensions import db
+from backend.models.user import User
+from backend.utils.ttl_cache import cache
+
+# Window name -> days (None for all time)
+WINDOWS = {'all': None, '30d': 30, '7d': 7}
+LEADERBOARD_SIZE = 100  # Entries kept per window; requests can ask for up to this many
+LEADERBOARD_TTL = 60  # Seconds
+
+users_table = User.__table__
+
+
+def _cache_key(window):
+    return f'referrals:leaderboard:{window}'
+
+
+def record_referral(referrer_id):
+    """Count a new referral for referrer_id with one atomic UPDATE (callers commit)"""
+    db.session.execute(users_table.update().where(users_table.c.id == referrer_id).values(
+        referral_count=users_table.c.referral_count + 1
+    ))
+
+
+def invalidate_leaderboard():
+    cache.invalidate(*[_cache_key(window) for window in WINDOWS])
+
+
+def _compute(window):
+    days = WINDOWS[window]
+    if days is None:
+        # Served by the index on referral_count
+        rows = db.session.query(
+            User.id, User.full_name, User.email, User.referral_code, User.role,
+            User.total_earnings, User.referral_count
+        ).filter(User.referral_count > 0).order_by(
+            User.referral_count.desc(), User.id
+        ).limit(LEADERBOARD_SIZE).all()
+        ranked = [(row, row.referral_count) for row in rows]
+    else:
+        # Only users created inside the window are scanned (index on created_at)
+        referral_count = db.func.count(User.id).label('referral_count')
+        counts = db.session.query(User.referred_by, referral_count).filter(
+            User.referred_by.isnot(None),
+            User.created_at >= datetime.utcnow() - timedelta(days=days)
+        ).group_by(User.referred_by).order_by(
+            referral_count.desc(), User.referred_by
+        ).limit(LEADERBOARD_SIZE).all()
+        referrers = {
+            row.id: row for row in db.session.query(
+                User.id, User.full_name, User.email, User.referral_code, User.role, User.total_earnings
+            ).filter(User.id.in_([referrer_id for referrer_id, _ in counts])).all()
+        } if counts else {}
+        ranked = [(referrers[referrer_id], count) for referrer_id, count in counts if referrer_id in referrers]
+
+    return tuple({
+        'rank': position,
+        'id': row.id,
+        'full_name': row.full_name,
+        'email': row.email,
+        'referral_code': row.referral_code,
+        'role': row.role.value if hasattr(row.role, 'value') else row.role,
+        'referral_count': count,
+        'total_earnings': row.total_earnings
+    } for position, (row, count) in enumerate(ranked, start=1))
+
+
+def get_leaderboard(window='all', limit=10):
+    """
+    Top referrers for a window ('all', '30d' or '7d').
+
+    The top LEADERBOARD_SIZE are computed at most once per LEADERBOARD_TTL
+    per process (sooner after a referral here); a request only slices
+    the cached, already sorted entries.
+    """
+    if window not in WINDOWS:
+        raise ValueError(f'Unknown leaderboard window: {window}')
+    entries = cache.get_or_set(_cache_key(window), LEADERBOARD_TTL, lambda: _compute(window))
+    return list(entries[:max(0, min(limit, LEADERBOARD_SIZE))])
+
+
+def find_rank(user_id, window='all'):
+    """The user's leaderboard entry, or None outside the top LEADERBOARD_SIZE"""
+    for entry in get_leaderboard(window, LEADERBOARD_SIZE):
+        if entry['id'] == user_id:
+            return entry
+    return None
@@ -0,0 +1,72 @@
+from sqlalchemy import insert, literal, select
+from backend.extensions import db
+from backend.models.user import User
+from backend.models.referral_closure import ReferralClosure
+
+closure_table = ReferralClosure.__table__
+DEFAULT_MAX_DEPTH = 10
+
+
+def record_referral_path(user_id, referrer_id=None):
+    """
+    Add a new user's closure rows (callers flush the user first and commit).
+
+    The user's row to itself, the referrer's row at depth 1, plus one row
+    per ancestor of the referrer, copied with INSERT ... SELECT one level
+    deeper. The referrer row is written explicitly so it doesn't depend on
+    the referrer having a row to itself.
+    """
+    db.session.execute(insert(closure_table).values(ancestor_id=user_id, descendant_id=user_id, depth=0))
+    if referrer_id is not None:
+        db.session.execute(insert(closure_table).values(ancestor_id=referrer_id, descendant_id=user_id, depth=1))
+        db.session.execute(insert(closure_table).from_select(
+            ['ancestor_id', 'descendant_id', 'depth'],
+            select(closure_table.c.ancestor_id, literal(user_id), closure_table.c.depth + 1).where(
+                closure_table.c.descendant_id == referrer_id,
+                closure_table.c.depth > 0
+            )
+        ))
+
+
+def ancestor_ids(user_id):
+    """Everyone above user_id in the referral tree, nearest first"""
+    return [row[0] for row in db.session.query(ReferralClosure.ancestor_id).filter(
+        ReferralClosure.descendant_id == user_id,
+        ReferralClosure.depth > 0
+    ).order_by(ReferralClosure.depth).all()]
+
+
+def downline_by_depth(user_id, max_depth=DEFAULT_MAX_DEPTH):
+    """
+    Size and earnings of a user's referral network, per level.
+
+    Returns [{'depth', 'users', 'total_earnings', 'total_points_earned'}]
+    for depths 1..max_depth that have anyone in them.
+    """
+    rows = db.session.query(
+        ReferralClosure.depth,
+        db.func.count(User.id),
+        db.func.coalesce(db.func.sum(User.total_earnings), 0.0),
+        db.func.coalesce(db.func.sum(User.total_points_earned), 0.0)
+    ).join(User, User.id == ReferralClosure.descendant_id).filter(
+        ReferralClosure.ancestor_id == user_id,
+        ReferralClosure.depth.between(1, max_depth)
+    ).group_by(ReferralClosure.depth).order_by(ReferralClosure.depth).all()
+
+    return [{
+        'depth': depth,
+        'users': users,
+        'total_earnings': round(earnings, 2),
+        'total_points_earned': round(points, 2)
+    } for depth, users, earnings, points in rows]
+
+
+def downline_summary(user_id, max_depth=DEFAULT_MAX_DEPTH):
+    levels = downline_by_depth(user_id, max_depth)
+    return {
+        'network_size': sum(level['users'] for level in levels),
+        'network_earnings': round(sum(level['total_earnings'] for level in levels), 2),
+        'network_points_earned': round(sum(level['total_points_earned'] for level in levels), 2),
+        'max_depth': max_depth,
+        'levels': levels
+    }
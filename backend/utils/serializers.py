@@ -0,0 +1,56 @@
+from sqlalchemy import DateTime, Enum
+
+# How a column's value is written into the generated function
+_ISOFORMAT = '{value}.isoformat() if {value} is not None else None'
+_ENUM_VALUE = 'getattr({value}, "value", {value})'  # Tolerates plain strings
+
+
+class RowSerializer:
+    """
+    A to_dict() for one model, compiled once into a single dict literal.
+
+    Works on model instances and on rows from column queries alike (both
+    expose the fields as attributes), so list endpoints can select just
+    .columns instead of loading ORM objects. DateTime columns become
+    isoformat() strings and Enum columns their .value; everything else is
+    copied as is.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.columns = tuple(getattr(model, name) for name in self.fields)
+        self._serialize = self._compile()
+
+    def _compile(self):
+        table = self.model.__table__
+        lines, entries = [], []
+        for position, name in enumerate(self.fields):
+            if not name.isidentifier():
+                raise ValueError(f'{self.model.__name__}.{name} is not a plain attribute name')
+            column_type = table.c[name].type
+            if isinstance(column_type, (DateTime, Enum)):
+                value = f'v{position}'
+                lines.append(f'    {value} = row.{name}')
+                template = _ISOFORMAT if isinstance(column_type, DateTime) else _ENUM_VALUE
+                entries.append(f'        {name!r}: {template.format(value=value)},')
+            else:
+                entries.append(f'        {name!r}: row.{name},')
+        source = '\n'.join(['def serialize(row):', *lines, '    return {', *entries, '    }'])
+
+        namespace = {}
+        exec(compile(source, f'<serializer {self.model.__name__}>', 'exec'), namespace)
+        return namespace['serialize']
+
+    def __call__(self, row):
+        return self._serialize(row)
+
+    def many(self, rows):
+        serialize = self._serialize
+        return [serialize(row) for row in rows]
+
+
+def row_serializer(model, fields=None):
+    """RowSerializer for the given fields (default: every column, in table order)"""
+    return RowSerializer(model, fields or [column.key for column in model.__table__.columns])
+
@@ -0,0 +1,147 @@
+import logging
+import gzip
+import hashlib
+import os
+import threading
+import time
+from email.utils import formatdate
+from flask import Response, request
+
+logger = logging.getLogger(__name__)
+
+
+class CachedPage:
+    """A single HTML document held in memory with its precomputed validators"""
+
+    __slots__ = ('relpath', 'body', 'gzip_body', 'etag', 'gzip_etag', 'mtime', 'last_modified')
+
+    def __init__(self, relpath, body, mtime):
+        self.relpath = relpath
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=9)
+        digest = hashlib.sha1(body).hexdigest()[:20]
+        self.etag = digest
+        self.gzip_etag = f'{digest}-gz'
+        self.mtime = mtime
+        self.last_modified = formatdate(mtime, usegmt=True)
+
+
+class StaticPageCache:
+    """
+    In-memory cache of the frontend/*.html and admin/*.html documents.
+
+    Pages are read once at startup, so serving them (and answering conditional
+    GETs with 304) never touches the disk. In watch mode a background thread
+    polls the file mtimes and reloads pages that changed.
+    """
+
+    def __init__(self, root, directories=('frontend', 'admin'), watch=False, watch_interval=1.0):
+        self.root = root
+        self.directories = directories
+        self.watch_interval = watch_interval
+        self._pages = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+        self.load()
+        if watch:
+            self.start_watcher()
+
+    def _scan(self):
+        """Return {relpath: mtime} for every cacheable document on disk"""
+        found = {}
+        for directory in self.directories:
+            folder = os.path.join(self.root, directory)
+            if not os.path.isdir(folder):
+                continue
+            for name in os.listdir(folder):
+                if not name.endswith('.html'):
+                    continue
+                path = os.path.join(folder, name)
+                if os.path.isfile(path):
+                    found[f'{directory}/{name}'] = os.path.getmtime(path)
+        return found
+
+    def _read(self, relpath, mtime):
+        with open(os.path.join(self.root, relpath), 'rb') as f:
+            return CachedPage(relpath, f.read(), mtime)
+
+    def load(self):
+        """(Re)load every document from disk"""
+        pages = {}
+        for relpath, mtime in self._scan().items():
+            pages[relpath] = self._read(relpath, mtime)
+        with self._lock:
+            self._pages = pages
+
+    def refresh(self):
+        """Reload documents whose mtime changed, pick up new ones and drop deleted ones"""
+        on_disk = self._scan()
+        pages = dict(self._pages)
+        changed = False
+
+        for relpath, mtime in on_disk.items():
+            page = pages.get(relpath)
+            if page is None or page.mtime != mtime:
+                try:
+                    pages[relpath] = self._read(relpath, mtime)
+                    changed = True
+                except OSError:
+                    continue
+
+        for relpath in set(pages) - set(on_disk):
+            del pages[relpath]
+            changed = True
+
+        if changed:
+            with self._lock:
+                self._pages = pages
+        return changed
+
+    def start_watcher(self):
+        """Poll the document mtimes in a daemon thread (development mode)"""
+        if self._watcher is not None:
+            return
+
+        def watch():
+            while True:
+                time.sleep(self.watch_interval)
+                try:
+                    self.refresh()
+                except Exception:
+                    logger.exception("Static page cache refresh failed")
+
+        self._watcher = threading.Thread(target=watch, name='static-page-cache-watcher', daemon=True)
+        self._watcher.start()
+
+    def get(self, relpath):
+        return self._pages.get(relpath)
+
+    def serve(self, relpath):
+        """
+        Build the response for a cached document.
+
+        Returns None when the document is not cached so callers can fall back
+        to serving it from disk.
+        """
+        page = self._pages.get(relpath)
+        if page is None:
+            return None
+
+        use_gzip = 'gzip' in request.accept_encodings
+        etag = page.gzip_etag if use_gzip else page.etag
+
+        if request.if_none_match.contains(page.etag) or request.if_none_match.contains(page.gzip_etag):
+            response = Response(status=304)
+        elif not request.if_none_match and request.if_modified_since \
+                and request.if_modified_since.timestamp() >= int(page.mtime):
+            response = Response(status=304)
+        else:
+            response = Response(page.gzip_body if use_gzip else page.body, mimetype='text/html')
+            if use_gzip:
+                response.headers['Content-Encoding'] = 'gzip'
+
+        response.set_etag(etag)
+        response.headers['Last-Modified'] = page.last_modified
+        response.headers['Cache-Control'] = 'no-cache'
+        response.vary.add('Accept-Encoding')
+        return response
@@ -0,0 +1,37 @@
+from datetime import datetime, timedelta
+from backend.extensions import db
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+from backend.utils.ttl_cache import cache
+
+WITHDRAWAL_STATS_CACHE_KEY = 'admin:withdrawal_stats'
+WITHDRAWAL_STATS_TTL = 30  # Seconds
+
+
+def get_withdrawal_stats():
+    """Withdrawal overview counters from a single aggregate query, cached briefly"""
+    return cache.get_or_set(WITHDRAWAL_STATS_CACHE_KEY, WITHDRAWAL_STATS_TTL, compute_withdrawal_stats)
+
+
+def invalidate_withdrawal_stats():
+    """Call after creating, approving or rejecting a withdrawal"""
+    cache.invalidate(WITHDRAWAL_STATS_CACHE_KEY)
+
+
+def compute_withdrawal_stats():
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    week_ago = today - timedelta(days=7)
+
+    is_completed = Transaction.status == TransactionStatus.COMPLETED
+    pending, today_approved, week_approved_sum, rejected = db.session.query(
+        db.func.sum(db.case((Transaction.status == TransactionStatus.PENDING, 1), else_=0)),
+        db.func.sum(db.case((db.and_(is_completed, Transaction.updated_at >= today), 1), else_=0)),
+        db.func.sum(db.case((db.and_(is_completed, Transaction.updated_at >= week_ago), Transaction.amount), else_=0.0)),
+        db.func.sum(db.case((Transaction.status == TransactionStatus.FAILED, 1), else_=0))
+    ).filter(Transaction.type == TransactionType.POINT_WITHDRAWAL).one()
+
+    return {
+        'pending': pending or 0,
+        'today_approved': today_approved or 0,
+        'week_total_amount': abs(week_approved_sum or 0.0),
+        'rejected': rejected or 0
+    }
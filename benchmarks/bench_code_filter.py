@@ -0,0 +1,110 @@
+"""
+Memory and lookup cost of the reward code existence filter.
+
+Compares the Bloom filter used by backend.utils.code_filter with a Python
+set and a sorted array of packed 8-byte codes, and optionally with an
+indexed SQLite lookup (the query it saves).
+
+    python -m benchmarks.bench_code_filter --codes 10000000 --sqlite
+"""
+import argparse
+import bisect
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+from array import array
+
+from backend.utils.code_filter import BloomFilter
+
+LETTERS = string.ascii_uppercase
+DIGITS = string.digits
+
+
+def random_codes(count, seed):
+    rng = random.Random(seed)
+    codes = set()
+    while len(codes) < count:
+        codes.add(''.join(rng.choices(LETTERS, k=5)) + ''.join(rng.choices(DIGITS, k=3)))
+    return list(codes)
+
+
+def pack(code):
+    return int.from_bytes(code.encode(), 'big')
+
+
+def timed(label, fn, probes):
+    started = time.perf_counter()
+    hits = sum(1 for code in probes if fn(code))
+    elapsed = time.perf_counter() - started
+    print(f'  {label:<28} {elapsed / len(probes) * 1e6:8.2f} us/lookup   {hits} hits')
+    return hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--codes', type=int, default=1000000, help='number of existing codes')
+    parser.add_argument('--probes', type=int, default=200000, help='lookups per measurement')
+    parser.add_argument('--error-rate', type=float, default=0.01)
+    parser.add_argument('--sqlite', action='store_true', help='also time indexed lookups in a temporary SQLite table')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    print(f'Generating {args.codes:,} codes...', file=sys.stderr)
+    codes = random_codes(args.codes, args.seed)
+    existing = set(codes)
+    misses = [code for code in random_codes(args.probes * 2, args.seed + 1) if code not in existing][:args.probes]
+    hits = random.Random(args.seed).sample(codes, min(args.probes, len(codes)))
+
+    started = time.perf_counter()
+    bloom = BloomFilter(args.codes, args.error_rate)
+    for code in codes:
+        bloom.add(code)
+    bloom_build = time.perf_counter() - started
+
+    started = time.perf_counter()
+    packed = array('q', sorted(pack(code) for code in codes))
+    array_build = time.perf_counter() - started
+
+    print(f'\n{args.codes:,} codes')
+    print('Memory')
+    print(f'  bloom filter ({bloom.num_hashes} hashes)     {bloom.nbytes / 2**20:8.1f} MiB   built in {bloom_build:.1f}s')
+    print(f'  sorted int64 array           {packed.itemsize * len(packed) / 2**20:8.1f} MiB   built in {array_build:.1f}s')
+    # set table + one str object per code
+    set_bytes = sys.getsizeof(existing) + sum(sys.getsizeof(code) for code in hits) / len(hits) * len(existing)
+    print(f'  python set of str            {set_bytes / 2**20:8.1f} MiB')
+
+    def in_array(code):
+        value = pack(code)
+        i = bisect.bisect_left(packed, value)
+        return i < len(packed) and packed[i] == value
+
+    print('Lookups of existing codes')
+    timed('bloom filter', bloom.__contains__, hits)
+    timed('sorted int64 array', in_array, hits)
+    timed('python set', existing.__contains__, hits)
+    print('Lookups of unknown codes')
+    false_positives = timed('bloom filter', bloom.__contains__, misses)
+    timed('sorted int64 array', in_array, misses)
+    timed('python set', existing.__contains__, misses)
+    print(f'  measured false-positive rate {false_positives / len(misses):.4f} (target {args.error_rate})')
+
+    if args.sqlite:
+        path = os.path.join(tempfile.mkdtemp(), 'codes.db')
+        conn = sqlite3.connect(path)
+        conn.execute('CREATE TABLE reward_codes (id INTEGER PRIMARY KEY, code VARCHAR(8) UNIQUE NOT NULL)')
+        conn.executemany('INSERT INTO reward_codes (code) VALUES (?)', ((code,) for code in codes))
+        conn.commit()
+        query = 'SELECT id FROM reward_codes WHERE code = ?'
+        print('SQLite unique-index lookup (in-process, warm cache)')
+        timed('existing codes', lambda code: conn.execute(query, (code,)).fetchone(), hits)
+        timed('unknown codes', lambda code: conn.execute(query, (code,)).fetchone(), misses)
+        conn.close()
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
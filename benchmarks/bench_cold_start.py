@@ -0,0 +1,179 @@
+"""
+Cold start: how long a fresh process takes to serve its first request.
+
+Each run is a new interpreter that imports backend.app, calls create_app()
+and answers one request through the test client, timing each step. The
+scenarios compare the default startup (no schema work), INIT_DB_ON_STARTUP=1
+(create_all and the admin seed on every boot, what app.py used to do on
+import) and a worker forked from a preloaded parent the way gunicorn's
+preload_app starts one. Runs against a throwaway SQLite file that
+'init-db --seed' prepares once.
+
+    python -m benchmarks.bench_cold_start --runs 10 --json cold_start.json
+    python -m benchmarks.bench_cold_start --compare cold_start.json
+    python -m benchmarks.bench_cold_start --runs 0 --importtime 25
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the child; prints one JSON object of step timings in seconds
+CHILD = r'''
+import json, os, time
+started = time.perf_counter()
+import backend.app
+imported = time.perf_counter()
+app = backend.app.create_app()
+created = time.perf_counter()
+
+def first_request():
+    began = time.perf_counter()
+    response = app.test_client().get(os.environ['BENCH_PATH'])
+    assert response.status_code < 500, response.status_code
+    return time.perf_counter() - began
+
+timings = {'import': imported - started, 'create_app': created - imported}
+if os.environ.get('BENCH_FORK') == '1':
+    # What a preloaded worker pays: only the fork and its first request
+    read_end, write_end = os.pipe()
+    forked = time.perf_counter()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        os.write(write_end, json.dumps({'fork': time.perf_counter() - forked, 'first_request': first_request()}).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as pipe:
+        timings = json.loads(pipe.read())
+    os.waitpid(pid, 0)
+else:
+    timings['first_request'] = first_request()
+print(json.dumps(timings))
+'''
+
+SCENARIOS = (
+    ('default startup', {'INIT_DB_ON_STARTUP': '0'}),
+    ('schema + seed on startup', {'INIT_DB_ON_STARTUP': '1'}),
+    ('forked from preloaded parent', {'INIT_DB_ON_STARTUP': '0', 'BENCH_FORK': '1'}),
+)
+
+
+def child_env(database_url, path, extra):
+    env = dict(os.environ)
+    env.update({'DATABASE_URL': database_url, 'LOG_LEVEL': 'WARNING', 'BENCH_PATH': path})
+    env.update(extra)
+    return env
+
+
+def run_once(env):
+    started = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', CHILD], cwd=PROJECT_ROOT, env=env,
+                               capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if completed.returncode != 0:
+        raise SystemExit(f'child failed:\n{completed.stderr}')
+    timings = json.loads(completed.stdout.strip().splitlines()[-1])
+    if 'fork' not in timings:
+        timings['process'] = wall  # Interpreter start included
+    return timings
+
+
+def summarize(samples):
+    steps = {}
+    for sample in samples:
+        for step, seconds in sample.items():
+            steps.setdefault(step, []).append(seconds * 1000)
+    return {step: {'min_ms': min(values), 'median_ms': statistics.median(values), 'mean_ms': statistics.fmean(values)}
+            for step, values in steps.items()}
+
+
+def report(results):
+    for scenario, steps in results.items():
+        print(f'\n{scenario}')
+        for step, entry in steps.items():
+            print(f'  {step:<14} min {entry["min_ms"]:8.1f} ms   median {entry["median_ms"]:8.1f} ms   '
+                  f'mean {entry["mean_ms"]:8.1f} ms')
+
+
+def compare(results, previous, tolerance):
+    """Steps whose median got slower than the saved run by more than tolerance"""
+    slower = []
+    for scenario, steps in results.items():
+        saved = previous.get(scenario, {})
+        for step, entry in steps.items():
+            before = saved.get(step)
+            if before and entry['median_ms'] > before['median_ms'] * (1 + tolerance):
+                slower.append(f'{scenario} / {step}: {before["median_ms"]:.1f} -> {entry["median_ms"]:.1f} ms')
+    return slower
+
+
+def import_profile(env, top):
+    """The modules with the largest cumulative import time when loading app.py"""
+    completed = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import app'], cwd=PROJECT_ROOT,
+                               env=env, capture_output=True, text=True)
+    rows = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, own, cumulative, name = [part.strip() for part in line.replace('import time:', '|', 1).split('|')]
+        rows.append((int(cumulative), int(own), name))
+    rows.sort(reverse=True)
+    print(f'\nimport time of app.py (top {top} by cumulative)')
+    for cumulative, own, name in rows[:top]:
+        print(f'  {cumulative / 1000:8.1f} ms  (self {own / 1000:6.1f} ms)  {name}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='fresh processes per scenario')
+    parser.add_argument('--path', default='/healthz', help='first request to send')
+    parser.add_argument('--only', help='run scenarios whose name contains this')
+    parser.add_argument('--importtime', type=int, metavar='N', help='also list the N slowest imports')
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--compare', help='results JSON of an earlier run; exit 1 if anything got slower')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='allowed relative slowdown for --compare')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_url = f'sqlite:///{os.path.join(directory, "cold_start.db")}'
+        prepare = child_env(database_url, args.path, {})
+        subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'init-db', '--seed'], cwd=PROJECT_ROOT,
+                       env=prepare, check=True, capture_output=True)
+
+        results = {}
+        if args.runs > 0:
+            run_once(prepare)  # Warm the bytecode and OS file caches
+        for scenario, extra in SCENARIOS:
+            if args.runs <= 0 or (args.only and args.only not in scenario):
+                continue
+            env = child_env(database_url, args.path, extra)
+            results[scenario] = summarize([run_once(env) for _ in range(args.runs)])
+            print(f'{scenario}: done', file=sys.stderr)
+
+        report(results)
+        if args.importtime:
+            import_profile(prepare, args.importtime)
+
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as saved:
+            slower = compare(results, json.load(saved), args.tolerance)
+        if slower:
+            print('\nSlower than the saved run:')
+            for line in slower:
+                print(f'  {line}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
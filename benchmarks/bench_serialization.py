@@ -0,0 +1,233 @@
+"""
+Cost of turning rows into JSON responses.
+
+For each model with a row serializer, times loading a page as ORM objects
+and calling to_dict() against selecting the serializer's columns and
+serializing the rows, then times encoding typical pages with Flask's
+default JSON provider against the orjson provider. Runs against a
+throwaway in-memory SQLite database. Results are grouped like
+pytest-benchmark's, with each group's first entry as the baseline.
+
+    python -m benchmarks.bench_serialization --page 100 --rounds 200 --json serialization.json
+    python -m benchmarks.bench_serialization --compare serialization.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Before the app is imported: an empty in-memory database and no request metrics
+os.environ['DATABASE_URL'] = 'sqlite://'
+os.environ['METRICS_ENABLED'] = '0'
+os.environ['LOG_LEVEL'] = 'WARNING'
+
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import insert
+
+from backend.app import create_app
+from backend.extensions import db
+from backend.models.ledger_posting import LedgerPosting, serialize_ledger_posting
+from backend.models.notification import Notification, NotificationType, serialize_notification
+from backend.models.reward_code import RewardCode, serialize_reward_code
+from backend.models.support_message import SupportMessage, MessageType, MessageStatus, serialize_support_message
+from backend.models.task import Task, UserTask, serialize_user_task
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus, serialize_transaction
+from backend.models.user import User, UserRole, serialize_user
+from backend.utils.json_provider import OrjsonProvider, orjson
+
+SERIALIZERS = (
+    (Transaction, serialize_transaction),
+    (User, serialize_user),
+    (Notification, serialize_notification),
+    (RewardCode, serialize_reward_code),
+    (UserTask, serialize_user_task),
+    (LedgerPosting, serialize_ledger_posting),
+    (SupportMessage, serialize_support_message),
+)
+
+
+def populate(rows):
+    now = datetime.utcnow()
+    stamps = [now - timedelta(minutes=index) for index in range(rows)]
+    db.session.execute(insert(User), [{
+        'id': index + 1, 'full_name': f'User {index}', 'email': f'user{index}@example.com',
+        'password_hash': 'x' * 60, 'role': UserRole.USER, 'referral_code': f'REF{index:06d}',
+        'referral_count': index % 7, 'referral_earnings': 0.0, 'referral_points_earned': 0.0,
+        'points_balance': index * 1.5, 'total_points_earned': index * 2.0, 'total_points_withdrawn': 0.0,
+        'total_earnings': index * 0.6, 'total_withdrawn': 0.0, 'country': 'Nigeria',
+        'ledger_version': 0, 'created_at': stamp, 'updated_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.execute(insert(Transaction), [{
+        'id': index + 1, 'user_id': 1, 'type': TransactionType.CODE_REDEMPTION,
+        'status': TransactionStatus.COMPLETED, 'description': f'Redeemed code ABCDE{index % 1000:03d}',
+        'amount': 0.3, 'points_amount': 1.0, 'currency': 'USD', 'reference_id': str(index),
+        'created_at': stamp, 'updated_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.execute(insert(LedgerPosting), [{
+        'transaction_id': index + 1, 'user_id': 1, 'account': 'user:points', 'commodity': 'PTS',
+        'amount_minor': 100, 'is_reversal': False, 'created_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.execute(insert(Notification), [{
+        'user_id': 1, 'title': 'Code Redeemed', 'message': 'You earned 1 point.',
+        'type': NotificationType.SUCCESS, 'is_read': index % 2 == 0, 'created_at': stamp, 'updated_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.execute(insert(RewardCode), [{
+        'code': f'ABC{chr(65 + index // 1000 % 26)}{chr(65 + index // 26000 % 26)}{index % 1000:03d}',
+        'point_value': 1.0, 'is_used': index % 3 == 0, 'used_by': 1 if index % 3 == 0 else None,
+        'used_at': stamp if index % 3 == 0 else None, 'batch_id': 1, 'created_at': stamp, 'updated_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.add(Task(id=1, title='Watch Video', points_reward=10.0))
+    db.session.execute(insert(UserTask), [{
+        'user_id': index + 1, 'task_id': 1, 'status': 'pending_review', 'proof_text': 'Done',
+        'created_at': stamp, 'updated_at': stamp
+    } for index, stamp in enumerate(stamps)])
+    db.session.execute(insert(SupportMessage), [{
+        'user_id': 1, 'subject': 'Withdrawal', 'message': 'When will my withdrawal arrive?',
+        'message_type': MessageType.USER_TO_SUPPORT, 'status': MessageStatus.SENT,
+        'created_at': stamp, 'updated_at': stamp
+    } for stamp in stamps])
+    db.session.commit()
+
+
+def measure(fn, rounds, warmup=5):
+    for _ in range(warmup):
+        fn()
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - started)
+    return {
+        'min_us': min(timings) * 1e6,
+        'median_us': statistics.median(timings) * 1e6,
+        'mean_us': statistics.fmean(timings) * 1e6,
+        'ops': 1 / statistics.fmean(timings),
+    }
+
+
+def model_cases(page):
+    """group -> [(name, fn)], baseline first"""
+    cases = {}
+    for model, serializer in SERIALIZERS:
+        order = model.id.desc()
+
+        def orm_to_dict(model=model, order=order):
+            rows = model.query.order_by(order).limit(page).all()
+            result = [row.to_dict() for row in rows]
+            db.session.remove()  # Next round loads fresh objects, like the next request
+            return result
+
+        def column_rows(serializer=serializer, order=order):
+            return serializer.many(db.session.query(*serializer.columns).order_by(order).limit(page).all())
+
+        cases[f'{model.__name__} page'] = [('orm+to_dict', orm_to_dict), ('columns+serializer', column_rows)]
+
+        instances = model.query.order_by(order).limit(page).all()
+        fields = serializer.fields
+
+        def generic_to_dict(instances=instances, fields=fields):
+            # What a field-by-field getattr() with type checks costs, for reference
+            result = []
+            for instance in instances:
+                data = {}
+                for name in fields:
+                    value = getattr(instance, name)
+                    if isinstance(value, datetime):
+                        value = value.isoformat()
+                    elif hasattr(value, 'value'):
+                        value = value.value
+                    data[name] = value
+                result.append(data)
+            return result
+
+        cases[f'{model.__name__} dicts only'] = [
+            ('generic getattr loop', generic_to_dict),
+            ('to_dict', lambda instances=instances: [instance.to_dict() for instance in instances]),
+        ]
+    return cases
+
+
+def encoding_cases(app, page):
+    default = DefaultJSONProvider(app)
+    fast = OrjsonProvider(app) if orjson is not None else None
+    documents = {
+        'transactions page': {'transactions': serialize_transaction.many(
+            db.session.query(*serialize_transaction.columns).limit(page).all()), 'total': page, 'pages': 1},
+        'users page': {'users': serialize_user.many(
+            db.session.query(*serialize_user.columns).limit(page).all()), 'total': page, 'pages': 1},
+    }
+    cases = {}
+    for name, document in documents.items():
+        group = [('json (default provider)', lambda document=document: default.response(document))]
+        if fast is not None:
+            if json.loads(fast.response(document).get_data()) != json.loads(default.response(document).get_data()):
+                raise SystemExit(f'orjson and default providers disagree on {name}')
+            group.append(('orjson provider', lambda document=document: fast.response(document)))
+        cases[f'encode {name}'] = group
+    return cases
+
+
+def report(results):
+    for group, entries in results.items():
+        print(f'\n{group}')
+        baseline = entries[0]['mean_us']
+        for entry in entries:
+            print(f'  {entry["name"]:<26} min {entry["min_us"]:10.1f} us   median {entry["median_us"]:10.1f} us   '
+                  f'mean {entry["mean_us"]:10.1f} us   {entry["ops"]:10.1f} ops/s   x{baseline / entry["mean_us"]:.2f}')
+
+
+def compare(results, previous, tolerance):
+    """Entries whose mean got slower than the saved run by more than tolerance"""
+    slower = []
+    for group, entries in results.items():
+        saved = {entry['name']: entry for entry in previous.get(group, [])}
+        for entry in entries:
+            before = saved.get(entry['name'])
+            if before and entry['mean_us'] > before['mean_us'] * (1 + tolerance):
+                slower.append(f'{group} / {entry["name"]}: {before["mean_us"]:.1f} -> {entry["mean_us"]:.1f} us')
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page', type=int, default=100, help='rows per page')
+    parser.add_argument('--rows', type=int, default=1000, help='rows per table')
+    parser.add_argument('--rounds', type=int, default=100)
+    parser.add_argument('--only', help='run groups whose name contains this')
+    parser.add_argument('--json', help='write results here')
+    parser.add_argument('--compare', help='results JSON of an earlier run; exit 1 if anything got slower')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed relative slowdown for --compare')
+    args = parser.parse_args()
+
+    app = create_app()
+    results = {}
+    with app.app_context():
+        db.create_all()
+        populate(max(args.rows, args.page))
+        cases = {**model_cases(args.page), **encoding_cases(app, args.page)}
+        for group, entries in cases.items():
+            if args.only and args.only not in group:
+                continue
+            results[group] = [{'name': name, **measure(fn, args.rounds)} for name, fn in entries]
+            print(f'{group}: done', file=sys.stderr)
+
+    report(results)
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(results, output, indent=2)
+    if args.compare:
+        with open(args.compare) as saved:
+            slower = compare(results, json.load(saved), args.tolerance)
+        if slower:
+            print('\nSlower than the saved run:')
+            for line in slower:
+                print(f'  {line}')
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,600 @@
+"""
+Scripted user journeys against the real app, with latency percentiles and queries per request.
+
+Drives create_app() in this process through Flask's test client
+(--target app), or a local gunicorn started with the shipped
+gunicorn.conf.py (--target gunicorn), against the database in DATABASE_URL, normally one filled by
+benchmarks.synth_data. Statements per request come from the
+Server-Timing header, which the app is started with. Runs change the
+data (codes get redeemed, withdrawals approved), so for comparable
+numbers start each run from the same snapshot with --snapshot.
+
+    DATABASE_URL=sqlite:////tmp/load.db python -m benchmarks.load_test \\
+        --snapshot /tmp/load.snapshot.db --journeys 2000 --concurrency 8 --json run.json
+    python -m benchmarks.load_test --target gunicorn --workers 4 --threads 8 --baseline run.json
+    python -m benchmarks.load_test --target gunicorn --hup-every 5   # must finish with no errors
+    python -m benchmarks.load_test --target gunicorn --streams 200   # with 200 dashboards left open
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import re
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from queue import Empty, SimpleQueue
+
+# Read by create_app, so set before the app is imported (and inherited by gunicorn)
+APP_ENVIRONMENT = {
+    'METRICS_ENABLED': '1',
+    'SERVER_TIMING_ENABLED': '1',
+    'LOG_LEVEL': 'WARNING',
+}
+# Unless configured otherwise, notification mail fails fast instead of leaving the machine
+OFFLINE_DEFAULTS = {
+    'SMTP_SERVER': '127.0.0.1',
+    'SMTP_PORT': '9',
+}
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUERIES_PATTERN = re.compile(r'desc="(\d+) queries"')
+PERCENTILES = (50, 95, 99)
+
+# Journey -> relative weight in the default mix
+DEFAULT_MIX = {
+    'dashboard': 6,
+    'redeem': 3,
+    'upload_codes': 1,
+    'withdraw': 1,
+    'admin_review': 1,
+    'login': 1,
+}
+
+
+class AppClient:
+    """The Flask test client, one per thread"""
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, headers, body):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        response = client.open(path, method=method, headers=headers, json=body)
+        return response.status_code, response.headers.get('Server-Timing'), response.get_json(silent=True)
+
+
+class HttpClient:
+    """Keep-alive HTTP/1.1 connections to a server, one per thread"""
+
+    def __init__(self, host, port, timeout=60):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def request(self, method, path, headers, body):
+        headers = dict(headers)
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection = getattr(self._local, 'connection', None)
+        # Like a browser or nginx, retry once on a fresh connection when the server
+        # closed an idle keep-alive one (a worker restarting or being recycled)
+        for reused in ((True, False) if connection is not None else (False,)):
+            if not reused:
+                connection = self._local.connection = http.client.HTTPConnection(
+                    self.host, self.port, timeout=self.timeout)
+            try:
+                connection.request(method, path, body=payload, headers=headers)
+                response = connection.getresponse()
+                data = response.read()
+                break
+            except (OSError, http.client.HTTPException) as error:
+                connection.close()
+                self._local.connection = None
+                stale = isinstance(error, (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError))
+                if not (reused and stale):
+                    return 0, None, None
+        try:
+            parsed = json.loads(data) if data else None
+        except ValueError:
+            parsed = None
+        return response.status, response.getheader('Server-Timing'), parsed
+
+
+class Recorder:
+    """Per-step latencies, statement counts and statuses"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.steps = {}
+        self.enabled = True
+
+    def record(self, step, seconds, status, queries):
+        if not self.enabled:
+            return
+        with self._lock:
+            entry = self.steps.setdefault(step, {'latencies': [], 'queries': [], 'statuses': {}})
+            entry['latencies'].append(seconds)
+            if queries is not None:
+                entry['queries'].append(queries)
+            entry['statuses'][status] = entry['statuses'].get(status, 0) + 1
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-pct * len(sorted_values) // 100))
+    return sorted_values[rank - 1]
+
+
+def summarize(recorder):
+    summary = {}
+    for step, entry in sorted(recorder.steps.items()):
+        latencies = sorted(entry['latencies'])
+        statuses = entry['statuses']
+        summary[step] = {
+            'requests': len(latencies),
+            'errors': sum(count for status, count in statuses.items() if status == 0 or status >= 500),
+            'rejected': sum(count for status, count in statuses.items() if 400 <= status < 500),
+            'mean_ms': round(sum(latencies) / len(latencies) * 1000, 2),
+            **{f'p{pct}_ms': round(percentile(latencies, pct) * 1000, 2) for pct in PERCENTILES},
+            'queries_mean': round(sum(entry['queries']) / len(entry['queries']), 2) if entry['queries'] else None,
+            'queries_max': max(entry['queries']) if entry['queries'] else None,
+            'statuses': {str(status): count for status, count in sorted(statuses.items())},
+        }
+    return summary
+
+
+class Fixtures:
+    """Users, tokens, unused codes and admin work items, handed out without repeats where it matters"""
+
+    def __init__(self, users, withdrawers, codes, withdrawals, reviews, admin):
+        self.users = users  # [(user id, email, token)]
+        self.withdrawers = withdrawers
+        self.codes = codes
+        self.withdrawals = withdrawals
+        self.reviews = reviews
+        self.admin = admin  # (user id, email, token)
+
+    @staticmethod
+    def _queue(items):
+        queue = SimpleQueue()
+        for item in items:
+            queue.put(item)
+        return queue
+
+    @classmethod
+    def load(cls, app, args):
+        from flask_jwt_extended import create_access_token
+        from sqlalchemy import func
+        from backend.extensions import db
+        from backend.models.reward_code import RewardCode
+        from backend.models.task import UserTask
+        from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+        from backend.models.user import User, UserRole
+
+        with app.app_context():
+            pending = db.session.query(Transaction.user_id).filter(
+                Transaction.type == TransactionType.POINT_WITHDRAWAL,
+                Transaction.status == TransactionStatus.PENDING
+            )
+            rows = db.session.query(User.id, User.email, User.points_balance).filter(
+                User.role == UserRole.USER,
+                User.is_suspended == False,
+                ~User.id.in_(pending)
+            ).order_by(func.random()).limit(args.user_pool).all()
+            admin = db.session.query(User.id, User.email).filter(
+                User.role == UserRole.ADMIN
+            ).order_by(User.id).first()
+            if not rows or admin is None:
+                raise SystemExit('No users or no admin in the database; run benchmarks.synth_data first')
+
+            # Minted directly: logging every virtual user in would spend the run in bcrypt
+            users = [(user_id, email, create_access_token(identity=str(user_id))) for user_id, email, _ in rows]
+            withdrawers = [user for user, row in zip(users, rows) if (row.points_balance or 0) >= 50]
+            codes = [code for code, in RewardCode.live().with_entities(RewardCode.code).filter(
+                RewardCode.is_used == False
+            ).order_by(func.random()).limit(args.code_pool)]
+            withdrawals = [transaction_id for transaction_id, in db.session.query(Transaction.id).filter(
+                Transaction.type == TransactionType.POINT_WITHDRAWAL,
+                Transaction.status == TransactionStatus.PENDING
+            ).order_by(Transaction.id).limit(args.code_pool)]
+            reviews = db.session.query(UserTask.user_id, UserTask.task_id).filter(
+                UserTask.status == 'pending_review'
+            ).order_by(UserTask.id).limit(args.code_pool).all()
+            admin = (admin.id, admin.email, create_access_token(identity=str(admin.id)))
+            db.session.remove()
+
+        return cls(users, cls._queue(withdrawers), cls._queue(codes), cls._queue(withdrawals),
+                   cls._queue([tuple(review) for review in reviews]), admin)
+
+    def take(self, queue, count=1):
+        items = []
+        for _ in range(count):
+            try:
+                items.append(queue.get_nowait())
+            except Empty:
+                break
+        return items
+
+
+class Journey:
+    """One scripted visit; each request is recorded under its step name"""
+
+    def __init__(self, client, recorder, fixtures, args, rng):
+        self.client = client
+        self.recorder = recorder
+        self.fixtures = fixtures
+        self.args = args
+        self.rng = rng
+
+    def call(self, step, method, path, token=None, body=None):
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        started = time.perf_counter()
+        status, server_timing, data = self.client.request(method, path, headers, body)
+        elapsed = time.perf_counter() - started
+        match = QUERIES_PATTERN.search(server_timing or '')
+        self.recorder.record(step, elapsed, status, int(match.group(1)) if match else None)
+        return status, data
+
+    def _user(self):
+        return self.rng.choice(self.fixtures.users)
+
+    def login(self):
+        _, email, _ = self._user()
+        self.call('login', 'POST', '/api/auth/login', body={'email': email, 'password': self.args.password})
+
+    def dashboard(self):
+        _, _, token = self._user()
+        self.call('dashboard.bootstrap', 'GET', '/api/dashboard/bootstrap', token)
+        self.call('dashboard.notifications', 'GET', '/api/notifications/', token)
+        self.call('dashboard.transactions', 'GET', '/api/transactions/', token)
+        self.call('dashboard.summary', 'GET', '/api/transactions/summary', token)
+
+    def redeem(self):
+        codes = self.fixtures.take(self.fixtures.codes)
+        if not codes:
+            return self.dashboard()
+        _, _, token = self._user()
+        self.call('redeem.code', 'POST', '/api/codes/redeem', token, {'code': codes[0]})
+        self.call('redeem.balance', 'GET', '/api/points/balance', token)
+
+    def upload_codes(self):
+        codes = self.fixtures.take(self.fixtures.codes, 5)
+        if not codes:
+            return self.dashboard()
+        _, _, token = self._user()
+        self.call('upload_codes', 'POST', '/api/tasks/daily/upload-codes', token, {'codes': codes})
+
+    def withdraw(self):
+        users = self.fixtures.take(self.fixtures.withdrawers)
+        if not users:
+            return self.dashboard()
+        _, _, token = users[0]
+        self.call('withdraw.balance', 'GET', '/api/points/balance', token)
+        self.call('withdraw.request', 'POST', '/api/points/withdraw', token,
+                  {'points': 50, 'method': 'gift_card', 'gift_card_type': 'amazon'})
+
+    def admin_review(self):
+        _, _, token = self.fixtures.admin
+        self.call('admin.withdrawals', 'GET', '/api/admin/withdrawals?status=pending', token)
+        for transaction_id in self.fixtures.take(self.fixtures.withdrawals):
+            self.call('admin.approve_withdrawal', 'POST', f'/api/admin/withdrawals/{transaction_id}/approve', token, {})
+        self.call('admin.task_reviews', 'GET', '/api/tasks/admin/completed-tasks', token)
+        for user_id, task_id in self.fixtures.take(self.fixtures.reviews):
+            self.call('admin.complete_task', 'POST', f'/api/tasks/admin/{task_id}/complete', token, {'user_id': user_id})
+        self.call('admin.activities', 'GET', '/api/admin/activities/recent?limit=50', token)
+
+
+class OpenStreams:
+    """
+    Dashboards left open during the run: each holds the /api/stream
+    EventSource, reconnecting whenever the server ends it, as browsers do.
+    Time to the first event is recorded as stream.connect.
+    """
+
+    def __init__(self, host, port, tokens, recorder, timeout=60):
+        self.host = host
+        self.port = port
+        self.tokens = tokens
+        self.recorder = recorder
+        self.timeout = timeout
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._connections = set()
+        self._threads = []
+
+    def start(self, count):
+        for index in range(count):
+            token = self.tokens[index % len(self.tokens)]
+            thread = threading.Thread(target=self._hold, args=(token,), name=f'stream-{index}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _hold(self, token):
+        while not self._stop.is_set():
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            with self._lock:
+                self._connections.add(connection)
+            started = time.perf_counter()
+            status, waiting = 0, True
+            try:
+                connection.request('GET', '/api/stream', headers={
+                    'Authorization': f'Bearer {token}', 'Accept': 'text/event-stream'})
+                response = connection.getresponse()
+                status = response.status
+                if status == 200:
+                    while not self._stop.is_set():
+                        line = response.readline()
+                        if not line:
+                            break
+                        if waiting and line.startswith(b'event:'):
+                            self.recorder.record('stream.connect', time.perf_counter() - started, status, None)
+                            waiting = False
+            except (OSError, http.client.HTTPException):
+                status = 0
+            finally:
+                with self._lock:
+                    self._connections.discard(connection)
+                connection.close()
+            if waiting and not self._stop.is_set():
+                self.recorder.record('stream.connect', time.perf_counter() - started, status or 0, None)
+                self._stop.wait(1)
+
+    def stop(self):
+        self._stop.set()
+        with self._lock:
+            for connection in self._connections:
+                if connection.sock is not None:
+                    try:
+                        connection.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        for thread in self._threads:
+            thread.join(timeout=5)
+
+
+def run_journeys(client, fixtures, args, mix, count, recorder, seed):
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    plan = random.Random(seed).choices(names, weights=weights, k=count)
+
+    def run(indexed):
+        index, name = indexed
+        journey = Journey(client, recorder, fixtures, args, random.Random(seed * 7919 + index))
+        getattr(journey, name)()
+
+    with ThreadPoolExecutor(args.concurrency) as pool:
+        for _ in pool.map(run, enumerate(plan)):
+            pass
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(args, environment):
+    """gunicorn -c gunicorn.conf.py app:app in a subprocess; returns (process, port) once /healthz answers"""
+    port = args.port or _free_port()
+    environment['GUNICORN_PIDFILE'] = ''
+    command = [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app',
+               '--bind', f'127.0.0.1:{port}', '--log-level', 'warning']
+    # Anything not given here comes from gunicorn.conf.py
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    if args.threads:
+        command += ['--threads', str(args.threads)]
+    if args.worker_class:
+        command += ['--worker-class', args.worker_class]
+    process = subprocess.Popen(command, cwd=REPO_ROOT, env=environment)
+    deadline = time.monotonic() + args.boot_timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            connection.request('GET', '/healthz')
+            if connection.getresponse().status == 200:
+                return process, port
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.terminate()
+    raise SystemExit(f'gunicorn did not answer within {args.boot_timeout}s')
+
+
+def reload_periodically(process, every, stop):
+    """SIGHUP the gunicorn master every so often: workers are replaced while requests are in flight"""
+    reloads = 0
+    while not stop.wait(every):
+        process.send_signal(signal.SIGHUP)
+        reloads += 1
+    return reloads
+
+
+def compare(summary, baseline, max_regression, max_query_increase):
+    """Steps whose p95 or mean statement count regressed past the thresholds"""
+    regressions = []
+    for step, before in baseline.get('steps', {}).items():
+        after = summary.get(step)
+        if after is None:
+            continue
+        if before['p95_ms'] and after['p95_ms'] > before['p95_ms'] * (1 + max_regression):
+            regressions.append(f'{step}: p95 {before["p95_ms"]} ms -> {after["p95_ms"]} ms')
+        if (before.get('queries_mean') is not None and after['queries_mean'] is not None
+                and after['queries_mean'] > before['queries_mean'] + max_query_increase):
+            regressions.append(f'{step}: queries {before["queries_mean"]} -> {after["queries_mean"]}')
+    return regressions
+
+
+def print_table(summary):
+    header = f'{"step":<28} {"reqs":>6} {"err":>4} {"4xx":>5} {"mean":>8} {"p50":>8} {"p95":>8} {"p99":>8} {"queries":>8} {"max":>4}'
+    print(header)
+    print('-' * len(header))
+    for step, stats in summary.items():
+        queries = '-' if stats['queries_mean'] is None else f'{stats["queries_mean"]:.1f}'
+        print(f'{step:<28} {stats["requests"]:>6} {stats["errors"]:>4} {stats["rejected"]:>5} '
+              f'{stats["mean_ms"]:>8.1f} {stats["p50_ms"]:>8.1f} {stats["p95_ms"]:>8.1f} {stats["p99_ms"]:>8.1f} '
+              f'{queries:>8} {stats["queries_max"] if stats["queries_max"] is not None else "-":>4}')
+    print('(latencies in ms; queries are SQL statements per request)')
+
+
+def parse_mix(value):
+    mix = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f'unknown journey {name!r}; choose from {", ".join(DEFAULT_MIX)}')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--target', choices=('app', 'gunicorn'), default='app')
+    parser.add_argument('--journeys', type=int, default=500)
+    parser.add_argument('--warmup', type=int, default=20, help='journeys run before measuring')
+    parser.add_argument('--concurrency', type=int, default=4, help='journeys in flight at once')
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help='journey weights, e.g. dashboard=6,redeem=3 (default: %(default)s)')
+    parser.add_argument('--password', default='loadtest-password', help='as given to synth_data')
+    parser.add_argument('--user-pool', type=int, default=1000)
+    parser.add_argument('--code-pool', type=int, default=20000)
+    parser.add_argument('--snapshot', help='SQLite file copied over the DATABASE_URL file before the run')
+    parser.add_argument('--keep-rate-limits', action='store_true', help='leave RATE_LIMIT_ENABLED as configured')
+    parser.add_argument('--workers', type=int, help='gunicorn workers (default: from gunicorn.conf.py)')
+    parser.add_argument('--threads', type=int, help='gunicorn threads per worker (default: from gunicorn.conf.py)')
+    parser.add_argument('--worker-class', choices=('gthread', 'gevent', 'sync'),
+                        help='gunicorn worker class (default: from gunicorn.conf.py)')
+    parser.add_argument('--streams', type=int, default=0,
+                        help='open dashboards holding /api/stream for the whole run (gunicorn target)')
+    parser.add_argument('--hup-every', type=float, metavar='SECONDS',
+                        help='gracefully reload gunicorn this often during the run')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--boot-timeout', type=float, default=60)
+    parser.add_argument('--json', help='write the summary here')
+    parser.add_argument('--baseline', help='summary JSON of an earlier run to compare against')
+    parser.add_argument('--max-regression', type=float, default=0.25, help='allowed relative p95 increase')
+    parser.add_argument('--max-query-increase', type=float, default=0.5, help='allowed increase in mean queries')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    os.environ.update(APP_ENVIRONMENT)
+    for name, value in OFFLINE_DEFAULTS.items():
+        os.environ.setdefault(name, value)
+    if not args.keep_rate_limits:
+        os.environ['RATE_LIMIT_ENABLED'] = '0'
+    if (args.hup_every or args.streams) and args.target != 'gunicorn':
+        parser.error('--hup-every and --streams need --target gunicorn')
+    if args.target == 'gunicorn' and shutil.which('gunicorn') is None:
+        try:
+            import gunicorn  # noqa: F401
+        except ImportError:
+            parser.error('--target gunicorn needs gunicorn installed')
+
+    from backend.app import create_app
+    app = create_app()
+    if args.snapshot:
+        with app.app_context():
+            from backend.extensions import db
+            database = db.engine.url.database
+            db.engine.dispose()
+        if not database:
+            parser.error('--snapshot needs a file-backed SQLite DATABASE_URL')
+        shutil.copyfile(args.snapshot, database)
+
+    fixtures = Fixtures.load(app, args)
+    process = None
+    if args.target == 'gunicorn':
+        process, port = start_gunicorn(args, dict(os.environ))
+        client = HttpClient('127.0.0.1', port)
+    else:
+        client = AppClient(app)
+
+    recorder = Recorder()
+    reloads, stop_reloading = [], threading.Event()
+    streams = None
+    try:
+        if args.warmup:
+            recorder.enabled = False
+            run_journeys(client, fixtures, args, {'dashboard': 1}, args.warmup, recorder, args.seed + 1)
+            recorder.enabled = True
+        if args.streams:
+            streams = OpenStreams('127.0.0.1', port, [token for _, _, token in fixtures.users], recorder)
+            streams.start(args.streams)
+        if args.hup_every:
+            reloader = threading.Thread(
+                target=lambda: reloads.append(reload_periodically(process, args.hup_every, stop_reloading)),
+                daemon=True)
+            reloader.start()
+        started = time.perf_counter()
+        run_journeys(client, fixtures, args, args.mix, args.journeys, recorder, args.seed)
+        elapsed = time.perf_counter() - started
+    finally:
+        if streams is not None:
+            streams.stop()
+        stop_reloading.set()
+        if args.hup_every:
+            reloader.join()
+        if process is not None:
+            process.terminate()
+            try:
+                # Open event streams keep workers busy until gunicorn's graceful_timeout
+                process.wait(timeout=60)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.wait()
+
+    summary = summarize(recorder)
+    total = sum(stats['requests'] for stats in summary.values())
+    print(f'{args.journeys} journeys, {total} requests in {elapsed:.1f}s '
+          f'({total / elapsed:.1f} req/s, target {args.target}, concurrency {args.concurrency}, '
+          f'{args.streams} open streams)')
+    if args.hup_every:
+        print(f'gunicorn reloaded {reloads[0]} times during the run')
+    print_table(summary)
+
+    result = {
+        'target': args.target,
+        'journeys': args.journeys,
+        'concurrency': args.concurrency,
+        'streams': args.streams,
+        'seconds': round(elapsed, 2),
+        'requests_per_second': round(total / elapsed, 1),
+        'reloads': reloads[0] if reloads else 0,
+        'steps': summary,
+    }
+    if args.json:
+        with open(args.json, 'w') as output:
+            json.dump(result, output, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(summary, json.load(baseline_file), args.max_regression, args.max_query_increase)
+        if regressions:
+            print('\nRegressions against the baseline:')
+            for regression in regressions:
+                print(f'  {regression}')
+            return 1
+        print('\nNo regressions against the baseline.')
+    failed = any(stats['errors'] for stats in summary.values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,567 @@
+"""
+Fill an empty database with synthetic, internally consistent data.
+
+Users (with referral chains, a few partners and one admin), their
+transactions with balanced ledger postings and activity events, reward
+code batches, notifications and task submissions awaiting review. Rows go
+in through Core executemany INSERTs with explicit ids, chunk by chunk, so
+a full-size load takes minutes rather than hours. User balances and
+referral counters are computed in Python to match the transactions;
+reconcile_ledger should find nothing to repair afterwards.
+
+Every user's password is --password; the admin is admin@loadtest.local.
+
+    DATABASE_URL=sqlite:////tmp/load.db python -m benchmarks.synth_data \\
+        --users 1000000 --transactions 20000000 --codes 5000000 --notifications 2000000
+"""
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from functools import lru_cache
+from operator import itemgetter
+
+from sqlalchemy import bindparam, create_engine, event, insert
+
+from backend.app import create_app
+from backend.backfill_referral_tree import backfill
+from backend.extensions import db, bcrypt
+from backend.models.activity_event import ActivityEvent
+from backend.models.batch import Batch
+from backend.models.code_redemption_rollup import CodeRedemptionRollup
+from backend.models.ledger_posting import LedgerPosting
+from backend.models.notification import Notification, NotificationType
+from backend.models.reward_code import RewardCode
+from backend.models.task import Task, UserTask
+from backend.models.transaction import Transaction, TransactionType, TransactionStatus
+from backend.models.user import User, UserRole
+from backend.utils.helpers import decode_reward_code
+from backend.utils.ledger import (
+    POINTS_SCALE, USD_SCALE, TRANSACTION_ACTIVITY, balance_deltas, from_minor, _journal_lines
+)
+
+DEFAULT_PASSWORD = 'loadtest-password'
+ADMIN_EMAIL = 'admin@loadtest.local'
+USD_PER_POINT = 0.30
+REFERRAL_BONUS_POINTS = 1
+WITHDRAWAL_POINTS = (50, 500, 800, 15000)
+CODE_SPACE = 26 ** 5 * 1000
+CODE_STRIDE = 7919  # Prime and coprime with CODE_SPACE, so i -> i * stride is a bijection
+
+# Share of generated transactions by type; withdrawals only happen when the balance allows
+TRANSACTION_MIX = (
+    (TransactionType.CODE_REDEMPTION, 0.60),
+    (TransactionType.EARNING, 0.30),
+    (TransactionType.POINT_WITHDRAWAL, 0.08),
+    (TransactionType.ADMIN_ADJUSTMENT, 0.02),
+)
+NOTIFICATION_TITLES = (
+    ('Code Redeemed', NotificationType.SUCCESS),
+    ('Task Approved', NotificationType.SUCCESS),
+    ('Withdrawal Update', NotificationType.INFO),
+    ('New Referral', NotificationType.INFO),
+    ('Account Notice', NotificationType.WARNING),
+)
+TASK_TITLES = ('Daily Code Upload', 'Watch Video', 'Product Survey', 'App Review', 'Social Share')
+
+
+class RowEncoder:
+    """
+    Row dicts to (sql, parameter tuples) for the driver's executemany.
+
+    Statements are compiled once per table and column set, and values go
+    through the column types' bind processors here; Connection.execute
+    spends most of a bulk load building parameters row by row. Works in
+    worker processes, which never open a connection.
+    """
+
+    def __init__(self, dialect):
+        self.dialect = dialect
+        self._compiled = {}
+
+    def _statement(self, table, columns):
+        key = (table.name, columns)
+        if key not in self._compiled:
+            compiled = insert(table).compile(dialect=self.dialect, column_keys=list(columns))
+            order = list(compiled.positiontup if compiled.positional else columns)
+            processors = []
+            for position, name in enumerate(order):
+                process = table.c[name].type._cached_bind_processor(self.dialect)
+                if process is not None:
+                    # Rows share timestamps and enum values; convert each distinct value once
+                    processors.append((position, lru_cache(maxsize=65536)(process)))
+            self._compiled[key] = (compiled.string, order, itemgetter(*order), processors, compiled.positional)
+        return self._compiled[key]
+
+    def encode(self, table, rows):
+        sql, order, get, processors, positional = self._statement(table, tuple(rows[0]))
+        params = [list(get(row)) for row in rows]
+        for position, process in processors:
+            for values in params:
+                if values[position] is not None:
+                    values[position] = process(values[position])
+        if positional:
+            return sql, [tuple(values) for values in params]
+        return sql, [dict(zip(order, values)) for values in params]
+
+
+class Loader:
+    """Chunked executemany INSERTs on one connection, with per-table row counts"""
+
+    def __init__(self, connection, chunk_size):
+        self.connection = connection
+        self.chunk_size = chunk_size
+        self.encoder = RowEncoder(connection.dialect)
+        self.counts = {}
+
+    def execute(self, table_name, sql, params):
+        for start in range(0, len(params), self.chunk_size):
+            self.connection.exec_driver_sql(sql, params[start:start + self.chunk_size])
+        self.counts[table_name] = self.counts.get(table_name, 0) + len(params)
+
+    def insert(self, model, rows):
+        if rows:
+            self.execute(model.__tablename__, *self.encoder.encode(model.__table__, rows))
+
+    def commit(self):
+        self.connection.commit()
+
+
+def _progress(label, done, total, started):
+    elapsed = time.perf_counter() - started
+    rate = done / elapsed if elapsed else 0
+    print(f'\r  {label}: {done:,}/{total:,} ({rate:,.0f}/s)', end='', file=sys.stderr, flush=True)
+
+
+def _spread(total, parts):
+    """total split into parts near-equal integers"""
+    base, extra = divmod(total, parts)
+    return [base + (1 if index < extra else 0) for index in range(parts)]
+
+
+def _name(user_id):
+    return 'Load Test Admin' if user_id == 1 else f'User {user_id}'
+
+
+def user_email(user_id):
+    return ADMIN_EMAIL if user_id == 1 else f'user{user_id}@loadtest.local'
+
+
+def _payload(**fields):
+    fields = {key: value for key, value in fields.items() if value is not None}
+    return json.dumps(fields, separators=(',', ':')) if fields else None
+
+
+def _activity(type, user_id, user_name, subject_id, created_at, **payload):
+    return {'type': type, 'user_id': user_id, 'user_name': user_name, 'actor_id': None,
+            'subject_id': subject_id, 'payload': _payload(**payload), 'created_at': created_at}
+
+
+class Generator:
+    """
+    Builds the rows. User chunks are independent of each other (own random
+    stream, own block of transaction ids), so worker processes can build
+    them while the parent inserts; everything else is built in the parent.
+    """
+
+    def __init__(self, args, password_hash, loader=None):
+        self.args = args
+        self.password_hash = password_hash
+        self.loader = loader
+        self.rng = random.Random(args.seed)
+        self.now = args.now
+        self.start = self.now - timedelta(days=args.days)
+        self.next_transaction_id = 1
+
+    def _moment_after(self, moment):
+        span = (self.now - moment).total_seconds()
+        return moment + timedelta(seconds=self.rng.random() * span)
+
+    def _user_created_at(self, user_id):
+        # Sign-ups spread evenly over the window, in id order
+        fraction = (user_id - 1) / max(1, self.args.users)
+        return self.start + timedelta(seconds=fraction * self.args.days * 86400)
+
+    def _referrer(self, user_id):
+        if user_id <= 2 or self.rng.random() >= self.args.referral_rate:
+            return None
+        # Skewed towards early users, giving a few large, deep networks
+        return 2 + int((user_id - 2) * self.rng.random() ** 3)
+
+    def _transaction(self, rows, user_id, type, points, amount, status, description, created_at, reference_id=None):
+        transaction_id = self.next_transaction_id
+        self.next_transaction_id += 1
+        points_minor = int(round(points * POINTS_SCALE))
+        amount_minor = int(round(amount * USD_SCALE))
+        rows['transactions'].append({
+            'id': transaction_id, 'user_id': user_id, 'type': type, 'status': status,
+            'description': description, 'amount': from_minor(amount_minor, USD_SCALE),
+            'points_amount': from_minor(points_minor, POINTS_SCALE), 'currency': 'USD',
+            'reference_id': reference_id, 'created_at': created_at, 'updated_at': created_at
+        })
+        lines = _journal_lines(transaction_id, user_id, type, points_minor, amount_minor)
+        if status == TransactionStatus.FAILED:
+            lines += _journal_lines(transaction_id, user_id, type, -points_minor, -amount_minor, is_reversal=True)
+        for line in lines:
+            line['created_at'] = created_at
+        rows['ledger_postings'].extend(lines)
+        rows['activity_events'].append(_activity(
+            TRANSACTION_ACTIVITY[type], user_id, _name(user_id), transaction_id, created_at,
+            points=abs(points), cash_value=abs(amount), task_title=description,
+            code=reference_id if type == TransactionType.CODE_REDEMPTION else None, status=status.value
+        ))
+        if status == TransactionStatus.FAILED:
+            return {}
+        return balance_deltas(type, points_minor, amount_minor)
+
+    def _user_transactions(self, rows, user_id, created_at, count):
+        moments = sorted(self._moment_after(created_at) for _ in range(count))
+        types = self.rng.choices([type for type, _ in TRANSACTION_MIX],
+                                 weights=[weight for _, weight in TRANSACTION_MIX], k=count)
+        balance = {}
+        has_pending = False
+        for type, moment in zip(types, moments):
+            if type == TransactionType.POINT_WITHDRAWAL:
+                affordable = [points for points in WITHDRAWAL_POINTS
+                              if points * POINTS_SCALE <= balance.get('points_balance', 0)]
+                if not affordable or has_pending:
+                    type = TransactionType.CODE_REDEMPTION
+                else:
+                    points = self.rng.choice(affordable)
+                    roll = self.rng.random()
+                    # At most one pending withdrawal per user, as the API enforces
+                    status = (TransactionStatus.PENDING if roll < self.args.pending_rate
+                              else TransactionStatus.FAILED if roll < self.args.pending_rate + 0.1
+                              else TransactionStatus.COMPLETED)
+                    has_pending = status == TransactionStatus.PENDING
+                    deltas = self._transaction(rows, user_id, type, -points, -points * USD_PER_POINT, status,
+                                               f'Withdrawal of {points} points', moment, 'amazon')
+            if type == TransactionType.CODE_REDEMPTION:
+                points = self.rng.choice((1, 1, 2, 3, 5))
+                key = self.rng.randrange(CODE_SPACE)
+                deltas = self._transaction(rows, user_id, type, points, points * USD_PER_POINT,
+                                           TransactionStatus.COMPLETED, f'Redeemed code {decode_reward_code(key)}',
+                                           moment, str(self.rng.randrange(1, max(2, self.args.codes))))
+            elif type == TransactionType.EARNING:
+                points = self.rng.choice((5, 10, 20, 50))
+                deltas = self._transaction(rows, user_id, type, points, points * USD_PER_POINT,
+                                           TransactionStatus.COMPLETED,
+                                           f'Completed task: {self.rng.choice(TASK_TITLES)}', moment)
+            elif type == TransactionType.ADMIN_ADJUSTMENT:
+                points = self.rng.choice((10, 25, 100))
+                deltas = self._transaction(rows, user_id, type, points, points * USD_PER_POINT,
+                                           TransactionStatus.COMPLETED, 'Admin adjustment', moment)
+            for column, delta in deltas.items():
+                balance[column] = balance.get(column, 0) + delta
+        return balance
+
+    def user_chunk(self, spec):
+        """
+        Rows for one chunk of users, their transactions and the referral
+        bonuses their sign-ups paid out.
+
+        Returns (rows by table, referrer deltas); the deltas (referral_count
+        and balance columns in minor units, keyed by referrer id) belong to
+        earlier users and are applied once every chunk is in.
+        """
+        index, first_id, last_id, transactions, first_transaction_id = spec
+        args = self.args
+        self.rng = random.Random(args.seed * 1000003 + index)
+        self.next_transaction_id = first_transaction_id
+        chunk_ids = range(first_id, last_id + 1)
+        rows = {'users': [], 'transactions': [], 'ledger_postings': [], 'activity_events': []}
+        referrer_deltas = {}
+
+        # Spread the chunk's share of --transactions unevenly across its users
+        per_user = dict.fromkeys(chunk_ids, 0)
+        for user_id in self.rng.choices(chunk_ids, k=transactions):
+            per_user[user_id] += 1
+
+        for user_id in chunk_ids:
+            created_at = self._user_created_at(user_id)
+            name = _name(user_id)
+            if user_id == 1:
+                role = UserRole.ADMIN
+            else:
+                role = UserRole.PARTNER if self.rng.random() < args.partner_rate else UserRole.USER
+            referrer = self._referrer(user_id)
+
+            balance = self._user_transactions(rows, user_id, created_at, per_user[user_id])
+            rows['users'].append({
+                'id': user_id, 'full_name': name, 'email': user_email(user_id),
+                'password_hash': self.password_hash, 'role': role, 'referral_code': f'LT{user_id:08d}',
+                'referred_by': referrer, 'referral_count': 0, 'referral_earnings': 0.0,
+                'referral_points_earned': 0.0, 'points_balance': 0.0, 'total_points_earned': 0.0,
+                'total_points_withdrawn': 0.0, 'total_earnings': 0.0, 'total_withdrawn': 0.0,
+                'daily_code_requirement': 5, 'is_approved': role != UserRole.PARTNER or self.rng.random() < 0.8,
+                'is_suspended': False, 'is_verified': False, 'verification_pending': False,
+                'account_type': 'savings', 'ledger_version': 0,
+                'created_at': created_at, 'updated_at': created_at,
+                **{column: from_minor(minor, POINTS_SCALE if 'points' in column else USD_SCALE)
+                   for column, minor in balance.items()}
+            })
+            rows['activity_events'].append(_activity(
+                'user_registration', user_id, name, referrer, created_at,
+                referral_code=f'LT{user_id:08d}', role=role.value
+            ))
+            if referrer is not None:
+                self._referral_bonus(rows, referrer_deltas, referrer, name, created_at)
+
+        # Feed order is by id, so keep a chunk's events chronological
+        rows['activity_events'].sort(key=lambda row: row['created_at'])
+        return rows, referrer_deltas
+
+    def _referral_bonus(self, rows, referrer_deltas, referrer, referred_name, created_at):
+        deltas = self._transaction(rows, referrer, TransactionType.REFERRAL_BONUS, REFERRAL_BONUS_POINTS,
+                                   REFERRAL_BONUS_POINTS * USD_PER_POINT, TransactionStatus.COMPLETED,
+                                   f'Referral bonus for {referred_name}', created_at)
+        totals = referrer_deltas.setdefault(referrer, {'referral_count': 0})
+        totals['referral_count'] += 1
+        for column, delta in deltas.items():
+            totals[column] = totals.get(column, 0) + delta
+
+    def codes(self):
+        args = self.args
+        started = time.perf_counter()
+        batches_table = Batch.__table__
+        offset = self.rng.randrange(CODE_SPACE)
+        rollups = {}
+        code_id = 1
+        for batch_id, count in enumerate(_spread(args.codes, args.batches), start=1):
+            point_value = self.rng.choice((1.0, 1.0, 2.0, 5.0))
+            batch_created = self._moment_after(self.start)
+            self.loader.insert(Batch, [{
+                'id': batch_id, 'name': f'Load test batch {batch_id}', 'description': 'Synthetic codes',
+                'point_value': point_value, 'count': count, 'used_count': 0,
+                'created_at': batch_created, 'updated_at': batch_created
+            }])
+
+            used_count = 0
+            rows = []
+            for _ in range(count):
+                key = (code_id * CODE_STRIDE + offset) % CODE_SPACE
+                used_at = self._moment_after(batch_created) if self.rng.random() < args.used_rate else None
+                rows.append({
+                    'id': code_id, 'code': decode_reward_code(key), 'code_key': key,
+                    'point_value': point_value, 'is_used': used_at is not None,
+                    'used_by': self.rng.randint(2, args.users) if used_at else None,
+                    'used_at': used_at, 'batch_id': batch_id,
+                    'created_at': batch_created, 'updated_at': used_at or batch_created
+                })
+                if used_at is not None:
+                    used_count += 1
+                    rollup = rollups.setdefault((batch_id, used_at.replace(minute=0, second=0)), [0, 0.0])
+                    rollup[0] += 1
+                    rollup[1] += max(1, round(point_value))
+                code_id += 1
+                if len(rows) == args.chunk_size:
+                    self.loader.insert(RewardCode, rows)
+                    self.loader.commit()
+                    rows = []
+                    _progress('codes', code_id - 1, args.codes, started)
+            self.loader.insert(RewardCode, rows)
+            self.loader.connection.execute(
+                batches_table.update().where(batches_table.c.id == batch_id).values(used_count=used_count)
+            )
+            self.loader.commit()
+            _progress('codes', code_id - 1, args.codes, started)
+        print(file=sys.stderr)
+
+        self.loader.insert(CodeRedemptionRollup, [
+            {'batch_id': batch_id, 'bucket': bucket, 'redemptions': redemptions, 'points': points}
+            for (batch_id, bucket), (redemptions, points) in sorted(rollups.items())
+        ])
+        self.loader.commit()
+
+    def notifications(self):
+        args = self.args
+        started = time.perf_counter()
+        for chunk in range(0, args.notifications, args.chunk_size):
+            rows = []
+            for _ in range(min(args.chunk_size, args.notifications - chunk)):
+                user_id = self.rng.randint(1, args.users)
+                title, type = self.rng.choice(NOTIFICATION_TITLES)
+                created_at = self._moment_after(self._user_created_at(user_id))
+                rows.append({'user_id': user_id, 'title': title, 'message': f'{title} (synthetic)',
+                             'type': type, 'is_read': self.rng.random() < 0.6,
+                             'created_at': created_at, 'updated_at': created_at})
+            self.loader.insert(Notification, rows)
+            self.loader.commit()
+            _progress('notifications', chunk + len(rows), args.notifications, started)
+        print(file=sys.stderr)
+
+    def tasks(self):
+        args = self.args
+        self.loader.insert(Task, [{
+            'id': task_id, 'title': title, 'description': f'{title} (synthetic)',
+            'reward_amount': 3.0, 'points_reward': 10.0, 'category': 'Daily', 'time_required': 5,
+            'is_active': True, 'requires_admin_verification': True,
+            'created_at': self.start, 'updated_at': self.start
+        } for task_id, title in enumerate(TASK_TITLES, start=1)])
+
+        rows = []
+        for _ in range(args.submissions):
+            user_id = self.rng.randint(2, args.users)
+            created_at = self._moment_after(self._user_created_at(user_id))
+            rows.append({'user_id': user_id, 'task_id': self.rng.randint(1, len(TASK_TITLES)),
+                         'status': 'pending_review', 'proof_text': 'Synthetic proof',
+                         'created_at': created_at, 'updated_at': created_at})
+        self.loader.insert(UserTask, rows)
+        self.loader.commit()
+
+
+_worker = {}
+
+
+def _init_worker(args, password_hash, database_url):
+    # Millions of short-lived, acyclic row dicts: the cycle collector only costs time here
+    gc.disable()
+    _worker['generator'] = Generator(args, password_hash)
+    _worker['encoder'] = RowEncoder(create_engine(database_url).dialect)
+
+
+def _build_user_chunk(spec):
+    """Worker side: generate a chunk and hand back ready-to-run statements"""
+    rows, referrer_deltas = _worker['generator'].user_chunk(spec)
+    encoder = _worker['encoder']
+    statements = [(model.__tablename__, *encoder.encode(model.__table__, rows[model.__tablename__]))
+                  for model in (User, Transaction, LedgerPosting, ActivityEvent)
+                  if rows[model.__tablename__]]
+    return spec[2], statements, referrer_deltas
+
+
+def user_chunk_specs(args):
+    """(index, first id, last id, transactions, first transaction id) per chunk of users"""
+    specs = []
+    emitted = 0
+    first_transaction_id = 1
+    for index, first_id in enumerate(range(1, args.users + 1, args.chunk_size)):
+        last_id = min(args.users, first_id + args.chunk_size - 1)
+        # Exactly --transactions overall, in proportion to the chunk's users
+        transactions = round(args.transactions * last_id / args.users) - emitted
+        emitted += transactions
+        specs.append((index, first_id, last_id, transactions, first_transaction_id))
+        # Room for every user's transactions plus one referral bonus each; ids may skip
+        first_transaction_id += transactions + (last_id - first_id + 1)
+    return specs
+
+
+def load_users(loader, args, password_hash, database_url):
+    """Insert every user chunk, generated by --workers processes, then the referrer totals"""
+    specs = user_chunk_specs(args)
+    referrer_deltas = {}
+    started = time.perf_counter()
+
+    def insert_chunks(results):
+        for last_id, statements, chunk_deltas in results:
+            for table_name, sql, params in statements:
+                loader.execute(table_name, sql, params)
+            loader.commit()
+            for referrer, totals in chunk_deltas.items():
+                merged = referrer_deltas.setdefault(referrer, {})
+                for column, delta in totals.items():
+                    merged[column] = merged.get(column, 0) + delta
+            _progress('users', last_id, args.users, started)
+
+    if args.workers > 1:
+        with multiprocessing.Pool(args.workers, _init_worker, (args, password_hash, database_url)) as pool:
+            insert_chunks(pool.imap(_build_user_chunk, specs))
+    else:
+        _init_worker(args, password_hash, database_url)
+        insert_chunks(map(_build_user_chunk, specs))
+    print(file=sys.stderr)
+
+    # Referral bonuses credit earlier users; their rows get one UPDATE each
+    users_table = User.__table__
+    columns = sorted({column for totals in referrer_deltas.values() for column in totals})
+    if not columns:
+        return
+    stmt = users_table.update().where(users_table.c.id == bindparam('user_id')).values(**{
+        column: users_table.c[column] + bindparam(f'd_{column}') for column in columns
+    })
+    params = []
+    for user_id, totals in referrer_deltas.items():
+        row = {'user_id': user_id}
+        for column in columns:
+            delta = totals.get(column, 0)
+            if column != 'referral_count':
+                delta = from_minor(delta, POINTS_SCALE if 'points' in column else USD_SCALE)
+            row[f'd_{column}'] = delta
+        params.append(row)
+    for start in range(0, len(params), args.chunk_size):
+        loader.connection.execute(stmt, params[start:start + args.chunk_size])
+    loader.commit()
+
+
+def _fast_sqlite(dbapi_connection, connection_record):
+    # Durability doesn't matter for a throwaway load; the WAL keeps readers unblocked
+    cursor = dbapi_connection.cursor()
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=OFF')
+    cursor.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--transactions', type=int, default=200000, help='plus one referral bonus per referral')
+    parser.add_argument('--codes', type=int, default=50000)
+    parser.add_argument('--batches', type=int, default=10)
+    parser.add_argument('--notifications', type=int, default=20000)
+    parser.add_argument('--submissions', type=int, default=1000, help='task submissions awaiting review')
+    parser.add_argument('--referral-rate', type=float, default=0.6, help='share of users who signed up with a code')
+    parser.add_argument('--partner-rate', type=float, default=0.01)
+    parser.add_argument('--used-rate', type=float, default=0.3, help='share of codes already redeemed')
+    parser.add_argument('--pending-rate', type=float, default=0.05, help='share of withdrawals left pending')
+    parser.add_argument('--days', type=int, default=365, help='history length')
+    parser.add_argument('--password', default=DEFAULT_PASSWORD)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    parser.add_argument('--workers', type=int, default=max(1, min(4, (os.cpu_count() or 1) - 1)),
+                        help='processes generating user chunks while this one inserts')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+    if args.users < 2 or args.batches < 1:
+        parser.error('need at least 2 users and 1 batch')
+    args.now = datetime.utcnow().replace(microsecond=0)
+    gc.disable()
+
+    app = create_app()
+    with app.app_context():
+        if db.engine.dialect.name == 'sqlite':
+            event.listen(db.engine, 'connect', _fast_sqlite)
+            db.engine.dispose()
+        db.create_all()
+        if db.session.query(User.id).first() is not None:
+            print(f'{db.engine.url} already has users; point DATABASE_URL at an empty database', file=sys.stderr)
+            return 1
+        db.session.remove()
+
+        started = time.perf_counter()
+        password_hash = bcrypt.generate_password_hash(args.password).decode('utf-8')
+        with db.engine.connect() as connection:
+            loader = Loader(connection, args.chunk_size)
+            load_users(loader, args, password_hash, db.engine.url.render_as_string(hide_password=False))
+            generator = Generator(args, password_hash, loader)
+            generator.codes()
+            generator.notifications()
+            generator.tasks()
+
+        print('  referral closure...', file=sys.stderr)
+        closure = backfill(args.chunk_size)
+        loader.counts['referral_closure'] = closure['rows']
+
+        print(json.dumps({
+            'database': str(db.engine.url),
+            'seconds': round(time.perf_counter() - started, 1),
+            'rows': loader.counts
+        }, indent=2))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
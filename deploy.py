@@ -124,6 +124,10 @@ def deploy():
         run_command(client, f"{venv_path}/bin/pip install --upgrade pip")
         run_command(client, f"{venv_path}/bin/pip install -r {REMOTE_DIR}/requirements.txt")
         
+        # Tables, new columns on existing tables, then the admin account (the app no longer does this on import)
+        run_command(client, f"cd {REMOTE_DIR} && {venv_path}/bin/python migrate_db.py")
+        run_command(client, f"cd {REMOTE_DIR} && {venv_path}/bin/flask --app app init-db --seed")
+        
         # 4. Stop existing process on port 8000
         print(f"\n--- STOPPING PORT {APP_PORT} ---")
         # Find PID using port 8000 and kill it
@@ -132,8 +136,8 @@ def deploy():
         # 5. Start Application
         print(f"\n--- STARTING APPLICATION ON PORT {APP_PORT} ---")
         # We use nohup to keep it running after we disconnect
-        # Binding to 0.0.0.0:8000
-        start_cmd = f"cd {REMOTE_DIR} && nohup {venv_path}/bin/gunicorn --bind 0.0.0.0:{APP_PORT} app:app > app.log 2>&1 &"
+        # Binding to 0.0.0.0:8000; workers, keep-alive and timeouts come from gunicorn.conf.py
+        start_cmd = f"cd {REMOTE_DIR} && nohup {venv_path}/bin/gunicorn -c gunicorn.conf.py --bind 0.0.0.0:{APP_PORT} app:app > app.log 2>&1 &"
         run_command(client, start_cmd)
         
         # 6. Verify
@@ -0,0 +1,117 @@
+"""
+gunicorn settings for MyFigPoint
+
+    gunicorn -c gunicorn.conf.py app:app
+
+Every setting can be overridden with the environment variable named next
+to it (or with gunicorn's own command-line flags, which win over this
+file).
+
+Requests spend most of their time waiting: on SMTP when mail is sent from
+the request, on SQLite's write lock, on the event stream's long polls. So
+concurrency comes from threads (gthread, the default) or greenlets
+(gevent, needs 'pip install gevent'), with one worker process per CPU plus
+one to keep the CPUs busy while others wait.
+
+Every open dashboard holds an /api/stream EventSource, and under gthread
+each stream occupies a worker thread for up to SSE_MAX_STREAM_SECONDS.
+Threads are therefore sized from SSE_EXPECTED_STREAMS, the number of
+dashboards expected open at once across all workers, plus a margin for
+ordinary requests. When streams run out of threads every other request
+queues behind them, so set it above the real peak. The usual alternative
+for thousands of streams is gevent, whose greenlets cost next to nothing.
+Check a setting with: python -m benchmarks.load_test --target gunicorn
+--streams N.
+
+Zero-downtime reload:
+
+    kill -HUP $(cat gunicorn.pid)    # new config, fresh workers; old ones finish their requests
+
+    kill -USR2 $(cat gunicorn.pid)   # new code: a second master starts on the same socket and
+                                     # writes gunicorn.pid.2; once it answers,
+    kill -TERM $(cat gunicorn.pid)   # stop the old master gracefully (the new one takes over gunicorn.pid)
+
+With preload_app the master holds the imported app, so code changes need
+the USR2 step; HUP only replaces workers. USR2 re-runs the original
+command line, so start the master with the gunicorn script rather than
+'python -m gunicorn' (which would put gunicorn's own 'http' package ahead
+of the standard library's).
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get('GUNICORN_BIND', f"0.0.0.0:{os.environ.get('PORT', 8000)}")
+pidfile = os.environ.get('GUNICORN_PIDFILE', 'gunicorn.pid') or None
+
+# Workers: 'gthread' or 'gevent'
+worker_class = os.environ.get('GUNICORN_WORKER_CLASS', 'gthread')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() + 1))
+# gthread: one thread per open event stream this worker may hold, plus room for other requests
+expected_streams = int(os.environ.get('SSE_EXPECTED_STREAMS', 200))
+threads = int(os.environ.get('GUNICORN_THREADS', -(-expected_streams // workers) + 16))
+# Open connections per worker, idle keep-alive ones included (gthread and gevent)
+worker_connections = int(os.environ.get('GUNICORN_WORKER_CONNECTIONS', max(1000, threads * 2)))
+
+# Behind nginx: keep idle upstream connections open longer than nginx does (its
+# keepalive_timeout defaults to 60s), so gunicorn never closes one nginx is about to reuse
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 75))
+forwarded_allow_ips = os.environ.get('FORWARDED_ALLOW_IPS', '127.0.0.1')
+
+# A worker that stops heartbeating this long is killed; stopping workers get
+# graceful_timeout to finish (event streams are cut then and reconnect)
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then, staggered so they don't all restart at once
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', max_requests // 10))
+
+# Import the app once in the master and fork workers from it. Off by default
+# for gevent, whose monkey-patching has to happen before the app is imported
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1' if worker_class != 'gevent' else '0') == '1'
+
+# Heartbeat files in memory rather than on a disk that may stall
+if os.path.isdir('/dev/shm'):
+    worker_tmp_dir = '/dev/shm'
+
+loglevel = os.environ.get('LOG_LEVEL', 'info').lower()
+accesslog = os.environ.get('GUNICORN_ACCESS_LOG')  # e.g. '-' for stdout
+
+# In-process pub/sub and rate limit buckets would be per worker; share them through SQLite instead,
+# and have /metrics sum every worker's figures rather than report whichever worker was scraped
+metrics_dir = os.environ.get('METRICS_MULTIPROC_DIR') or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'instance', 'metrics')
+if workers > 1:
+    raw_env = [f'{name}=sqlite' for name in ('PUBSUB_BACKEND', 'RATE_LIMIT_BACKEND') if name not in os.environ]
+    raw_env.append(f'METRICS_MULTIPROC_DIR={metrics_dir}')
+
+
+def on_starting(server):
+    # Snapshots from the previous run would be added to this one's
+    if os.environ.get('METRICS_MULTIPROC_DIR'):
+        from backend.utils.instrumentation import clear_metrics_directory
+        clear_metrics_directory(os.environ['METRICS_MULTIPROC_DIR'])
+
+
+def worker_exit(server, worker):
+    # Requests since the worker's last snapshot
+    directory = worker.app.wsgi().extensions.get('metrics_directory')
+    if directory is not None:
+        directory.write()
+
+
+def child_exit(server, worker):
+    if os.environ.get('METRICS_MULTIPROC_DIR'):
+        from backend.utils.instrumentation import retire_worker
+        retire_worker(os.environ['METRICS_MULTIPROC_DIR'], worker.pid)
+
+
+def post_fork(server, worker):
+    # The preloaded app's pooled connections belong to the master
+    if server.cfg.preload_app:
+        from backend.app import dispose_engines
+        dispose_engines(worker.app.wsgi())
+
+
+def pre_exec(server):
+    server.log.info('Re-executing master for a code reload')
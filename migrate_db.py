@@ -1,6 +1,38 @@
+import re
 import sqlite3
 import os
 
+def rebuild_with_autoincrement(conn, table_name):
+    """Recreate an SQLite table with an AUTOINCREMENT id, keeping its columns, rows and indexes"""
+    staging = f'{table_name}_rebuild'
+    cursor = conn.cursor()
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table_name,))
+    create = cursor.fetchone()[0]
+    create, renamed = re.subn(rf'^CREATE TABLE\s+"?{table_name}"?', f'CREATE TABLE {staging}', create, count=1)
+    create, promoted = re.subn(r'\bid INTEGER NOT NULL,', 'id INTEGER NOT NULL PRIMARY KEY AUTOINCREMENT,', create, count=1)
+    create, dropped = re.subn(r',\s*PRIMARY KEY \(id\)', '', create, count=1)
+    if not (renamed and promoted and dropped):
+        raise ValueError(f'Unexpected {table_name} schema; not rebuilding')
+    cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'index' AND tbl_name = ? AND sql IS NOT NULL", (table_name,))
+    indexes = [row[0] for row in cursor.fetchall()]
+    
+    conn.commit()
+    cursor.execute("BEGIN")
+    try:
+        cursor.execute(f"DROP TABLE IF EXISTS {staging}")
+        cursor.execute(create)
+        # Copying the ids also sets the AUTOINCREMENT counter past the largest one
+        cursor.execute(f"INSERT INTO {staging} SELECT * FROM {table_name}")
+        cursor.execute(f"DROP TABLE {table_name}")
+        cursor.execute(f"ALTER TABLE {staging} RENAME TO {table_name}")
+        for index in indexes:
+            cursor.execute(index)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
 def migrate():
     # Get the database path from environment variable or use default
     from backend.extensions import db
@@ -11,6 +43,12 @@ def migrate():
     import backend.models.support_message
     import backend.models.notification
     import backend.models.reward_code
+    import backend.models.ledger_posting
+    import backend.models.idempotency_key
+    import backend.models.code_redemption_rollup
+    import backend.models.referral_closure
+    import backend.models.activity_event
+    from backend.backfill_referral_tree import backfill as backfill_referral_tree
     
     app = create_app()
     
@@ -19,9 +57,21 @@ def migrate():
         db.create_all()
         print('Database tables created/updated successfully!')
         
+        # Referral closure table, rebuilt from users.referred_by while any user is missing from it
+        from backend.models.referral_closure import ReferralClosure
+        from backend.models.user import User
+        missing = db.session.query(User.id).outerjoin(ReferralClosure, db.and_(
+            ReferralClosure.ancestor_id == User.id, ReferralClosure.descendant_id == User.id
+        )).filter(ReferralClosure.ancestor_id.is_(None)).count()
+        if missing:
+            print(f"{missing} users missing from the referral closure; rebuilding: {backfill_referral_tree()}")
+        
         # For additional custom migrations, connect directly to the SQLite database
-        project_root = os.path.dirname(os.path.abspath(__file__))
-        db_path = os.path.join(project_root, 'instance', 'myfigpoint.db')
+        # the app uses (DATABASE_URL, or instance/myfigpoint.db by default)
+        db_path = db.engine.url.database
+        if db.engine.dialect.name != 'sqlite' or not db_path:
+            print(f'Column migrations only apply to SQLite; skipping them for {db.engine.url.render_as_string()}')
+            return
         
         # Ensure instance directory exists
         instance_dir = os.path.dirname(db_path)
@@ -64,7 +114,11 @@ def migrate():
                 'routing_number': 'VARCHAR(50)',
                 'swift_code': 'VARCHAR(50)',
                 'account_type': 'VARCHAR(50)',
-                'bank_address': 'VARCHAR(255)'
+                'bank_address': 'VARCHAR(255)',
+                'ledger_version': 'INTEGER NOT NULL DEFAULT 0',
+                'referral_count': 'INTEGER NOT NULL DEFAULT 0',
+                'referral_earnings': 'FLOAT NOT NULL DEFAULT 0',
+                'referral_points_earned': 'FLOAT NOT NULL DEFAULT 0'
             }
             
             for col, col_type in user_cols.items():
@@ -77,6 +131,30 @@ def migrate():
         except Exception as e:
             print(f"Error updating users table: {e}")
 
+        # Referral counters and the indexes behind the referral leaderboard
+        try:
+            cursor.execute("""
+                UPDATE users SET referral_count = (SELECT COUNT(*) FROM users r WHERE r.referred_by = users.id)
+                WHERE referral_count != (SELECT COUNT(*) FROM users r WHERE r.referred_by = users.id)
+            """)
+            if cursor.rowcount > 0:
+                print(f"Recounted referrals for {cursor.rowcount} users")
+            cursor.execute("""
+                UPDATE users SET
+                    referral_earnings = (SELECT ROUND(COALESCE(SUM(t.amount), 0), 2) FROM transactions t
+                                         WHERE t.user_id = users.id AND t.type = 'REFERRAL_BONUS' AND t.status = 'COMPLETED'),
+                    referral_points_earned = (SELECT ROUND(COALESCE(SUM(t.points_amount), 0), 2) FROM transactions t
+                                              WHERE t.user_id = users.id AND t.type = 'REFERRAL_BONUS' AND t.status = 'COMPLETED')
+                WHERE id IN (SELECT user_id FROM transactions WHERE type = 'REFERRAL_BONUS')
+            """)
+            if cursor.rowcount > 0:
+                print(f"Recomputed referral earnings for {cursor.rowcount} users")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_users_referral_count ON users (referral_count)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_users_referred_by ON users (referred_by)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_users_created_at ON users (created_at)")
+        except Exception as e:
+            print(f"Error updating referral counters: {e}")
+
         # Specific columns for tasks table
         try:
             cursor.execute("PRAGMA table_info(tasks)")
@@ -97,9 +175,159 @@ def migrate():
             if 'proof_image' not in columns:
                 print("Adding proof_image to user_tasks table...")
                 cursor.execute("ALTER TABLE user_tasks ADD COLUMN proof_image VARCHAR(255)")
+            if 'proof_image_thumb' not in columns:
+                print("Adding proof_image_thumb to user_tasks table...")
+                cursor.execute("ALTER TABLE user_tasks ADD COLUMN proof_image_thumb VARCHAR(255)")
+            if 'proof_image_status' not in columns:
+                print("Adding proof_image_status to user_tasks table...")
+                cursor.execute("ALTER TABLE user_tasks ADD COLUMN proof_image_status VARCHAR(20)")
         except Exception as e:
             print(f"Error updating user_tasks table: {e}")
 
+        # Batch code counters, recomputed from the codes once
+        try:
+            cursor.execute("PRAGMA table_info(batches)")
+            columns = [col[1] for col in cursor.fetchall()]
+            if 'deleted_at' not in columns:
+                print("Adding deleted_at to batches table...")
+                cursor.execute("ALTER TABLE batches ADD COLUMN deleted_at DATETIME")
+            if 'used_count' not in columns:
+                print("Adding used_count to batches table...")
+                cursor.execute("ALTER TABLE batches ADD COLUMN used_count INTEGER NOT NULL DEFAULT 0")
+                cursor.execute("""
+                    UPDATE batches SET
+                        count = (SELECT COUNT(*) FROM reward_codes r WHERE r.batch_id = batches.id),
+                        used_count = (SELECT COUNT(*) FROM reward_codes r WHERE r.batch_id = batches.id AND r.is_used = 1)
+                """)
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_reward_codes_batch_id ON reward_codes (batch_id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_user_tasks_task_id ON user_tasks (task_id)")
+        except Exception as e:
+            print(f"Error updating batches table: {e}")
+
+        # Hourly redemption rollups for codes redeemed before the rollup existed
+        try:
+            cursor.execute("SELECT COUNT(*) FROM code_redemption_rollups")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("""
+                    INSERT INTO code_redemption_rollups (batch_id, bucket, redemptions, points)
+                    SELECT batch_id, strftime('%Y-%m-%d %H:00:00.000000', used_at), COUNT(*), SUM(MAX(1, ROUND(point_value)))
+                    FROM reward_codes
+                    WHERE is_used = 1 AND used_at IS NOT NULL AND batch_id IS NOT NULL
+                    GROUP BY batch_id, strftime('%Y-%m-%d %H:00:00.000000', used_at)
+                """)
+                if cursor.rowcount > 0:
+                    print(f"Backfilled {cursor.rowcount} code redemption rollup rows")
+        except Exception as e:
+            print(f"Error backfilling code redemption rollups: {e}")
+
+        # Packed integer reward code keys (see helpers.encode_reward_code)
+        try:
+            cursor.execute("PRAGMA table_info(reward_codes)")
+            columns = [col[1] for col in cursor.fetchall()]
+            if 'code_key' not in columns:
+                print("Adding code_key to reward_codes table...")
+                cursor.execute("ALTER TABLE reward_codes ADD COLUMN code_key BIGINT")
+            letters = '(unicode(substr(upper(code), {}, 1)) - 65)'
+            key_expr = letters.format(1)
+            for position in range(2, 6):
+                key_expr = f"({key_expr} * 26 + {letters.format(position)})"
+            cursor.execute(f"""
+                UPDATE reward_codes SET code_key = {key_expr} * 1000 + CAST(substr(code, 6, 3) AS INTEGER)
+                WHERE code_key IS NULL AND upper(code) GLOB '[A-Z][A-Z][A-Z][A-Z][A-Z][0-9][0-9][0-9]'
+            """)
+            if cursor.rowcount > 0:
+                print(f"Backfilled code_key for {cursor.rowcount} reward codes")
+            cursor.execute("CREATE UNIQUE INDEX IF NOT EXISTS ix_reward_codes_code_key ON reward_codes (code_key)")
+        except Exception as e:
+            print(f"Error updating reward_codes table: {e}")
+
+        # reward_codes ids must never be reused (see RewardCode.__table_args__)
+        try:
+            cursor.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'reward_codes'")
+            row = cursor.fetchone()
+            if row and 'AUTOINCREMENT' not in row[0].upper():
+                print("Rebuilding reward_codes with AUTOINCREMENT ids...")
+                rebuild_with_autoincrement(conn, 'reward_codes')
+        except Exception as e:
+            print(f"Error rebuilding reward_codes table: {e}")
+
+        # Index used by per-user transaction aggregates (summaries, reconciliation)
+        try:
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_transactions_user_id ON transactions (user_id)")
+        except Exception as e:
+            print(f"Error creating transactions index: {e}")
+
+        # Backfill ledger postings for transactions recorded before the ledger existed
+        try:
+            cursor.execute("DROP TABLE IF EXISTS temp_unposted")
+            cursor.execute("""
+                CREATE TEMP TABLE temp_unposted AS
+                SELECT id FROM transactions t
+                WHERE NOT EXISTS (SELECT 1 FROM ledger_postings p WHERE p.transaction_id = t.id)
+            """)
+            cursor.execute("SELECT COUNT(*) FROM temp_unposted")
+            unposted = cursor.fetchone()[0]
+            if unposted:
+                print(f"Backfilling ledger postings for {unposted} transactions...")
+                # (account, commodity, amount column, sign, reversals only)
+                lines = [
+                    ("'user:points'", 'PTS', 'points_amount', 1, False),
+                    ("'platform:' || lower(t.type)", 'PTS', 'points_amount', -1, False),
+                    ("'user:earnings'", 'USD', 'amount', 1, False),
+                    ("'platform:' || lower(t.type)", 'USD', 'amount', -1, False),
+                    # Rejected withdrawals were refunded
+                    ("'user:points'", 'PTS', 'points_amount', -1, True),
+                    ("'platform:' || lower(t.type)", 'PTS', 'points_amount', 1, True),
+                    ("'user:earnings'", 'USD', 'amount', -1, True),
+                    ("'platform:' || lower(t.type)", 'USD', 'amount', 1, True),
+                ]
+                for account, commodity, column, sign, reversal in lines:
+                    user_expr = 't.user_id' if account.startswith("'user:") else 'NULL'
+                    reversal_filter = "AND t.type = 'POINT_WITHDRAWAL' AND t.status = 'FAILED'" if reversal else ''
+                    cursor.execute(f"""
+                        INSERT INTO ledger_postings (transaction_id, user_id, account, commodity, amount_minor, is_reversal, created_at)
+                        SELECT t.id, {user_expr}, {account}, '{commodity}',
+                               {sign} * CAST(ROUND(COALESCE(t.{column}, 0) * 100) AS INTEGER), {1 if reversal else 0}, t.created_at
+                        FROM transactions t JOIN temp_unposted u ON u.id = t.id
+                        WHERE ROUND(COALESCE(t.{column}, 0) * 100) != 0 {reversal_filter}
+                    """)
+            cursor.execute("DROP TABLE IF EXISTS temp_unposted")
+        except Exception as e:
+            print(f"Error backfilling ledger postings: {e}")
+
+        # Seed the activity feed from registrations and transactions, oldest first,
+        # so event ids follow time like the ones written from now on
+        try:
+            cursor.execute("SELECT COUNT(*) FROM activity_events")
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("""
+                    INSERT INTO activity_events (type, user_id, user_name, subject_id, payload, created_at)
+                    SELECT type, user_id, user_name, subject_id, payload, created_at FROM (
+                        SELECT 'user_registration' AS type, u.id AS user_id, u.full_name AS user_name,
+                               u.referred_by AS subject_id,
+                               json_object('referral_code', u.referral_code, 'role', lower(u.role)) AS payload,
+                               COALESCE(u.created_at, CURRENT_TIMESTAMP) AS created_at
+                        FROM users u
+                        UNION ALL
+                        SELECT CASE t.type
+                                   WHEN 'EARNING' THEN 'task_completion'
+                                   WHEN 'CODE_REDEMPTION' THEN 'code_redemption'
+                                   WHEN 'POINT_WITHDRAWAL' THEN 'withdrawal_request'
+                                   WHEN 'REFERRAL_BONUS' THEN 'referral_bonus'
+                                   WHEN 'ADMIN_ADJUSTMENT' THEN 'admin_adjustment'
+                                   ELSE 'deposit' END,
+                               t.user_id, u.full_name, t.id,
+                               json_object('points', abs(COALESCE(t.points_amount, 0)), 'cash_value', abs(COALESCE(t.amount, 0)),
+                                           'task_title', t.description, 'status', lower(t.status),
+                                           'code', CASE WHEN t.type = 'CODE_REDEMPTION' THEN t.reference_id END),
+                               COALESCE(t.created_at, CURRENT_TIMESTAMP)
+                        FROM transactions t LEFT JOIN users u ON u.id = t.user_id
+                    ) ORDER BY created_at
+                """)
+                print(f"Seeded activity feed with {cursor.rowcount} events")
+        except Exception as e:
+            print(f"Error seeding activity feed: {e}")
+
         conn.commit()
         conn.close()
         print("Migration complete!")